@@ -20,9 +20,25 @@ def create_app():
     # Proxy fix for deployment
     app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
     
-    # Initialize database
-    from models.database import init_db
-    init_db(app.config['DATABASE_URL'])
+    # Fingerprinted, precompressed static bundles (when scripts/build_assets.py was run)
+    from utils.assets import init_assets
+    init_assets(app)
+    
+    # Request latency and SQL per endpoint, exposed at /metrics (routes/health.py)
+    if app.config['METRICS_ENABLED']:
+        from utils.metrics import init_metrics
+        init_metrics(app)
+    
+    # Initialize database (reads served from a local copy when DATABASE_REPLICA_PATH is set)
+    from models.database import init_db, get_replica
+    init_db(app.config['DATABASE_URL'], replica_path=app.config['DATABASE_REPLICA_PATH'])
+    if get_replica():
+        from utils.replica import init_replica
+        init_replica(app)
+    
+    # Move cold audit rows to monthly partitions in the background
+    from services.audit_archiver import start_audit_archiver
+    start_audit_archiver(app.config['DATABASE_URL'], app.config['AUDIT_ARCHIVE_INTERVAL'])
     
     # Register blueprints
     from routes.auth import auth_bp
@@ -34,6 +50,8 @@ def create_app():
     from routes.admin import admin_bp
     from routes.profile import profile_bp
     from routes.assistant import assistant_bp
+    from routes.health import health_bp
+    from routes.jobs import jobs_bp
     
     app.register_blueprint(auth_bp)
     app.register_blueprint(dashboard_bp)
@@ -44,16 +62,20 @@ def create_app():
     app.register_blueprint(admin_bp, url_prefix='/admin')
     app.register_blueprint(profile_bp, url_prefix='/perfil')
     app.register_blueprint(assistant_bp, url_prefix='/assistente')
+    app.register_blueprint(health_bp)
+    app.register_blueprint(jobs_bp, url_prefix='/tarefas')
     
     # Context processors
     @app.context_processor
     def inject_globals():
         from utils.helpers import format_date, calculate_age, format_datetime
+        from services.profile_photos import photo_sources
         return {
             'creator_name': 'João Layon',
             'format_date': format_date,
             'calculate_age': calculate_age,
-            'format_datetime': format_datetime
+            'format_datetime': format_datetime,
+            'profile_photo': photo_sources
         }
     
     return app
@@ -62,4 +84,8 @@ def create_app():
 app = create_app()
 
 if __name__ == '__main__':
+    # With the reloader only the child process (WERKZEUG_RUN_MAIN) serves requests
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        from services.jobs import start_job_runner
+        start_job_runner(app.config['DATABASE_URL'])
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -11,16 +11,122 @@ class Config:
     
     # Database configuration - SQLiteCloud support
     DATABASE_URL = os.environ.get('DATABASE_URL', 'sqlitecloud://cmq6frwshz.g4.sqlite.cloud:8860/app.db?apikey=Dor8OwUECYmrbcS5vWfsdGpjCpdm9ecSDJtywgvRw8k')
-    
+
+    # Local read replica (models/replica.py). With DATABASE_REPLICA_PATH set, reads
+    # of patients, evaluations, procedures, users and lookup tables come from a
+    # local SQLite copy that is never more than DATABASE_REPLICA_MAX_STALENESS
+    # seconds behind DATABASE_URL, and always includes the session's own writes.
+    # A background thread pulls changes every DATABASE_REPLICA_SYNC_INTERVAL
+    # seconds. Writes always go to DATABASE_URL.
+    DATABASE_REPLICA_PATH = os.environ.get('DATABASE_REPLICA_PATH', '')
+    DATABASE_REPLICA_MAX_STALENESS = float(os.environ.get('DATABASE_REPLICA_MAX_STALENESS', 2))
+    DATABASE_REPLICA_SYNC_INTERVAL = float(os.environ.get('DATABASE_REPLICA_SYNC_INTERVAL', 1))
+    # Testing only: round trip added to every statement sent to DATABASE_URL,
+    # so a local file behaves like a remote server
+    DATABASE_SIMULATED_LATENCY_MS = float(os.environ.get('DATABASE_SIMULATED_LATENCY_MS', 0))
+    # BEGIN IMMEDIATE that fails with "database is locked" (another writer held
+    # the lock past the busy timeout) is retried up to DATABASE_LOCK_RETRIES
+    # times, waiting DATABASE_LOCK_RETRY_PAUSE seconds, doubled each time
+    DATABASE_LOCK_RETRIES = int(os.environ.get('DATABASE_LOCK_RETRIES', 3))
+    DATABASE_LOCK_RETRY_PAUSE = float(os.environ.get('DATABASE_LOCK_RETRY_PAUSE', 0.1))
+
     # Security
     SECRET_KEY = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
     WTF_CSRF_ENABLED = True
     
+    # Password hashing policy. scrypt N=2**14, r=8, p=1 (the same cost Django uses)
+    # is ~2x cheaper than werkzeug's N=2**15 default; stored hashes made with any
+    # other method are upgraded on the next successful login. At most
+    # PASSWORD_HASH_CONCURRENCY hashes run at once per process (memory bound).
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:16384:8:1')
+    PASSWORD_HASH_CONCURRENCY = int(os.environ.get('PASSWORD_HASH_CONCURRENCY', 4))
+    
     # Application settings
     DEBUG = os.environ.get('DEBUG', 'True').lower() == 'true'
     
-    # Rate limiting
-    RATELIMIT_STORAGE_URL = 'memory://'
+    # Rate limiting (sqlite:/// is shared by all workers on the host; memory:// is per process)
+    RATELIMIT_STORAGE_URL = os.environ.get('RATELIMIT_STORAGE_URL', 'sqlite:///instance/rate_limit.db')
+    RATELIMIT_LOGIN_IP = (5, 60)          # failed attempts per seconds, per client IP
+    RATELIMIT_LOGIN_ACCOUNT = (10, 900)   # failed attempts per seconds, per email
+    
+    # AI assistant response cache (local SQLite, shared between workers)
+    ASSISTANT_CACHE_PATH = os.environ.get('ASSISTANT_CACHE_PATH', 'instance/assistant_cache.db')
+    ASSISTANT_CACHE_TTL = int(os.environ.get('ASSISTANT_CACHE_TTL', 3600))
+    ASSISTANT_CACHE_MAX_ENTRIES = int(os.environ.get('ASSISTANT_CACHE_MAX_ENTRIES', 1000))
+    
+    # Audit log: the live table keeps AUDIT_HOT_MONTHS months, older rows move to
+    # monthly tables (auditoria_YYYYMM) that are dropped after AUDIT_RETENTION_MONTHS
+    # (0 keeps them forever). AUDIT_ARCHIVE_INTERVAL=0 disables the background archiver.
+    AUDIT_HOT_MONTHS = int(os.environ.get('AUDIT_HOT_MONTHS', 3))
+    AUDIT_RETENTION_MONTHS = int(os.environ.get('AUDIT_RETENTION_MONTHS', 60))
+    AUDIT_ARCHIVE_INTERVAL = int(os.environ.get('AUDIT_ARCHIVE_INTERVAL', 3600))
+    AUDIT_ARCHIVE_BATCH_SIZE = int(os.environ.get('AUDIT_ARCHIVE_BATCH_SIZE', 500))
+    AUDIT_ARCHIVE_PAUSE = float(os.environ.get('AUDIT_ARCHIVE_PAUSE', 0.05))
+    
+    # Backups of the local SQLite database (scripts/backup.py and the admin panel).
+    # The online backup copies BACKUP_PAGES_PER_STEP pages per step and sleeps
+    # BACKUP_STEP_PAUSE seconds between steps so writers are never held for long
+    # (in WAL mode it copies in one step, since readers don't block writers).
+    BACKUP_DIR = os.environ.get('BACKUP_DIR', 'instance/backups')
+    BACKUP_PAGES_PER_STEP = int(os.environ.get('BACKUP_PAGES_PER_STEP', 256))
+    BACKUP_STEP_PAUSE = float(os.environ.get('BACKUP_STEP_PAUSE', 0.005))
+    BACKUP_CHUNK_SIZE = int(os.environ.get('BACKUP_CHUNK_SIZE', 64 * 1024))
+    BACKUP_MAX_RESTARTS = int(os.environ.get('BACKUP_MAX_RESTARTS', 20))
+    BACKUP_KEEP = int(os.environ.get('BACKUP_KEEP', 14))
+    
+    # Change log (alteracoes) read by models.change_log consumers. The archiver
+    # loop compacts entries every consumer has read; anything older than
+    # CDC_RETENTION_DAYS is dropped even if unread (0 keeps unread entries forever).
+    CDC_BATCH_SIZE = int(os.environ.get('CDC_BATCH_SIZE', 500))
+    CDC_RETENTION_DAYS = int(os.environ.get('CDC_RETENTION_DAYS', 30))
+    
+    # Uploads: MAX_CONTENT_LENGTH caps the whole request (Flask answers 413).
+    # Profile photos become square WebP/JPEG thumbnails, one per side in
+    # PROFILE_PHOTO_SIZES (1x and 2x for the 64-80 px avatars), made by a
+    # background job (JOB_WORKERS) next to the uploaded file.
+    MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', 6 * 1024 * 1024))
+    PROFILE_PHOTO_MAX_BYTES = int(os.environ.get('PROFILE_PHOTO_MAX_BYTES', 5 * 1024 * 1024))
+    PROFILE_PHOTO_SIZES = (96, 256)
+    PROFILE_PHOTO_QUALITY = int(os.environ.get('PROFILE_PHOTO_QUALITY', 82))
+    
+    # Report files made by background jobs (PDF distribution report, procedures
+    # CSV), read REPORT_BATCH_SIZE procedures at a time. The last
+    # REPORT_CACHE_KEEP files stay in REPORT_CACHE_DIR and are served again
+    # while the data doesn't change.
+    REPORT_CACHE_DIR = os.environ.get('REPORT_CACHE_DIR', 'instance/reports')
+    REPORT_CACHE_KEEP = int(os.environ.get('REPORT_CACHE_KEEP', 20))
+    REPORT_BATCH_SIZE = int(os.environ.get('REPORT_BATCH_SIZE', 500))
+    
+    # Background jobs (services/jobs.py): JOB_WORKERS processes take queued jobs
+    # with a JOB_LEASE_SECONDS lease, renewed while they run, and check an empty
+    # queue every JOB_POLL_INTERVAL seconds. A job whose worker died is retried
+    # up to JOB_MAX_ATTEMPTS times; finished ones are kept JOB_RETENTION_DAYS.
+    # With JOB_WORKERS=0 the server starts none: run scripts/job_worker.py.
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+    JOB_LEASE_SECONDS = int(os.environ.get('JOB_LEASE_SECONDS', 60))
+    JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 1))
+    JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 3))
+    JOB_RETENTION_DAYS = int(os.environ.get('JOB_RETENTION_DAYS', 7))
+    
+    # Bulk deletions (services/purge.py): PURGE_CHUNK_SIZE rows per short
+    # transaction with a PURGE_PAUSE seconds gap for other writers between
+    # them; freed space goes back to disk PURGE_VACUUM_PAGES pages at a time
+    PURGE_CHUNK_SIZE = int(os.environ.get('PURGE_CHUNK_SIZE', 200))
+    PURGE_PAUSE = float(os.environ.get('PURGE_PAUSE', 0.05))
+    PURGE_VACUUM_PAGES = int(os.environ.get('PURGE_VACUUM_PAGES', 256))
+    
+    # Prometheus metrics at /metrics (utils/metrics.py), for admins or for a
+    # scraper sending "Authorization: Bearer METRICS_TOKEN". Each process
+    # writes its counters to METRICS_DIR every METRICS_FLUSH_INTERVAL seconds
+    # so any gunicorn worker can answer for all of them.
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'True').lower() == 'true'
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+    METRICS_DIR = os.environ.get('METRICS_DIR', 'instance/metrics')
+    METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+    
+    # Distribution center kanban: cards rendered per (specialty, state) group
+    # on page load; the rest are fetched in pages of this size on scroll
+    KANBAN_PAGE_SIZE = int(os.environ.get('KANBAN_PAGE_SIZE', 20))
     
     # Default specialties
     DEFAULT_SPECIALTIES = [
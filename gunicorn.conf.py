@@ -0,0 +1,89 @@
+# Sistema de Registro de Avaliações - Clínica TEA
+# Criado por João Layon
+
+"""
+Production server profile; gunicorn reads ./gunicorn.conf.py by default:
+
+    gunicorn app:app
+
+With preload_app the master imports app once (create_app, migrations) and
+forks the workers from it. A SQLite connection must not cross fork(), so the
+master stops the audit archiver and closes its connection before forking,
+and every worker starts with a clean thread-local connection and its own
+archiver (archiving passes are transactional, so they may overlap). The
+background job workers (scripts/job_worker.py) run beside the master, not
+inside the request workers.
+
+Every setting can be overridden through GUNICORN_* environment variables.
+"""
+
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+# SQLite serializes writes, so extra processes mostly cost memory; threads
+# cover requests that wait on I/O (the Gemini API, SQLiteCloud)
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.environ.get('GUNICORN_WORKERS', min(multiprocessing.cpu_count() * 2, 8)))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# Recycle workers gradually (the jitter keeps them from restarting together)
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 100))
+
+# Assistant answers can take tens of seconds
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 90))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+# GUNICORN_ACCESSLOG='' turns the access log off
+accesslog = os.environ.get('GUNICORN_ACCESSLOG', '-') or None
+
+def when_ready(server):
+    """Master, before the first fork: nothing SQLite-related may stay open"""
+    from models.database import close_db_connection, get_replica
+    from services.audit_archiver import stop_audit_archiver
+    stop_audit_archiver(timeout=graceful_timeout)
+    if get_replica():
+        get_replica().stop(timeout=graceful_timeout)
+        get_replica().close()
+    close_db_connection()
+    
+    # Metrics files of the previous run would be added to this one's
+    from utils.metrics import clear_dir
+    clear_dir()
+    
+    # Job workers (services/jobs.py): one supervisor for the whole server,
+    # started from the master so it isn't duplicated per worker. It detaches
+    # itself, so the master's SIGCHLD reaper never collects it, and it stops
+    # when the master is gone
+    from config import Config
+    from services.jobs import start_job_runner
+    start_job_runner(Config.DATABASE_URL)
+
+def post_fork(server, worker):
+    """Worker, right after fork: fresh connections and background threads"""
+    from config import Config
+    from models.database import reset_after_fork, get_replica
+    from services.audit_archiver import start_audit_archiver
+    from utils import metrics
+    reset_after_fork()
+    metrics.reset_after_fork()
+    start_audit_archiver(Config.DATABASE_URL, Config.AUDIT_ARCHIVE_INTERVAL)
+    if get_replica():
+        get_replica().start()
+
+def worker_exit(server, worker):
+    """Worker shutting down (max_requests recycling or stop)"""
+    from models.database import get_replica
+    from services.audit_archiver import stop_audit_archiver
+    stop_audit_archiver(timeout=5)
+    if get_replica():
+        get_replica().stop(timeout=5)
+
+def on_exit(server):
+    """Master shutting down: let the job workers finish what they are running"""
+    from services.jobs import stop_job_runner
+    stop_job_runner(timeout=graceful_timeout)
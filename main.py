@@ -1,7 +1,12 @@
 # Sistema de Registro de Avaliações - Clínica TEA
 # Criado por João Layon
 
+import os
 from app import app
 
 if __name__ == '__main__':
+    # With the reloader only the child process (WERKZEUG_RUN_MAIN) serves requests
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        from services.jobs import start_job_runner
+        start_job_runner(app.config['DATABASE_URL'])
     app.run(host='0.0.0.0', port=5000, debug=True)
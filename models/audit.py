@@ -1,70 +1,453 @@
 # Sistema de Registro de Avaliações - Clínica TEA
 # Criado por João Layon
 
-from models.database import get_db_connection
+import re
+import time
+from datetime import datetime, timedelta
+from config import Config
+from models.database import get_db_connection, get_db_transaction
 
-def log_action(user_id, acao, detalhe):
-    """Log an action to the audit table"""
+# Rows are read newest first by id: ids grow with criado_em, and the archiver
+# always moves the oldest rows, so the live table followed by the partitions
+# in descending month order is one continuous id-descending sequence.
+
+ENTITY_LABELS = {
+    'paciente': 'Paciente',
+    'usuario': 'Usuário',
+}
+
+def audit_statement(user_id, acao, detalhe, entidade=None, entidade_id=None):
+    """(sql, parameters) of the audit INSERT, for writes that log inside their own transaction"""
+    return ("""
+        INSERT INTO auditoria (user_id, acao, detalhe, entidade, entidade_id)
+        VALUES (?, ?, ?, ?, ?)
+    """, (user_id, acao, detalhe, entidade, entidade_id))
+
+def log_action(user_id, acao, detalhe, entidade=None, entidade_id=None):
+    """Log an action to the audit table, optionally tagged with the record it touched"""
     conn = get_db_connection()
-    conn.execute("""
-        INSERT INTO auditoria (user_id, acao, detalhe)
-        VALUES (?, ?, ?)
-    """, (user_id, acao, detalhe))
+    conn.execute(*audit_statement(user_id, acao, detalhe, entidade, entidade_id))
     conn.commit()
 
-def get_audit_logs(limit=100, offset=0, user_id=None, acao=None):
-    """Get audit logs with optional filters"""
+def _partition_table(mes):
+    """Rollover table name for a YYYYMM month key"""
+    if len(mes) != 6 or not mes.isdigit():
+        raise ValueError(f"Partição de auditoria inválida: {mes}")
+    return f'auditoria_{mes}'
+
+def _shift_month(year, month, delta):
+    index = year * 12 + (month - 1) + delta
+    return index // 12, index % 12 + 1
+
+def _month_bounds(mes):
+    """[start, end) timestamps covered by a YYYYMM partition"""
+    year, month = int(mes[:4]), int(mes[4:])
+    next_year, next_month = _shift_month(year, month, 1)
+    return f'{year:04d}-{month:02d}-01 00:00:00', f'{next_year:04d}-{next_month:02d}-01 00:00:00'
+
+def archive_boundary(hot_months=None, now=None):
+    """Start of the oldest hot month; rows created before it are archived"""
+    hot_months = hot_months or Config.AUDIT_HOT_MONTHS
+    now = now or datetime.utcnow()  # criado_em is CURRENT_TIMESTAMP, i.e. UTC
+    year, month = _shift_month(now.year, now.month, -(max(1, hot_months) - 1))
+    return f'{year:04d}-{month:02d}-01 00:00:00'
+
+def count_archive_backlog(hot_months=None, now=None):
+    """Live rows already past the hot window, waiting for the archiver"""
     conn = get_db_connection()
-    
+    return conn.execute("SELECT COUNT(*) FROM auditoria WHERE criado_em < ?",
+                        (archive_boundary(hot_months, now),)).fetchone()[0]
+
+def get_partitions():
+    """Archived months, newest first"""
+    conn = get_db_connection()
+    rows = conn.execute("""
+        SELECT mes, tabela, linhas, arquivado_em FROM auditoria_particoes ORDER BY mes DESC
+    """).fetchall()
+    return [dict(row) for row in rows]
+
+def _date_range(data_inicio, data_fim):
+    """Turn inclusive YYYY-MM-DD dates into [start, end) timestamps"""
+    start = f'{data_inicio} 00:00:00' if data_inicio else None
+    end = None
+    if data_fim:
+        end = (datetime.strptime(data_fim, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d 00:00:00')
+    return start, end
+
+def _sources(conn, start, end, filtered):
+    """(table, row count or None) to read, newest first.
+
+    Partitions outside the date range are never touched. Counts come from the
+    maintained counters and are only usable when there are no row filters.
+    """
+    live_count = None
+    if not filtered:
+        row = conn.execute("""
+            SELECT valor FROM auditoria_contadores WHERE chave = 'auditoria'
+        """).fetchone()
+        live_count = row[0] if row else None
+    sources = [('auditoria', live_count)]
+
+    for row in conn.execute("""
+        SELECT mes, tabela, linhas FROM auditoria_particoes ORDER BY mes DESC
+    """).fetchall():
+        month_start, month_end = _month_bounds(row['mes'])
+        if (end and month_start >= end) or (start and month_end <= start):
+            continue
+        sources.append((row['tabela'], None if filtered else row['linhas']))
+
+    return sources
+
+def _match_query(q):
+    """FTS5 query for q: every word must match, the last one as a prefix.
+
+    Prefix-matching every word expands each one over the whole vocabulary,
+    which is an order of magnitude slower on a large log.
+    """
+    tokens = re.findall(r'\w+', q or '')
+    if not tokens:
+        return ''
+    return ' '.join([f'"{token}"' for token in tokens[:-1]] + [f'"{tokens[-1]}"*'])
+
+def _where(user_id, acao, start, end, entidade=None, entidade_id=None):
     where_conditions = []
     params = []
-    
+
     if user_id:
         where_conditions.append("a.user_id = ?")
         params.append(user_id)
-    
+
     if acao:
         where_conditions.append("a.acao = ?")
         params.append(acao)
-    
+
+    if start:
+        where_conditions.append("a.criado_em >= ?")
+        params.append(start)
+
+    if end:
+        where_conditions.append("a.criado_em < ?")
+        params.append(end)
+
+    if entidade:
+        where_conditions.append("a.entidade = ?")
+        params.append(entidade)
+        if entidade_id:
+            where_conditions.append("a.entidade_id = ?")
+            params.append(entidade_id)
+
     where_clause = ""
     if where_conditions:
         where_clause = "WHERE " + " AND ".join(where_conditions)
-    
-    params.extend([limit, offset])
-    
-    rows = conn.execute(f"""
-        SELECT a.*, u.nome as user_nome
-        FROM auditoria a
-        LEFT JOIN users u ON a.user_id = u.id
-        {where_clause}
-        ORDER BY a.criado_em DESC
-        LIMIT ? OFFSET ?
-    """, params).fetchall()
-    
-    return [dict(row) for row in rows]
 
-def count_audit_logs(user_id=None, acao=None):
-    """Count audit logs with optional filters"""
+    return where_clause, params
+
+_COLUMNS = """
+    SELECT a.id, a.user_id, a.acao, a.detalhe, a.criado_em, a.entidade, a.entidade_id,
+           u.nome as user_nome
+"""
+
+SEARCH_BATCH = 500
+
+def _search_rows(conn, match, where_clause, params, sources):
+    """Rows matching a full-text query, newest first.
+
+    Matching ids come from auditoria_busca in descending order and are
+    resolved in batches, each id only against the source whose id range
+    holds it, so the cost follows the number of matches read, not the
+    number of partitions.
+    """
+    ranges = []
+    for table, _ in sources:
+        # Separate subqueries: SQLite only answers a lone MIN or MAX from the index
+        low, high = conn.execute(f"""
+            SELECT (SELECT MIN(id) FROM {table}), (SELECT MAX(id) FROM {table})
+        """).fetchone()
+        if low is not None:
+            ranges.append((table, low, high))
+
+    condition = where_clause.replace('WHERE', 'AND', 1)
+    cursor = conn.execute("""
+        SELECT rowid FROM auditoria_busca WHERE auditoria_busca MATCH ? ORDER BY rowid DESC
+    """, (match,))
+    try:
+        while True:
+            ids = [row[0] for row in cursor.fetchmany(SEARCH_BATCH)]
+            if not ids:
+                break
+
+            rows = []
+            for table, low, high in ranges:
+                batch = [audit_id for audit_id in ids if low <= audit_id <= high]
+                if batch:
+                    rows.extend(conn.execute(f"""
+                        {_COLUMNS}
+                        FROM {table} a
+                        LEFT JOIN users u ON a.user_id = u.id
+                        WHERE a.id IN ({','.join('?' * len(batch))}) {condition}
+                    """, batch + params).fetchall())
+
+            rows.sort(key=lambda row: row['id'], reverse=True)
+            yield from rows
+    finally:
+        cursor.close()
+
+def get_audit_logs(limit=100, offset=0, user_id=None, acao=None, data_inicio=None, data_fim=None,
+                   q=None, entidade=None, entidade_id=None):
+    """Get audit logs with optional filters, newest first.
+
+    q is a full-text search over detalhe. Reads the live table first and
+    only falls through to archived months when it runs out of rows for the
+    requested page.
+    """
     conn = get_db_connection()
-    
+    start, end = _date_range(data_inicio, data_fim)
+    where_clause, params = _where(user_id, acao, start, end, entidade, entidade_id)
+
+    match = _match_query(q)
+    if match:
+        logs = []
+        for index, row in enumerate(_search_rows(conn, match, where_clause, params,
+                                                 _sources(conn, start, end, filtered=True))):
+            if index >= offset + limit:
+                break
+            if index >= offset:
+                logs.append(dict(row))
+        return logs
+
+    logs = []
+    skip = offset
+    for table, known_count in _sources(conn, start, end, filtered=bool(where_clause)):
+        if len(logs) >= limit:
+            break
+
+        # Whole sources before the page are skipped without reading them
+        if known_count is not None and skip >= known_count:
+            skip -= known_count
+            continue
+
+        rows = conn.execute(f"""
+            {_COLUMNS}
+            FROM {table} a
+            LEFT JOIN users u ON a.user_id = u.id
+            {where_clause}
+            ORDER BY a.id DESC
+            LIMIT ? OFFSET ?
+        """, params + [limit - len(logs), skip]).fetchall()
+
+        if rows:
+            skip = 0
+        elif skip:
+            skip -= conn.execute(f"""
+                SELECT COUNT(*) FROM {table} a {where_clause}
+            """, params).fetchone()[0]
+            skip = max(0, skip)
+
+        logs.extend(dict(row) for row in rows)
+
+    return logs
+
+def count_audit_logs(user_id=None, acao=None, data_inicio=None, data_fim=None,
+                     q=None, entidade=None, entidade_id=None):
+    """Count audit logs with optional filters.
+
+    Without filters this reads the maintained counters and with user, action
+    or date filters the daily rollups, so neither scans the log. Text and
+    entity filters count each relevant source through its indexes.
+    """
+    conn = get_db_connection()
+    if not (q or entidade) and (user_id or acao or data_inicio or data_fim):
+        where_clause, params = _rollup_where(user_id, acao, data_inicio, data_fim)
+        return conn.execute(f"""
+            SELECT COALESCE(SUM(total), 0) FROM auditoria_resumo {where_clause}
+        """, params).fetchone()[0]
+
+    start, end = _date_range(data_inicio, data_fim)
+    where_clause, params = _where(user_id, acao, start, end, entidade, entidade_id)
+
+    match = _match_query(q)
+    if match and not where_clause:
+        return conn.execute("""
+            SELECT COUNT(*) FROM auditoria_busca WHERE auditoria_busca MATCH ?
+        """, (match,)).fetchone()[0]
+    if match:
+        return sum(1 for _ in _search_rows(conn, match, where_clause, params,
+                                           _sources(conn, start, end, filtered=True)))
+
+    count = 0
+    for table, known_count in _sources(conn, start, end, filtered=bool(where_clause)):
+        if known_count is None:
+            known_count = conn.execute(f"""
+                SELECT COUNT(*) FROM {table} a {where_clause}
+            """, params).fetchone()[0]
+        count += known_count
+
+    return count
+
+def _rollup_where(user_id=None, acao=None, data_inicio=None, data_fim=None):
     where_conditions = []
     params = []
-    
+
     if user_id:
         where_conditions.append("user_id = ?")
         params.append(user_id)
-    
+
     if acao:
         where_conditions.append("acao = ?")
         params.append(acao)
-    
+
+    if data_inicio:
+        where_conditions.append("dia >= ?")
+        params.append(data_inicio)
+
+    if data_fim:
+        where_conditions.append("dia <= ?")
+        params.append(data_fim)
+
     where_clause = ""
     if where_conditions:
         where_clause = "WHERE " + " AND ".join(where_conditions)
-    
-    count = conn.execute(f"""
-        SELECT COUNT(*) FROM auditoria {where_clause}
-    """, params).fetchone()[0]
-    
-    return count
+
+    return where_clause, params
+
+def get_audit_facets(user_id=None, acao=None, data_inicio=None, data_fim=None, days=30):
+    """Counts by action, user and day from the maintained rollups.
+
+    Each facet applies every filter except its own, so the sidebar shows
+    what selecting another value would return.
+    """
+    conn = get_db_connection()
+
+    where_clause, params = _rollup_where(user_id=user_id, data_inicio=data_inicio, data_fim=data_fim)
+    acoes = conn.execute(f"""
+        SELECT acao, SUM(total) as total FROM auditoria_resumo {where_clause}
+        GROUP BY acao ORDER BY total DESC
+    """, params).fetchall()
+
+    where_clause, params = _rollup_where(acao=acao, data_inicio=data_inicio, data_fim=data_fim)
+    usuarios = conn.execute(f"""
+        SELECT r.user_id, u.nome, r.total FROM (
+            SELECT user_id, SUM(total) as total FROM auditoria_resumo {where_clause}
+            GROUP BY user_id
+        ) r
+        LEFT JOIN users u ON u.id = r.user_id
+        ORDER BY r.total DESC
+    """, params).fetchall()
+
+    where_clause, params = _rollup_where(user_id=user_id, acao=acao,
+                                         data_inicio=data_inicio, data_fim=data_fim)
+    dias = conn.execute(f"""
+        SELECT dia, SUM(total) as total FROM auditoria_resumo {where_clause}
+        GROUP BY dia ORDER BY dia DESC LIMIT ?
+    """, params + [days]).fetchall()
+
+    return {
+        'acoes': [dict(row) for row in acoes],
+        'usuarios': [dict(row) for row in usuarios],
+        'dias': [dict(row) for row in dias],
+    }
+
+def _ensure_partition(conn, mes):
+    table = _partition_table(mes)
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER,
+            acao TEXT NOT NULL,
+            detalhe TEXT,
+            criado_em TIMESTAMP,
+            entidade TEXT,
+            entidade_id INTEGER
+        )
+    """)
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_user ON {table} (user_id)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_acao ON {table} (acao)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_entidade ON {table} (entidade, entidade_id)")
+    conn.execute("""
+        INSERT OR IGNORE INTO auditoria_particoes (mes, tabela) VALUES (?, ?)
+    """, (mes, table))
+    return table
+
+def archive_audit_logs(batch_size=None, pause=None, hot_months=None, now=None):
+    """Move rows older than the hot window into their monthly partitions.
+
+    Each batch is a short BEGIN IMMEDIATE transaction, with a pause between
+    batches so request writers are never blocked for long. Returns the
+    number of rows moved.
+    """
+    batch_size = batch_size or Config.AUDIT_ARCHIVE_BATCH_SIZE
+    pause = Config.AUDIT_ARCHIVE_PAUSE if pause is None else pause
+    boundary = archive_boundary(hot_months, now)
+    moved = 0
+
+    while True:
+        with get_db_transaction() as conn:
+            months = conn.execute("""
+                SELECT strftime('%Y%m', criado_em) as mes, MIN(id) as primeiro, MAX(id) as ultimo
+                FROM (
+                    SELECT id, criado_em FROM auditoria
+                    WHERE criado_em < ?
+                    ORDER BY id
+                    LIMIT ?
+                )
+                GROUP BY mes
+            """, (boundary, batch_size)).fetchall()
+
+            for row in months:
+                table = _ensure_partition(conn, row['mes'])
+                predicate = "id BETWEEN ? AND ? AND criado_em < ? AND strftime('%Y%m', criado_em) = ?"
+                params = (row['primeiro'], row['ultimo'], boundary, row['mes'])
+
+                copied = conn.execute(f"""
+                    INSERT INTO {table} (id, user_id, acao, detalhe, criado_em, entidade, entidade_id)
+                    SELECT id, user_id, acao, detalhe, criado_em, entidade, entidade_id FROM auditoria
+                    WHERE {predicate}
+                """, params).rowcount
+                conn.execute(f"DELETE FROM auditoria WHERE {predicate}", params)
+                conn.execute("""
+                    UPDATE auditoria_particoes SET linhas = linhas + ?, arquivado_em = CURRENT_TIMESTAMP
+                    WHERE mes = ?
+                """, (copied, row['mes']))
+                moved += copied
+
+        if not months:
+            break
+        time.sleep(pause)
+
+    return moved
+
+def apply_audit_retention(retention_months=None, now=None):
+    """Drop archived months older than the retention window (0 keeps everything).
+
+    Returns the dropped partitions as (mes, linhas) tuples.
+    """
+    retention_months = Config.AUDIT_RETENTION_MONTHS if retention_months is None else retention_months
+    if not retention_months:
+        return []
+
+    now = now or datetime.utcnow()
+    year, month = _shift_month(now.year, now.month, -retention_months)
+    cutoff = f'{year:04d}{month:02d}'
+
+    dropped = []
+    with get_db_transaction() as conn:
+        rows = conn.execute("""
+            SELECT mes, tabela, linhas FROM auditoria_particoes WHERE mes < ? ORDER BY mes
+        """, (cutoff,)).fetchall()
+        for row in rows:
+            table = _partition_table(row['mes'])
+            month_start, month_end = _month_bounds(row['mes'])
+            conn.execute(f"""
+                DELETE FROM auditoria_busca WHERE rowid IN (SELECT id FROM {table})
+            """)
+            conn.execute("""
+                DELETE FROM auditoria_resumo WHERE dia >= ? AND dia < ?
+            """, (month_start[:10], month_end[:10]))
+            conn.execute(f"DROP TABLE IF EXISTS {table}")
+            conn.execute("DELETE FROM auditoria_particoes WHERE mes = ?", (row['mes'],))
+            dropped.append((row['mes'], row['linhas']))
+
+    for mes, linhas in dropped:
+        log_action(None, 'audit_retention', f'Partição de auditoria {mes} removida ({linhas} registros)')
+
+    return dropped
@@ -0,0 +1,187 @@
+# Sistema de Registro de Avaliações - Clínica TEA
+# Criado por João Layon
+
+import json
+from datetime import datetime, timedelta
+from config import Config
+from models.database import get_db_connection, get_db_transaction
+
+# alteracoes is written by triggers (migration 0007) in the same transaction
+# as the change itself, so a committed row always has its entry and seq order
+# is commit order. Consumers read forward from their checkpoint and compaction
+# only removes what every registered consumer has already read.
+
+CDC_TABLES = ('pacientes', 'avaliacoes', 'avaliacao_terapias', 'procedimentos')
+
+class ChangeLogGapError(Exception):
+    """The consumer's checkpoint is older than entries already discarded by retention"""
+
+def _decode(row):
+    change = dict(row)
+    change['dados'] = json.loads(change['dados']) if change['dados'] else None
+    return change
+
+def latest_sequence():
+    """Highest seq ever assigned (0 when nothing was captured yet)"""
+    conn = get_db_connection()
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'alteracoes'").fetchone()
+    return row['seq'] if row else 0
+
+def discarded_until():
+    """Entries with seq up to this value may have been dropped without being read"""
+    conn = get_db_connection()
+    row = conn.execute("SELECT valor FROM alteracoes_meta WHERE chave = 'descartado_ate'").fetchone()
+    return row['valor'] if row else 0
+
+def get_changes(after_seq=0, limit=500, tabelas=None, until_seq=None):
+    """Changes with after_seq < seq <= until_seq, oldest first, optionally for some tables only"""
+    conditions = ['seq > ?']
+    params = [after_seq]
+    if until_seq is not None:
+        conditions.append('seq <= ?')
+        params.append(until_seq)
+    if tabelas:
+        conditions.append(f"tabela IN ({', '.join('?' for _ in tabelas)})")
+        params.extend(tabelas)
+
+    conn = get_db_connection()
+    rows = conn.execute(f"""
+        SELECT seq, tabela, operacao, registro_id, dados, criado_em FROM alteracoes
+        WHERE {' AND '.join(conditions)}
+        ORDER BY seq LIMIT ?
+    """, params + [limit]).fetchall()
+    return [_decode(row) for row in rows]
+
+class ChangeConsumer:
+    """Named reader of the change log with a persistent checkpoint.
+
+    A new consumer starts at the current end of the log (from_start=True
+    replays everything still retained). poll() returns the next batch and
+    advances the in-memory cursor; commit() persists it, so a consumer that
+    crashes before committing sees the same batch again.
+    """
+
+    def __init__(self, nome, batch_size=None, tabelas=None, from_start=False):
+        self.nome = nome
+        self.batch_size = batch_size or Config.CDC_BATCH_SIZE
+        self.tabelas = tuple(tabelas) if tabelas else None
+        conn = get_db_connection()
+        conn.execute("""
+            INSERT OR IGNORE INTO alteracoes_consumidores (nome, posicao) VALUES (?, ?)
+        """, (nome, discarded_until() if from_start else latest_sequence()))
+        conn.commit()
+        self.cursor = self.position
+
+    @property
+    def position(self):
+        """Last seq committed by this consumer"""
+        conn = get_db_connection()
+        row = conn.execute("""
+            SELECT posicao FROM alteracoes_consumidores WHERE nome = ?
+        """, (self.nome,)).fetchone()
+        return row['posicao'] if row else 0
+
+    def poll(self):
+        """Next batch of changes after the cursor (empty when caught up)"""
+        if self.cursor < discarded_until():
+            raise ChangeLogGapError(
+                f"Consumidor {self.nome} parado em {self.cursor}, mas o log já descartou até {discarded_until()}"
+            )
+        # Without a table filter the last row is the new cursor; with one, a short
+        # batch means everything up to `until` was scanned, matching or not.
+        until = latest_sequence()
+        changes = get_changes(self.cursor, self.batch_size, self.tabelas, until)
+        if len(changes) == self.batch_size:
+            self.cursor = changes[-1]['seq']
+        else:
+            self.cursor = max(self.cursor, until)
+        return changes
+
+    def commit(self, seq=None):
+        """Persist the checkpoint (the cursor by default); it never moves backwards"""
+        seq = self.cursor if seq is None else seq
+        conn = get_db_connection()
+        conn.execute("""
+            UPDATE alteracoes_consumidores
+            SET posicao = MAX(posicao, ?), atualizado_em = CURRENT_TIMESTAMP
+            WHERE nome = ?
+        """, (seq, self.nome))
+        conn.commit()
+
+    def consume(self, handler, max_batches=None):
+        """Call handler(batch) until caught up, committing after each batch.
+
+        Returns the number of changes handled.
+        """
+        handled = 0
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            before = self.cursor
+            changes = self.poll()
+            if changes:
+                handler(changes)
+                handled += len(changes)
+            if self.cursor != before:
+                self.commit()
+            if len(changes) < self.batch_size:
+                break
+            batches += 1
+        return handled
+
+    def reset(self, seq=0):
+        """Move the checkpoint to seq (e.g. after a full resync), even backwards"""
+        conn = get_db_connection()
+        conn.execute("""
+            UPDATE alteracoes_consumidores SET posicao = ?, atualizado_em = CURRENT_TIMESTAMP
+            WHERE nome = ?
+        """, (seq, self.nome))
+        conn.commit()
+        self.cursor = seq
+
+def get_consumers():
+    """Registered consumers with how far behind the log they are"""
+    conn = get_db_connection()
+    latest = latest_sequence()
+    rows = conn.execute("""
+        SELECT nome, posicao, atualizado_em FROM alteracoes_consumidores ORDER BY nome
+    """).fetchall()
+    return [dict(row, atraso=latest - row['posicao']) for row in rows]
+
+def remove_consumer(nome):
+    """Unregister a consumer so it no longer holds back compaction"""
+    conn = get_db_connection()
+    conn.execute("DELETE FROM alteracoes_consumidores WHERE nome = ?", (nome,))
+    conn.commit()
+
+def compact_changes(retention_days=None, now=None):
+    """Delete entries every consumer has read, plus anything past the retention window.
+
+    Entries nobody registered for are kept until retention expires, so a
+    consumer registered with from_start=True can still replay them. Entries
+    dropped by retention before a consumer read them raise ChangeLogGapError
+    on that consumer's next poll. Returns (consumed, expired) deleted counts.
+    """
+    retention_days = Config.CDC_RETENTION_DAYS if retention_days is None else retention_days
+    now = now or datetime.utcnow()  # criado_em is CURRENT_TIMESTAMP, i.e. UTC
+
+    with get_db_transaction() as conn:
+        row = conn.execute("""
+            SELECT MIN(posicao) AS posicao, COUNT(*) AS total FROM alteracoes_consumidores
+        """).fetchone()
+        consumed = 0
+        if row['total']:
+            consumed = conn.execute("DELETE FROM alteracoes WHERE seq <= ?", (row['posicao'],)).rowcount
+
+        expired = 0
+        if retention_days:
+            cutoff = (now - timedelta(days=retention_days)).strftime('%Y-%m-%d %H:%M:%S')
+            last = conn.execute("""
+                SELECT MAX(seq) AS seq FROM alteracoes WHERE criado_em < ?
+            """, (cutoff,)).fetchone()['seq']
+            if last is not None:
+                expired = conn.execute("DELETE FROM alteracoes WHERE seq <= ?", (last,)).rowcount
+                conn.execute("""
+                    UPDATE alteracoes_meta SET valor = MAX(valor, ?) WHERE chave = 'descartado_ate'
+                """, (last,))
+
+    return consumed, expired
@@ -1,10 +1,14 @@
 # Sistema de Registro de Avaliações - Clínica TEA
 # Criado por João Layon
 
+import math
 import sqlite3
 import os
+import time
 from contextlib import contextmanager
 from threading import local
+from config import Config
+from utils.metrics import Counter, record_sql
 try:
     import sqlitecloud
     SQLITECLOUD_AVAILABLE = True
@@ -14,146 +18,387 @@ except ImportError:
 # Thread-local storage for database connections
 _local = local()
 
+# Database given to init_db; threads that open their connection later (request
+# threads of a threaded server, background workers) connect to it by default
+_default_url = None
+
+# Local read replica (models/replica.py), set up by init_db when enabled
+_replica = None
+
+TRANSACTION_RETRIES = Counter('tea_db_transaction_retries_total',
+                              'BEGIN IMMEDIATE repetidos depois de "database is locked"')
+LOCKED_ERRORS = Counter('tea_db_locked_errors_total',
+                        'Transações que falharam com "database is locked" (depois das repetições)')
+
+def open_connection(db_path):
+    """Open a new connection to db_path (SQLiteCloud or local file), outside the per-thread cache"""
+    # Check if using SQLiteCloud
+    if db_path.startswith('sqlitecloud://'):
+        if not SQLITECLOUD_AVAILABLE:
+            raise ImportError("sqlitecloud package is required for SQLiteCloud connections")
+        import sqlitecloud
+        connection = sqlitecloud.connect(db_path)
+        connection.row_factory = sqlite3.Row
+    else:
+        # Local SQLite file
+        if db_path.startswith('sqlite:///'):
+            db_path = db_path[10:]  # Remove sqlite:/// prefix
+            
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        connection = sqlite3.connect(db_path, check_same_thread=False)
+        connection.row_factory = sqlite3.Row
+    
+    connection.execute('PRAGMA foreign_keys = ON')
+    
+    if Config.DATABASE_SIMULATED_LATENCY_MS > 0:
+        connection = SimulatedLatencyConnection(connection, Config.DATABASE_SIMULATED_LATENCY_MS)
+    return connection
+
 def get_db_connection(db_url=None):
     """Get database connection for current thread"""
     if not hasattr(_local, 'connection') or _local.connection is None:
-        db_path = db_url or 'instance/app.db'
+        db_path = db_url or _default_url or 'instance/app.db'
         
-        # Check if using SQLiteCloud
-        if db_path.startswith('sqlitecloud://'):
-            if not SQLITECLOUD_AVAILABLE:
-                raise ImportError("sqlitecloud package is required for SQLiteCloud connections")
-            import sqlitecloud
-            _local.connection = sqlitecloud.connect(db_path)
-            _local.connection.row_factory = sqlite3.Row
+        if _replica is not None and db_path == _replica.primary_url:
+            _local.connection = _replica.connect()
         else:
-            # Local SQLite file
-            if db_path.startswith('sqlite:///'):
-                db_path = db_path[10:]  # Remove sqlite:/// prefix
-                
-            os.makedirs(os.path.dirname(db_path), exist_ok=True)
-            _local.connection = sqlite3.connect(db_path, check_same_thread=False)
-            _local.connection.row_factory = sqlite3.Row
-        
-        _local.connection.execute('PRAGMA foreign_keys = ON')
+            _local.connection = open_connection(db_path)
+        if Config.METRICS_ENABLED:
+            _local.connection = InstrumentedConnection(_local.connection)
         
     return _local.connection
 
+def get_replica():
+    """The active read replica, or None when reads go straight to the database"""
+    return _replica
+
+class SimulatedLatencyConnection:
+    """Stand-in for a remote database: a local connection that waits a network
+    round trip on every call that would reach the server (testing and benchmarks)"""
+    
+    round_trips = 0
+    statements = 0
+    # False models a server that takes a single statement per request
+    pipeline = True
+    
+    def __init__(self, connection, latency_ms):
+        self._connection = connection
+        self._latency = latency_ms / 1000.0
+    
+    def _round_trip(self):
+        SimulatedLatencyConnection.round_trips += 1
+        time.sleep(self._latency)
+    
+    def execute(self, sql, parameters=()):
+        self._round_trip()
+        SimulatedLatencyConnection.statements += 1
+        return self._connection.execute(sql, parameters)
+    
+    def execute_batch(self, statements):
+        """All statements in one request, like a multi-statement SQLiteCloud command"""
+        if not self.pipeline:
+            return send_batch(self, statements, pipelined=False)
+        self._round_trip()
+        SimulatedLatencyConnection.statements += len(statements)
+        return send_batch(self._connection, statements)
+    
+    def executemany(self, sql, seq_of_parameters):
+        self._round_trip()
+        seq_of_parameters = list(seq_of_parameters)
+        SimulatedLatencyConnection.statements += len(seq_of_parameters)
+        return self._connection.executemany(sql, seq_of_parameters)
+    
+    def commit(self):
+        self._round_trip()
+        self._connection.commit()
+    
+    def rollback(self):
+        self._round_trip()
+        self._connection.rollback()
+    
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+class InstrumentedConnection:
+    """The thread's connection, adding the statements it sends and the time
+    they take (fetching included) to the request totals in utils.metrics"""
+    
+    def __init__(self, connection):
+        object.__setattr__(self, '_connection', connection)
+    
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return InstrumentedCursor(self._connection.execute(sql, parameters))
+        finally:
+            record_sql(1, time.perf_counter() - started)
+    
+    def execute_batch(self, statements):
+        started = time.perf_counter()
+        try:
+            return send_batch(self._connection, statements)
+        finally:
+            record_sql(len(statements), time.perf_counter() - started)
+    
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return self._connection.executemany(sql, seq_of_parameters)
+        finally:
+            record_sql(1, time.perf_counter() - started)
+    
+    def executescript(self, script):
+        started = time.perf_counter()
+        try:
+            return self._connection.executescript(script)
+        finally:
+            record_sql(1, time.perf_counter() - started)
+    
+    def commit(self):
+        started = time.perf_counter()
+        try:
+            self._connection.commit()
+        finally:
+            record_sql(1, time.perf_counter() - started)
+    
+    def rollback(self):
+        started = time.perf_counter()
+        try:
+            self._connection.rollback()
+        finally:
+            record_sql(1, time.perf_counter() - started)
+    
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+    
+    def __setattr__(self, name, value):
+        # Attributes set by callers (the replica's `required`) belong to the connection
+        setattr(self._connection, name, value)
+
+class InstrumentedCursor:
+    """Cursor whose fetches count as database time"""
+    
+    def __init__(self, cursor):
+        self._cursor = cursor
+    
+    def fetchone(self):
+        started = time.perf_counter()
+        try:
+            return self._cursor.fetchone()
+        finally:
+            record_sql(0, time.perf_counter() - started)
+    
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        try:
+            return self._cursor.fetchmany() if size is None else self._cursor.fetchmany(size)
+        finally:
+            record_sql(0, time.perf_counter() - started)
+    
+    def fetchall(self):
+        started = time.perf_counter()
+        try:
+            return self._cursor.fetchall()
+        finally:
+            record_sql(0, time.perf_counter() - started)
+    
+    def __iter__(self):
+        return self
+    
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            return next(self._cursor)
+        finally:
+            record_sql(0, time.perf_counter() - started)
+    
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+def close_db_connection():
+    """Close this thread's connection; the next get_db_connection opens a new one"""
+    conn = getattr(_local, 'connection', None)
+    _local.connection = None
+    if conn is not None:
+        conn.close()
+
+# Connections inherited through fork(), kept referenced so they are never
+# closed in the child: closing an inherited SQLite handle releases the
+# parent's POSIX locks on the database file.
+_inherited = []
+
+def reset_after_fork():
+    """Drop connections inherited from the parent process (call in the child after fork)"""
+    global _local
+    _inherited.append(_local)
+    _local = local()
+    if _replica is not None:
+        _replica.after_fork()
+
+def _is_locked(error):
+    return 'database is locked' in str(error)
+
+def _begin_immediate(conn):
+    """BEGIN IMMEDIATE, retried with a growing pause while another writer keeps the lock"""
+    pause = Config.DATABASE_LOCK_RETRY_PAUSE
+    for attempt in range(Config.DATABASE_LOCK_RETRIES):
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            return
+        except Exception as e:
+            if not _is_locked(e):
+                raise
+        # Nothing ran yet, so trying again is safe
+        TRANSACTION_RETRIES.inc()
+        time.sleep(pause)
+        pause *= 2
+    conn.execute('BEGIN IMMEDIATE')
+
 @contextmanager
 def get_db_transaction(db_url=None):
     """Context manager for database transactions with proper locking"""
     conn = get_db_connection(db_url)
     try:
         # Use BEGIN IMMEDIATE for exclusive transactions
-        conn.execute('BEGIN IMMEDIATE')
+        _begin_immediate(conn)
         yield conn
         conn.commit()
     except Exception as e:
+        if _is_locked(e):
+            LOCKED_ERRORS.inc()
         conn.rollback()
         raise e
 
-def init_db(db_url=None):
-    """Initialize database with tables and indexes"""
+def _sql_literal(value):
+    if value is None:
+        return 'NULL'
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, float) and not math.isfinite(value):
+        # Same as binding them: NaN is stored as NULL, infinities as the
+        # overflowing literals SQLite reads back as +/-Inf (repr gives nan/inf)
+        if math.isnan(value):
+            return 'NULL'
+        return '9e999' if value > 0 else '-9e999'
+    if isinstance(value, (int, float)):
+        return repr(value)
+    if isinstance(value, bytes):
+        return f"X'{value.hex()}'"
+    return "'" + str(value).replace("'", "''") + "'"
+
+def _inline_parameters(sql, parameters):
+    """sql with each ? placeholder (outside quotes) replaced by the literal value"""
+    values = iter(parameters)
+    parts = []
+    quote = None
+    for char in sql:
+        if quote:
+            quote = None if char == quote else quote
+        elif char in ("'", '"'):
+            quote = char
+        elif char == '?':
+            char = _sql_literal(next(values))
+        parts.append(char)
+    return ''.join(parts)
+
+def send_batch(conn, statements, pipelined=True):
+    """Execute [(sql, parameters)] in order; returns the rows of the last statement"""
+    if pipelined and hasattr(conn, 'execute_batch'):
+        return conn.execute_batch(statements)
+    if pipelined and SQLITECLOUD_AVAILABLE and isinstance(conn, sqlitecloud.Connection):
+        # One command with several statements is one request; the server
+        # answers with the result of the last one
+        script = ';\n'.join(_inline_parameters(sql, parameters) for sql, parameters in statements)
+        return conn.execute(script).fetchall()
+    rows = []
+    for sql, parameters in statements:
+        rows = conn.execute(sql, parameters).fetchall()
+    return rows
+
+class StatementBatch:
+    """Statements of one unit of work, sent to the database in a single request.
+    
+    Over a remote connection every execute() is a network round trip, so a
+    chain of small statements costs one round trip each. Statements queued
+    with add() go out together with BEGIN IMMEDIATE when run() is called,
+    which returns the rows of the last one. Later statements can't use
+    Python values read by earlier ones: dependencies are written in SQL
+    (subqueries, changes()) and the last statement is a SELECT or a
+    RETURNING clause giving what the caller needs. When that isn't enough,
+    run() again: the next request continues the same transaction. Use
+    through get_db_batch().
+    """
+    
+    def __init__(self, conn):
+        self.conn = conn
+        self.statements = []
+        self.begun = False
+    
+    def add(self, sql, parameters=()):
+        self.statements.append((sql, tuple(parameters)))
+    
+    def run(self):
+        statements = self.statements if self.begun else [('BEGIN IMMEDIATE', ())] + self.statements
+        self.statements = []
+        rows = send_batch(self.conn, statements)
+        self.begun = True
+        return rows
+
+@contextmanager
+def get_db_batch(db_url=None):
+    """Like get_db_transaction, for a StatementBatch: committed on exit, rolled back on error"""
+    batch = StatementBatch(get_db_connection(db_url))
+    try:
+        yield batch
+        batch.conn.commit()
+    except Exception as e:
+        if _is_locked(e):
+            LOCKED_ERRORS.inc()
+        batch.conn.rollback()
+        raise e
+
+def write_returning(sql, parameters=(), audit=None, db_url=None):
+    """Run one INSERT/UPDATE ... RETURNING and its audit entry in a transaction.
+    
+    Returns the first row the statement returned, or None when it wrote
+    nothing (and then no audit entry is written either). audit receives that
+    row and returns the (sql, parameters) of the audit INSERT, usually from
+    models.audit.audit_statement. Three round trips in all: the write, the
+    audit entry and the COMMIT, with no SELECT to rebuild the object.
+    """
+    with get_db_batch(db_url) as batch:
+        batch.add(sql, parameters)
+        rows = batch.run()
+        if rows and audit:
+            batch.add(*audit(rows[0]))
+            batch.run()
+    return rows[0] if rows else None
+
+def init_db(db_url=None, replica_path=None):
+    """Bring the database schema up to date (a single SELECT when already current).
+    
+    With replica_path, reads of the mirrored tables are served from a local
+    copy of the database kept there (see models/replica.py).
+    """
+    from models.migrations import run_migrations
+    global _default_url, _replica
+    _default_url = db_url
     conn = get_db_connection(db_url)
+    primary = getattr(conn, 'primary', conn)
     
-    # Create tables
-    conn.executescript("""
-        -- Users table
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            nome TEXT NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            senha_hash TEXT NOT NULL,
-            perfil TEXT NOT NULL CHECK (perfil IN ('admin', 'medico', 'coordenacao')),
-            especialidade TEXT,
-            ativo BOOLEAN DEFAULT 1,
-            criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-        
-        -- Patients table
-        CREATE TABLE IF NOT EXISTS pacientes (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            nome TEXT NOT NULL,
-            cpf TEXT UNIQUE NOT NULL,
-            data_nascimento DATE NOT NULL,
-            telefone TEXT,
-            local_referencia TEXT,
-            criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-        
-        -- Evaluations table
-        CREATE TABLE IF NOT EXISTS avaliacoes (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            paciente_id INTEGER NOT NULL,
-            medico_id INTEGER NOT NULL,
-            especialidade TEXT NOT NULL,
-            local TEXT NOT NULL,
-            observacoes TEXT,
-            criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (paciente_id) REFERENCES pacientes (id),
-            FOREIGN KEY (medico_id) REFERENCES users (id)
-        );
-        
-        -- Evaluation therapies (many-to-many)
-        CREATE TABLE IF NOT EXISTS avaliacao_terapias (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            avaliacao_id INTEGER NOT NULL,
-            terapia TEXT NOT NULL,
-            FOREIGN KEY (avaliacao_id) REFERENCES avaliacoes (id) ON DELETE CASCADE
-        );
-        
-        -- Procedures table
-        CREATE TABLE IF NOT EXISTS procedimentos (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            paciente_id INTEGER NOT NULL,
-            especialidade TEXT NOT NULL,
-            estado TEXT NOT NULL DEFAULT 'pendente' 
-                CHECK (estado IN ('pendente', 'alocado', 'em_atendimento', 'concluido')),
-            medico_responsavel_id INTEGER,
-            motivo_devolucao TEXT,
-            criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (paciente_id) REFERENCES pacientes (id),
-            FOREIGN KEY (medico_responsavel_id) REFERENCES users (id)
-        );
-        
-        -- Audit log table
-        CREATE TABLE IF NOT EXISTS auditoria (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            acao TEXT NOT NULL,
-            detalhe TEXT,
-            criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        );
-        
-        -- Specialties table
-        CREATE TABLE IF NOT EXISTS especialidades (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            nome TEXT UNIQUE NOT NULL,
-            ativo BOOLEAN DEFAULT 1
-        );
-        
-        -- Locations table
-        CREATE TABLE IF NOT EXISTS locais (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            nome TEXT UNIQUE NOT NULL,
-            ativo BOOLEAN DEFAULT 1
-        );
-    """)
-    
-    # Create indexes for performance
-    conn.executescript("""
-        CREATE INDEX IF NOT EXISTS idx_pacientes_cpf ON pacientes (cpf);
-        CREATE INDEX IF NOT EXISTS idx_pacientes_nome ON pacientes (nome);
-        CREATE INDEX IF NOT EXISTS idx_avaliacoes_paciente ON avaliacoes (paciente_id);
-        CREATE INDEX IF NOT EXISTS idx_avaliacoes_medico ON avaliacoes (medico_id);
-        CREATE INDEX IF NOT EXISTS idx_procedimentos_paciente_especialidade 
-            ON procedimentos (paciente_id, especialidade);
-        CREATE INDEX IF NOT EXISTS idx_procedimentos_estado ON procedimentos (estado);
-        CREATE INDEX IF NOT EXISTS idx_procedimentos_medico ON procedimentos (medico_responsavel_id);
-        CREATE INDEX IF NOT EXISTS idx_auditoria_user ON auditoria (user_id);
-        CREATE INDEX IF NOT EXISTS idx_auditoria_acao ON auditoria (acao);
-    """)
-    
-    conn.commit()
+    # WAL: readers, including online backups, never block writers
+    if not (db_url or '').startswith('sqlitecloud://'):
+        primary.execute('PRAGMA journal_mode=WAL')
+    
+    run_migrations(primary)
+    
+    if _replica is not None:
+        _replica.stop()
+        _replica.close()
+        _replica = None
+        close_db_connection()
+    if replica_path:
+        from models.replica import Replica
+        _replica = Replica(db_url or 'instance/app.db', replica_path)
+        _replica.sync()
+        close_db_connection()  # this thread reconnects through the replica
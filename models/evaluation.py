@@ -1,8 +1,8 @@
 # Sistema de Registro de Avaliações - Clínica TEA
 # Criado por João Layon
 
-from models.database import get_db_connection, get_db_transaction
-from models.audit import log_action
+import json
+from models.database import get_db_connection, get_db_batch
 from datetime import datetime
 
 class Evaluation:
@@ -22,59 +22,70 @@ class Evaluation:
     @classmethod
     def create(cls, paciente_id, medico_id, especialidade, local, observacoes, terapias, user_id=None):
         """Create a new evaluation with therapy recommendations"""
-        with get_db_transaction() as conn:
+        # One request and a fixed number of statements however many therapies
+        # there are: the therapies travel as a JSON array expanded by json_each,
+        # and the new id is read back from sqlite_sequence (nobody else can
+        # insert while BEGIN IMMEDIATE holds the lock)
+        new_id = "(SELECT seq FROM sqlite_sequence WHERE name = 'avaliacoes')"
+        terapias_json = json.dumps(terapias)
+        with get_db_batch() as batch:
             # Create evaluation
-            cursor = conn.execute("""
+            batch.add("""
                 INSERT INTO avaliacoes (paciente_id, medico_id, especialidade, local, observacoes)
                 VALUES (?, ?, ?, ?, ?)
             """, (paciente_id, medico_id, especialidade, local, observacoes))
             
-            evaluation_id = cursor.lastrowid
-            
             # Add therapy recommendations
-            for terapia in terapias:
-                conn.execute("""
-                    INSERT INTO avaliacao_terapias (avaliacao_id, terapia)
-                    VALUES (?, ?)
-                """, (evaluation_id, terapia))
-                
-                # Create or update procedure for this therapy
-                cls._create_or_update_procedure(conn, paciente_id, terapia)
+            batch.add(f"""
+                INSERT INTO avaliacao_terapias (avaliacao_id, terapia)
+                SELECT {new_id}, value FROM json_each(?)
+            """, (terapias_json,))
+            
+            # Open a procedure per therapy, or reopen a concluded one
+            batch.add("""
+                INSERT INTO procedimentos (paciente_id, especialidade, estado)
+                SELECT ?, value, 'pendente' FROM json_each(?) WHERE true
+                ON CONFLICT (paciente_id, especialidade) DO UPDATE
+                SET estado = 'pendente', medico_responsavel_id = NULL,
+                    motivo_devolucao = NULL, atualizado_em = CURRENT_TIMESTAMP
+                WHERE estado = 'concluido'
+            """, (paciente_id, terapias_json))
             
             # Log action
-            patient_name = conn.execute("""
-                SELECT nome FROM pacientes WHERE id = ?
-            """, (paciente_id,)).fetchone()['nome']
+            batch.add("""
+                INSERT INTO auditoria (user_id, acao, detalhe, entidade, entidade_id)
+                SELECT ?, 'evaluation_created', 'Avaliação criada para ' || nome || '. Terapias: ' || ?,
+                       'paciente', id
+                FROM pacientes WHERE id = ?
+            """, (user_id, ", ".join(terapias), paciente_id))
             
-            log_action(user_id, 'evaluation_created', 
-                      f'Avaliação criada para {patient_name}. Terapias: {", ".join(terapias)}')
+            batch.add(f"""
+                SELECT a.*, u.nome as medico_nome, p.nome as paciente_nome
+                FROM avaliacoes a
+                JOIN users u ON a.medico_id = u.id
+                JOIN pacientes p ON a.paciente_id = p.id
+                WHERE a.id = {new_id}
+            """)
+            row = batch.run()[0]
         
-        return cls.get_by_id(evaluation_id)
+        evaluation = cls._from_row(row, list(terapias))
+        evaluation.paciente_nome = row['paciente_nome']
+        return evaluation
     
     @classmethod
-    def _create_or_update_procedure(cls, conn, paciente_id, especialidade):
-        """Create or update procedure for patient and specialty"""
-        # Check if procedure already exists
-        existing = conn.execute("""
-            SELECT id, estado FROM procedimentos 
-            WHERE paciente_id = ? AND especialidade = ?
-        """, (paciente_id, especialidade)).fetchone()
-        
-        if existing:
-            # If procedure exists and is concluded, reset to pending
-            if existing['estado'] == 'concluido':
-                conn.execute("""
-                    UPDATE procedimentos 
-                    SET estado = 'pendente', medico_responsavel_id = NULL, 
-                        motivo_devolucao = NULL, atualizado_em = CURRENT_TIMESTAMP
-                    WHERE id = ?
-                """, (existing['id'],))
-        else:
-            # Create new procedure
-            conn.execute("""
-                INSERT INTO procedimentos (paciente_id, especialidade, estado)
-                VALUES (?, ?, 'pendente')
-            """, (paciente_id, especialidade))
+    def _from_row(cls, row, terapias):
+        evaluation = cls(
+            id=row['id'],
+            paciente_id=row['paciente_id'],
+            medico_id=row['medico_id'],
+            especialidade=row['especialidade'],
+            local=row['local'],
+            observacoes=row['observacoes'],
+            criado_em=row['criado_em'],
+            terapias=terapias
+        )
+        evaluation.medico_nome = row['medico_nome']
+        return evaluation
     
     @classmethod
     def get_by_id(cls, evaluation_id):
@@ -100,19 +111,9 @@ class Evaluation:
         
         terapias = [t['terapia'] for t in therapy_rows]
         
-        evaluation = cls(
-            id=row['id'],
-            paciente_id=row['paciente_id'],
-            medico_id=row['medico_id'],
-            especialidade=row['especialidade'],
-            local=row['local'],
-            observacoes=row['observacoes'],
-            criado_em=row['criado_em'],
-            terapias=terapias
-        )
+        evaluation = cls._from_row(row, terapias)
         
         # Add extra attributes for display
-        evaluation.medico_nome = row['medico_nome']
         evaluation.paciente_nome = row['paciente_nome']
         
         return evaluation
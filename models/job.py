@@ -0,0 +1,244 @@
+# Sistema de Registro de Avaliações - Clínica TEA
+# Criado por João Layon
+
+import json
+from config import Config
+from models.database import get_db_connection, write_returning
+
+# Jobs still to run or running; chave is only unique among these
+_ACTIVE = "('pendente', 'executando')"
+
+class Job:
+    """Background job queued in tarefas and run by services/jobs.py"""
+
+    STATES = {
+        'pendente': 'Na fila',
+        'executando': 'Em execução',
+        'concluido': 'Concluída',
+        'erro': 'Falhou'
+    }
+
+    def __init__(self, id=None, tipo=None, parametros=None, chave=None, estado=None,
+                 progresso=0.0, mensagem=None, resultado=None, erro=None, usuario_id=None,
+                 trabalhador=None, lease_ate=None, tentativas=0, max_tentativas=None,
+                 criado_em=None, iniciado_em=None, concluido_em=None):
+        self.id = id
+        self.tipo = tipo
+        self.parametros = parametros or {}
+        self.chave = chave
+        self.estado = estado
+        self.progresso = progresso
+        self.mensagem = mensagem
+        self.resultado = resultado
+        self.erro = erro
+        self.usuario_id = usuario_id
+        self.trabalhador = trabalhador
+        self.lease_ate = lease_ate
+        self.tentativas = tentativas
+        self.max_tentativas = max_tentativas
+        self.criado_em = criado_em
+        self.iniciado_em = iniciado_em
+        self.concluido_em = concluido_em
+
+    @classmethod
+    def _from_row(cls, row):
+        return cls(
+            id=row['id'],
+            tipo=row['tipo'],
+            parametros=json.loads(row['parametros']),
+            chave=row['chave'],
+            estado=row['estado'],
+            progresso=row['progresso'],
+            mensagem=row['mensagem'],
+            resultado=json.loads(row['resultado']) if row['resultado'] else None,
+            erro=row['erro'],
+            usuario_id=row['usuario_id'],
+            trabalhador=row['trabalhador'],
+            lease_ate=row['lease_ate'],
+            tentativas=row['tentativas'],
+            max_tentativas=row['max_tentativas'],
+            criado_em=row['criado_em'],
+            iniciado_em=row['iniciado_em'],
+            concluido_em=row['concluido_em']
+        )
+
+    @classmethod
+    def enqueue(cls, tipo, parametros=None, usuario_id=None, chave=None):
+        """Queue a job; with chave, returns the queued or running job with that key instead of a new one"""
+        row = write_returning(f"""
+            INSERT INTO tarefas (tipo, parametros, chave, usuario_id, max_tentativas)
+            SELECT ?, ?, ?, ?, ?
+            WHERE ? IS NULL OR NOT EXISTS (
+                SELECT 1 FROM tarefas WHERE chave = ? AND estado IN {_ACTIVE}
+            )
+            RETURNING *
+        """, (tipo, json.dumps(parametros or {}), chave, usuario_id, Config.JOB_MAX_ATTEMPTS,
+              chave, chave))
+        if row:
+            return cls._from_row(row)
+        return cls.get_active(chave)
+
+    @classmethod
+    def get_by_id(cls, job_id):
+        """Get job by ID"""
+        conn = get_db_connection()
+        row = conn.execute("SELECT * FROM tarefas WHERE id = ?", (job_id,)).fetchone()
+        return cls._from_row(row) if row else None
+
+    @classmethod
+    def get_active(cls, chave):
+        """The queued or running job with this key, if any"""
+        conn = get_db_connection()
+        row = conn.execute(f"""
+            SELECT * FROM tarefas WHERE chave = ? AND estado IN {_ACTIVE}
+            ORDER BY id DESC LIMIT 1
+        """, (chave,)).fetchone()
+        return cls._from_row(row) if row else None
+
+    @classmethod
+    def get_latest(cls, tipo):
+        """The newest job of this type, whatever its state"""
+        conn = get_db_connection()
+        row = conn.execute("SELECT * FROM tarefas WHERE tipo = ? ORDER BY id DESC LIMIT 1",
+                           (tipo,)).fetchone()
+        return cls._from_row(row) if row else None
+
+    @classmethod
+    def get_recent(cls, usuario_id=None, limit=50):
+        """Latest jobs, newest first, optionally only those of one user"""
+        conn = get_db_connection()
+        if usuario_id is None:
+            rows = conn.execute("SELECT * FROM tarefas ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        else:
+            rows = conn.execute("""
+                SELECT * FROM tarefas WHERE usuario_id = ? ORDER BY id DESC LIMIT ?
+            """, (usuario_id, limit)).fetchall()
+        return [cls._from_row(row) for row in rows]
+
+    @staticmethod
+    def count_by_state():
+        """{estado: number of jobs} over the whole table"""
+        conn = get_db_connection()
+        rows = conn.execute("SELECT estado, COUNT(*) FROM tarefas GROUP BY estado").fetchall()
+        counts = dict.fromkeys(Job.STATES, 0)
+        counts.update((row[0], row[1]) for row in rows)
+        return counts
+
+    @classmethod
+    def claim(cls, trabalhador, lease_seconds):
+        """Take the oldest runnable job for trabalhador, or None when the queue is empty.
+
+        Runnable means queued, or running under a lease that expired (its
+        worker died); those come back with one more attempt, and the ones that
+        already used all their attempts are marked as failed instead. The
+        transaction starts with BEGIN IMMEDIATE, so two workers never take the
+        same job.
+        """
+        conn = get_db_connection()
+        conn.execute("""
+            UPDATE tarefas
+            SET estado = 'erro', erro = 'A tarefa foi interrompida e excedeu o número de tentativas',
+                trabalhador = NULL, concluido_em = CURRENT_TIMESTAMP
+            WHERE estado = 'executando' AND lease_ate < CURRENT_TIMESTAMP
+              AND tentativas >= max_tentativas
+        """)
+        conn.commit()
+
+        row = write_returning("""
+            UPDATE tarefas
+            SET estado = 'executando', trabalhador = ?, lease_ate = datetime('now', ?),
+                tentativas = tentativas + 1,
+                iniciado_em = COALESCE(iniciado_em, CURRENT_TIMESTAMP)
+            WHERE id = (
+                SELECT id FROM tarefas
+                WHERE estado = 'pendente'
+                   OR (estado = 'executando' AND lease_ate < CURRENT_TIMESTAMP)
+                ORDER BY id
+                LIMIT 1
+            )
+            RETURNING *
+        """, (trabalhador, f'+{int(lease_seconds)} seconds'))
+        return cls._from_row(row) if row else None
+
+    @staticmethod
+    def renew(job_id, trabalhador, lease_seconds, progresso=None, mensagem=None):
+        """Extend the lease (and record progress); False when the job is no longer this worker's"""
+        conn = get_db_connection()
+        cursor = conn.execute("""
+            UPDATE tarefas
+            SET lease_ate = datetime('now', ?),
+                progresso = COALESCE(?, progresso),
+                mensagem = COALESCE(?, mensagem)
+            WHERE id = ? AND trabalhador = ? AND estado = 'executando'
+        """, (f'+{int(lease_seconds)} seconds', progresso, mensagem, job_id, trabalhador))
+        conn.commit()
+        return cursor.rowcount > 0
+
+    @staticmethod
+    def finish(job_id, trabalhador, resultado=None, mensagem=None):
+        """Mark the job done; False when another worker took it over meanwhile"""
+        conn = get_db_connection()
+        cursor = conn.execute("""
+            UPDATE tarefas
+            SET estado = 'concluido', progresso = 1, resultado = ?,
+                mensagem = COALESCE(?, mensagem), lease_ate = NULL,
+                concluido_em = CURRENT_TIMESTAMP
+            WHERE id = ? AND trabalhador = ? AND estado = 'executando'
+        """, (json.dumps(resultado) if resultado is not None else None, mensagem,
+              job_id, trabalhador))
+        conn.commit()
+        return cursor.rowcount > 0
+
+    @staticmethod
+    def fail(job_id, trabalhador, erro):
+        """Mark the job failed (errors raised by the job itself are not retried)"""
+        conn = get_db_connection()
+        cursor = conn.execute("""
+            UPDATE tarefas
+            SET estado = 'erro', erro = ?, lease_ate = NULL, concluido_em = CURRENT_TIMESTAMP
+            WHERE id = ? AND trabalhador = ? AND estado = 'executando'
+        """, (erro, job_id, trabalhador))
+        conn.commit()
+        return cursor.rowcount > 0
+
+    @staticmethod
+    def purge_finished(days):
+        """Delete jobs that finished more than days ago; returns how many"""
+        conn = get_db_connection()
+        cursor = conn.execute("""
+            DELETE FROM tarefas
+            WHERE estado IN ('concluido', 'erro') AND concluido_em < datetime('now', ?)
+        """, (f'-{int(days)} days',))
+        conn.commit()
+        return cursor.rowcount
+
+    @property
+    def active(self):
+        """Still queued or running"""
+        return self.estado in ('pendente', 'executando')
+
+    @property
+    def arquivo(self):
+        """Path of the file the job produced, if any"""
+        return (self.resultado or {}).get('arquivo')
+
+    def get_state_display(self):
+        """Get human-readable state"""
+        return self.STATES.get(self.estado, self.estado)
+
+    def to_dict(self):
+        """Status fields for the JSON API"""
+        return {
+            'id': self.id,
+            'tipo': self.tipo,
+            'estado': self.estado,
+            'estado_display': self.get_state_display(),
+            'progresso': self.progresso,
+            'mensagem': self.mensagem,
+            'erro': self.erro,
+            'tentativas': self.tentativas,
+            'arquivo': bool(self.arquivo),
+            'criado_em': self.criado_em,
+            'iniciado_em': self.iniciado_em,
+            'concluido_em': self.concluido_em
+        }
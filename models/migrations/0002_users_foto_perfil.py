@@ -0,0 +1,9 @@
+# Sistema de Registro de Avaliações - Clínica TEA
+# Criado por João Layon
+
+"""Add users.foto_perfil (some deployments already added it by hand)"""
+
+def upgrade(conn):
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(users)").fetchall()]
+    if 'foto_perfil' not in columns:
+        conn.execute("ALTER TABLE users ADD COLUMN foto_perfil TEXT")
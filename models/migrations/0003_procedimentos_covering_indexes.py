@@ -0,0 +1,29 @@
+# Sistema de Registro de Avaliações - Clínica TEA
+# Criado por João Layon
+
+"""
+Indexes for the distribution center and procedure statistics
+
+- idx_procedimentos_distribuicao matches the ORDER BY of
+  Procedure.get_for_distribution, so the open-procedure listing is read in
+  index order with no temp B-tree sort. It is partial (estado != 'concluido'),
+  so concluded procedures, which only accumulate, don't bloat it.
+- idx_procedimentos_especialidade_estado covers get_statistics_by_specialty.
+- idx_procedimentos_medico_estado covers get_statistics_by_doctor and makes
+  idx_procedimentos_medico (its prefix) redundant.
+"""
+
+from models.migrations import run_statements
+
+def upgrade(conn):
+    run_statements(conn, """
+        CREATE INDEX IF NOT EXISTS idx_procedimentos_distribuicao
+            ON procedimentos (especialidade, estado, atualizado_em)
+            WHERE estado != 'concluido';
+        CREATE INDEX IF NOT EXISTS idx_procedimentos_especialidade_estado
+            ON procedimentos (especialidade, estado);
+        CREATE INDEX IF NOT EXISTS idx_procedimentos_medico_estado
+            ON procedimentos (medico_responsavel_id, estado);
+        DROP INDEX IF EXISTS idx_procedimentos_medico;
+        ANALYZE procedimentos;
+    """)
@@ -0,0 +1,37 @@
+# Sistema de Registro de Avaliações - Clínica TEA
+# Criado por João Layon
+
+"""
+Full-text index over patient names for the typeahead picker
+
+External-content FTS5 table (no duplicated text) kept in sync by triggers.
+unicode61 with remove_diacritics folds case and accents, so "joao sil"
+finds "João Silva" through token-prefix queries.
+"""
+
+from models.migrations import run_statements
+
+def upgrade(conn):
+    run_statements(conn, """
+        CREATE VIRTUAL TABLE IF NOT EXISTS pacientes_fts USING fts5(
+            nome,
+            content='pacientes',
+            content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        );
+        
+        CREATE TRIGGER IF NOT EXISTS pacientes_fts_ai AFTER INSERT ON pacientes BEGIN
+            INSERT INTO pacientes_fts (rowid, nome) VALUES (new.id, new.nome);
+        END;
+        
+        CREATE TRIGGER IF NOT EXISTS pacientes_fts_ad AFTER DELETE ON pacientes BEGIN
+            INSERT INTO pacientes_fts (pacientes_fts, rowid, nome) VALUES ('delete', old.id, old.nome);
+        END;
+        
+        CREATE TRIGGER IF NOT EXISTS pacientes_fts_au AFTER UPDATE OF nome ON pacientes BEGIN
+            INSERT INTO pacientes_fts (pacientes_fts, rowid, nome) VALUES ('delete', old.id, old.nome);
+            INSERT INTO pacientes_fts (rowid, nome) VALUES (new.id, new.nome);
+        END;
+        
+        INSERT INTO pacientes_fts (pacientes_fts) VALUES ('rebuild');
+    """)
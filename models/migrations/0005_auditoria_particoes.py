@@ -0,0 +1,44 @@
+# Sistema de Registro de Avaliações - Clínica TEA
+# Criado por João Layon
+
+"""
+Monthly partitions and maintained counts for the audit log
+
+- auditoria keeps the hot months; the archiver (models.audit) moves older
+  rows into rollover tables auditoria_YYYYMM, listed in auditoria_particoes
+  with their row counts.
+- auditoria_contadores holds the live table's row count, kept by triggers,
+  so paging never needs a COUNT(*) over the whole log.
+- idx_auditoria_criado lets the archiver and date-range queries find rows by
+  criado_em without a table scan.
+"""
+
+from models.migrations import run_statements
+
+def upgrade(conn):
+    run_statements(conn, """
+        CREATE INDEX IF NOT EXISTS idx_auditoria_criado ON auditoria (criado_em);
+
+        CREATE TABLE IF NOT EXISTS auditoria_particoes (
+            mes TEXT PRIMARY KEY,
+            tabela TEXT NOT NULL UNIQUE,
+            linhas INTEGER NOT NULL DEFAULT 0,
+            arquivado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+
+        CREATE TABLE IF NOT EXISTS auditoria_contadores (
+            chave TEXT PRIMARY KEY,
+            valor INTEGER NOT NULL DEFAULT 0
+        );
+
+        INSERT OR REPLACE INTO auditoria_contadores (chave, valor)
+            VALUES ('auditoria', (SELECT COUNT(*) FROM auditoria));
+
+        CREATE TRIGGER IF NOT EXISTS auditoria_contagem_ai AFTER INSERT ON auditoria BEGIN
+            UPDATE auditoria_contadores SET valor = valor + 1 WHERE chave = 'auditoria';
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS auditoria_contagem_ad AFTER DELETE ON auditoria BEGIN
+            UPDATE auditoria_contadores SET valor = valor - 1 WHERE chave = 'auditoria';
+        END;
+    """)
@@ -0,0 +1,65 @@
+# Sistema de Registro de Avaliações - Clínica TEA
+# Criado por João Layon
+
+"""
+Search, entity columns and facet rollups for the audit log
+
+- entidade/entidade_id record which record an action touched (paciente,
+  usuario, ...), indexed on the live table and on every partition.
+- auditoria_busca is a regular FTS5 table over detalhe keyed by the audit id.
+  It keeps its own copy of the text, so rows stay searchable after the
+  archiver moves them to auditoria_YYYYMM; retention deletes their entries.
+- auditoria_resumo holds per day/acao/user counts, maintained by a trigger,
+  for the facet sidebar and filtered counts. user_id 0 stands for "Sistema".
+"""
+
+from models.migrations import run_statements
+
+def _add_entity_columns(conn, table):
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})").fetchall()]
+    if 'entidade' not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN entidade TEXT")
+    if 'entidade_id' not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN entidade_id INTEGER")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_entidade ON {table} (entidade, entidade_id)")
+
+def upgrade(conn):
+    partitions = [row[0] for row in conn.execute("SELECT tabela FROM auditoria_particoes").fetchall()]
+    for table in ['auditoria'] + partitions:
+        _add_entity_columns(conn, table)
+
+    run_statements(conn, """
+        CREATE VIRTUAL TABLE IF NOT EXISTS auditoria_busca USING fts5(
+            detalhe,
+            tokenize='unicode61 remove_diacritics 2'
+        );
+
+        CREATE TABLE IF NOT EXISTS auditoria_resumo (
+            dia TEXT NOT NULL,
+            acao TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            total INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (dia, acao, user_id)
+        ) WITHOUT ROWID;
+
+        CREATE INDEX IF NOT EXISTS idx_auditoria_resumo_acao ON auditoria_resumo (acao, dia);
+        CREATE INDEX IF NOT EXISTS idx_auditoria_resumo_user ON auditoria_resumo (user_id, dia);
+
+        CREATE TRIGGER IF NOT EXISTS auditoria_busca_ai AFTER INSERT ON auditoria BEGIN
+            INSERT INTO auditoria_busca (rowid, detalhe) VALUES (new.id, new.detalhe);
+            INSERT INTO auditoria_resumo (dia, acao, user_id, total)
+                VALUES (date(new.criado_em), new.acao, COALESCE(new.user_id, 0), 1)
+                ON CONFLICT (dia, acao, user_id) DO UPDATE SET total = total + 1;
+        END;
+    """)
+
+    for table in ['auditoria'] + partitions:
+        conn.execute(f"""
+            INSERT INTO auditoria_busca (rowid, detalhe) SELECT id, detalhe FROM {table}
+        """)
+        conn.execute(f"""
+            INSERT INTO auditoria_resumo (dia, acao, user_id, total)
+            SELECT date(criado_em), acao, COALESCE(user_id, 0), COUNT(*) FROM {table}
+            GROUP BY 1, 2, 3
+            ON CONFLICT (dia, acao, user_id) DO UPDATE SET total = total + excluded.total
+        """)
@@ -0,0 +1,75 @@
+# Sistema de Registro de Avaliações - Clínica TEA
+# Criado por João Layon
+
+"""
+Change-data-capture log for patients, evaluations and procedures
+
+Triggers append one row to alteracoes per inserted, updated or deleted row,
+in the same transaction as the change. seq is AUTOINCREMENT, so it only
+grows and is never reused after compaction. dados holds the new row image
+as JSON (the old key columns for deletes).
+
+alteracoes_consumidores stores each consumer's checkpoint (last seq read);
+alteracoes_meta records how far retention has discarded entries, so a
+consumer that fell behind it knows it must resync.
+"""
+
+from models.migrations import run_statements
+
+# Columns captured per table; the first one after id links the row to its parent
+TABLES = {
+    'pacientes': ['id', 'nome', 'cpf', 'data_nascimento', 'telefone', 'local_referencia', 'criado_em'],
+    'avaliacoes': ['id', 'paciente_id', 'medico_id', 'especialidade', 'local', 'observacoes', 'criado_em'],
+    'avaliacao_terapias': ['id', 'avaliacao_id', 'terapia'],
+    'procedimentos': ['id', 'paciente_id', 'especialidade', 'estado', 'medico_responsavel_id',
+                      'motivo_devolucao', 'criado_em', 'atualizado_em'],
+}
+
+def _row_json(alias, columns):
+    return 'json_object(' + ', '.join(f"'{column}', {alias}.{column}" for column in columns) + ')'
+
+def upgrade(conn):
+    run_statements(conn, """
+        CREATE TABLE IF NOT EXISTS alteracoes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            tabela TEXT NOT NULL,
+            operacao TEXT NOT NULL CHECK (operacao IN ('I', 'U', 'D')),
+            registro_id INTEGER NOT NULL,
+            dados TEXT,
+            criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_alteracoes_registro ON alteracoes (tabela, registro_id);
+
+        CREATE TABLE IF NOT EXISTS alteracoes_consumidores (
+            nome TEXT PRIMARY KEY,
+            posicao INTEGER NOT NULL DEFAULT 0,
+            atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+
+        CREATE TABLE IF NOT EXISTS alteracoes_meta (
+            chave TEXT PRIMARY KEY,
+            valor INTEGER NOT NULL
+        );
+
+        INSERT OR IGNORE INTO alteracoes_meta (chave, valor) VALUES ('descartado_ate', 0);
+    """)
+
+    for table, columns in TABLES.items():
+        key_columns = columns[:2] if table != 'pacientes' else columns[:1]
+        run_statements(conn, f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_cdc_ai AFTER INSERT ON {table} BEGIN
+                INSERT INTO alteracoes (tabela, operacao, registro_id, dados)
+                VALUES ('{table}', 'I', new.id, {_row_json('new', columns)});
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS {table}_cdc_au AFTER UPDATE ON {table} BEGIN
+                INSERT INTO alteracoes (tabela, operacao, registro_id, dados)
+                VALUES ('{table}', 'U', new.id, {_row_json('new', columns)});
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS {table}_cdc_ad AFTER DELETE ON {table} BEGIN
+                INSERT INTO alteracoes (tabela, operacao, registro_id, dados)
+                VALUES ('{table}', 'D', old.id, {_row_json('old', key_columns)});
+            END;
+        """)
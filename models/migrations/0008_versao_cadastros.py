@@ -0,0 +1,41 @@
+# Sistema de Registro de Avaliações - Clínica TEA
+# Criado por João Layon
+
+"""
+Version counter for users, specialties and locations
+
+Listing and report pages are validated with a data version (see
+utils/conditional.py). Patients, evaluations and procedures are already
+versioned by the change log sequence; this counter covers the lookup tables
+those pages also render (doctor names, specialty and location lists). Only
+columns that show up on pages bump it, so password or photo changes don't.
+"""
+
+from models.migrations import run_statements
+
+def upgrade(conn):
+    run_statements(conn, """
+        CREATE TABLE IF NOT EXISTS versoes_dados (
+            chave TEXT PRIMARY KEY,
+            valor INTEGER NOT NULL
+        );
+
+        INSERT OR IGNORE INTO versoes_dados (chave, valor) VALUES ('cadastros', 0);
+    """)
+
+    for table, columns in (('users', 'nome, email, perfil, especialidade, ativo'),
+                           ('especialidades', 'nome, ativo'),
+                           ('locais', 'nome, ativo')):
+        run_statements(conn, f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_versao_ai AFTER INSERT ON {table} BEGIN
+                UPDATE versoes_dados SET valor = valor + 1 WHERE chave = 'cadastros';
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS {table}_versao_au AFTER UPDATE OF {columns} ON {table} BEGIN
+                UPDATE versoes_dados SET valor = valor + 1 WHERE chave = 'cadastros';
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS {table}_versao_ad AFTER DELETE ON {table} BEGIN
+                UPDATE versoes_dados SET valor = valor + 1 WHERE chave = 'cadastros';
+            END;
+        """)
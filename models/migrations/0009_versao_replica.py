@@ -0,0 +1,32 @@
+# Sistema de Registro de Avaliações - Clínica TEA
+# Criado por João Layon
+
+"""
+Version counter for the local read replica
+
+The replica (models/replica.py) copies users, specialties and locations
+whole whenever this counter moves. Unlike 'cadastros' (migration 0008) it
+counts every column, so password, photo and e-mail changes reach the copy.
+"""
+
+from models.migrations import run_statements
+
+def upgrade(conn):
+    run_statements(conn, """
+        INSERT OR IGNORE INTO versoes_dados (chave, valor) VALUES ('replica', 0);
+    """)
+
+    for table in ('users', 'especialidades', 'locais'):
+        run_statements(conn, f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_replica_ai AFTER INSERT ON {table} BEGIN
+                UPDATE versoes_dados SET valor = valor + 1 WHERE chave = 'replica';
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS {table}_replica_au AFTER UPDATE ON {table} BEGIN
+                UPDATE versoes_dados SET valor = valor + 1 WHERE chave = 'replica';
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS {table}_replica_ad AFTER DELETE ON {table} BEGIN
+                UPDATE versoes_dados SET valor = valor + 1 WHERE chave = 'replica';
+            END;
+        """)
@@ -0,0 +1,33 @@
+# Sistema de Registro de Avaliações - Clínica TEA
+# Criado por João Layon
+
+"""
+One procedure per patient and specialty
+
+Evaluation.create has always meant to keep a single procedure per
+(paciente_id, especialidade), but only checked with a SELECT, so concurrent
+evaluations could leave duplicates. Duplicates are collapsed onto the row
+that matters for distribution (an open procedure over a concluded one, then
+the most recently updated) and idx_procedimentos_paciente_especialidade
+becomes UNIQUE, which also lets Evaluation.create upsert on it.
+"""
+
+from models.migrations import run_statements
+
+def upgrade(conn):
+    run_statements(conn, """
+        DELETE FROM procedimentos WHERE id IN (
+            SELECT id FROM (
+                SELECT id, ROW_NUMBER() OVER (
+                    PARTITION BY paciente_id, especialidade
+                    ORDER BY estado = 'concluido', atualizado_em DESC, id DESC
+                ) AS posicao
+                FROM procedimentos
+            )
+            WHERE posicao > 1
+        );
+
+        DROP INDEX IF EXISTS idx_procedimentos_paciente_especialidade;
+        CREATE UNIQUE INDEX idx_procedimentos_paciente_especialidade
+            ON procedimentos (paciente_id, especialidade);
+    """)
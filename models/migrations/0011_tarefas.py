@@ -0,0 +1,45 @@
+# Sistema de Registro de Avaliações - Clínica TEA
+# Criado por João Layon
+
+"""
+Background jobs table
+
+Heavy admin operations (patient reset, CSV exports, the PDF report) are
+queued here by the request and run by the job worker processes
+(services/jobs.py). A worker claims a job by setting trabalhador and a lease
+(lease_ate) and keeps extending it while running; a job whose lease expired
+belongs to a worker that died and is claimed again, up to max_tentativas.
+chave identifies identical requests, so a report asked for twice while the
+first is still queued or running is generated once.
+"""
+
+from models.migrations import run_statements
+
+def upgrade(conn):
+    run_statements(conn, """
+        CREATE TABLE IF NOT EXISTS tarefas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tipo TEXT NOT NULL,
+            parametros TEXT NOT NULL DEFAULT '{}',
+            chave TEXT,
+            estado TEXT NOT NULL DEFAULT 'pendente'
+                CHECK (estado IN ('pendente', 'executando', 'concluido', 'erro')),
+            progresso REAL NOT NULL DEFAULT 0,
+            mensagem TEXT,
+            resultado TEXT,
+            erro TEXT,
+            usuario_id INTEGER,
+            trabalhador TEXT,
+            lease_ate TIMESTAMP,
+            tentativas INTEGER NOT NULL DEFAULT 0,
+            max_tentativas INTEGER NOT NULL DEFAULT 3,
+            criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            iniciado_em TIMESTAMP,
+            concluido_em TIMESTAMP,
+            FOREIGN KEY (usuario_id) REFERENCES users (id)
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_tarefas_fila ON tarefas (estado, id);
+        CREATE INDEX IF NOT EXISTS idx_tarefas_chave ON tarefas (chave) WHERE chave IS NOT NULL;
+        CREATE INDEX IF NOT EXISTS idx_tarefas_usuario ON tarefas (usuario_id, id);
+    """)
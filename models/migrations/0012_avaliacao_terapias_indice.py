@@ -0,0 +1,19 @@
+# Sistema de Registro de Avaliações - Clínica TEA
+# Criado por João Layon
+
+"""
+Index avaliacao_terapias by evaluation
+
+avaliacao_terapias is always reached through avaliacao_id (the evaluation's
+therapies, the ON DELETE CASCADE from avaliacoes, the chunked patient purge
+in services/purge.py), but only had its primary key, so each of those was a
+full scan of the table.
+"""
+
+from models.migrations import run_statements
+
+def upgrade(conn):
+    run_statements(conn, """
+        CREATE INDEX IF NOT EXISTS idx_avaliacao_terapias_avaliacao
+            ON avaliacao_terapias (avaliacao_id);
+    """)
@@ -0,0 +1,94 @@
+# Sistema de Registro de Avaliações - Clínica TEA
+# Criado por João Layon
+
+"""
+Versioned schema migrations
+Each migration is a module named NNNN_description.py in this package that
+exposes upgrade(conn). Applied versions are recorded in schema_version, so
+startup costs a single SELECT when the schema is already current.
+"""
+
+import importlib
+import logging
+import os
+import re
+import sqlite3
+
+logger = logging.getLogger(__name__)
+
+_MIGRATION_FILE = re.compile(r'^(\d{4})_(\w+)\.py$')
+
+def discover_migrations():
+    """List available migrations as (version, name), ordered by version"""
+    migrations = []
+    for filename in os.listdir(os.path.dirname(__file__)):
+        match = _MIGRATION_FILE.match(filename)
+        if match:
+            migrations.append((int(match.group(1)), match.group(2)))
+    return sorted(migrations)
+
+def get_schema_version(conn):
+    """Highest applied migration version (0 on a fresh database)"""
+    try:
+        row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    except Exception:
+        return 0
+    return row[0] or 0
+
+def run_statements(conn, script):
+    """Execute a multi-statement SQL script inside the current transaction.
+
+    Unlike executescript(), this does not COMMIT before running, so a
+    migration either applies completely or not at all.
+    """
+    statement = ''
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            conn.execute(statement)
+            statement = ''
+    if statement.strip():
+        conn.execute(statement)
+
+def run_migrations(conn):
+    """Apply pending migrations in order; returns how many were applied"""
+    migrations = discover_migrations()
+    current = get_schema_version(conn)
+    if not migrations or current >= migrations[-1][0]:
+        return 0
+    
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            nome TEXT NOT NULL,
+            aplicado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.commit()
+    
+    applied = 0
+    for version, name in migrations:
+        if version <= current:
+            continue
+        
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Another worker may have applied it while we waited for the lock
+            if get_schema_version(conn) >= version:
+                conn.rollback()
+                continue
+            
+            module = importlib.import_module(f'{__name__}.{version:04d}_{name}')
+            module.upgrade(conn)
+            conn.execute("""
+                INSERT INTO schema_version (version, nome) VALUES (?, ?)
+            """, (version, name))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        
+        logger.info("Migração aplicada: %04d_%s", version, name)
+        applied += 1
+    
+    return applied
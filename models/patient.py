@@ -1,8 +1,8 @@
 # Sistema de Registro de Avaliações - Clínica TEA
 # Criado por João Layon
 
-from models.database import get_db_connection
-from models.audit import log_action
+from models.database import get_db_connection, write_returning
+from models.audit import audit_statement
 import re
 
 class Patient:
@@ -57,27 +57,33 @@ class Patient:
         # Clean CPF
         clean_cpf = re.sub(r'\D', '', cpf)
         
-        conn = get_db_connection()
-        
-        # Check if CPF already exists
-        existing = conn.execute("""
-            SELECT id FROM pacientes WHERE cpf = ?
-        """, (clean_cpf,)).fetchone()
-        
-        if existing:
-            raise ValueError("CPF já cadastrado no sistema")
-        
-        cursor = conn.execute("""
+        # The CPF check is part of the INSERT: no row comes back when it's taken
+        row = write_returning("""
             INSERT INTO pacientes (nome, cpf, data_nascimento, telefone, local_referencia)
-            VALUES (?, ?, ?, ?, ?)
-        """, (nome, clean_cpf, data_nascimento, telefone, local_referencia))
+            SELECT ?, ?, ?, ?, ?
+            WHERE NOT EXISTS (SELECT 1 FROM pacientes WHERE cpf = ?)
+            RETURNING *
+        """, (nome, clean_cpf, data_nascimento, telefone, local_referencia, clean_cpf),
+            audit=lambda row: audit_statement(user_id, 'patient_created',
+                                              f'Paciente cadastrado: {nome} (CPF: {clean_cpf})',
+                                              'paciente', row['id']))
         
-        conn.commit()
-        
-        patient = cls.get_by_id(cursor.lastrowid)
-        log_action(user_id, 'patient_created', f'Paciente cadastrado: {nome} (CPF: {clean_cpf})')
+        if row is None:
+            raise ValueError("CPF já cadastrado no sistema")
         
-        return patient
+        return cls._from_row(row)
+    
+    @classmethod
+    def _from_row(cls, row):
+        return cls(
+            id=row['id'],
+            nome=row['nome'],
+            cpf=row['cpf'],
+            data_nascimento=row['data_nascimento'],
+            telefone=row['telefone'],
+            local_referencia=row['local_referencia'],
+            criado_em=row['criado_em']
+        )
     
     @classmethod
     def get_by_id(cls, patient_id):
@@ -88,15 +94,7 @@ class Patient:
         """, (patient_id,)).fetchone()
         
         if row:
-            return cls(
-                id=row['id'],
-                nome=row['nome'],
-                cpf=row['cpf'],
-                data_nascimento=row['data_nascimento'],
-                telefone=row['telefone'],
-                local_referencia=row['local_referencia'],
-                criado_em=row['criado_em']
-            )
+            return cls._from_row(row)
         return None
     
     @classmethod
@@ -109,15 +107,7 @@ class Patient:
         """, (clean_cpf,)).fetchone()
         
         if row:
-            return cls(
-                id=row['id'],
-                nome=row['nome'],
-                cpf=row['cpf'],
-                data_nascimento=row['data_nascimento'],
-                telefone=row['telefone'],
-                local_referencia=row['local_referencia'],
-                criado_em=row['criado_em']
-            )
+            return cls._from_row(row)
         return None
     
     @classmethod
@@ -150,6 +140,63 @@ class Patient:
             criado_em=row['criado_em']
         ) for row in rows]
     
+    @classmethod
+    def find_by_name_prefix(cls, prefix, limit=5):
+        """Find patients whose name starts with prefix (range scan on idx_pacientes_nome)"""
+        if not prefix:
+            return []
+
+        conn = get_db_connection()
+        rows = conn.execute("""
+            SELECT * FROM pacientes
+            WHERE nome >= ? AND nome < ?
+            ORDER BY nome
+            LIMIT ?
+        """, (prefix, prefix + '\uffff', limit)).fetchall()
+
+        return [cls(
+            id=row['id'],
+            nome=row['nome'],
+            cpf=row['cpf'],
+            data_nascimento=row['data_nascimento'],
+            telefone=row['telefone'],
+            local_referencia=row['local_referencia'],
+            criado_em=row['criado_em']
+        ) for row in rows]
+
+    @classmethod
+    def typeahead(cls, query, limit=10):
+        """Compact (id, nome, masked CPF) tuples for the patient picker.
+        
+        Digits search the CPF prefix (unique index); text does a token-prefix
+        match on pacientes_fts, ignoring case and accents.
+        """
+        conn = get_db_connection()
+        digits = re.sub(r'\D', '', query or '')
+        
+        if digits and digits == re.sub(r'[\s.\-]', '', query):
+            rows = conn.execute("""
+                SELECT id, nome, cpf FROM pacientes
+                WHERE cpf >= ? AND cpf < ?
+                ORDER BY cpf
+                LIMIT ?
+            """, (digits, digits + ':', limit)).fetchall()
+        else:
+            tokens = re.findall(r'\w+', query or '')
+            if not tokens:
+                return []
+            match = ' '.join(f'"{token}"*' for token in tokens)
+            rows = conn.execute("""
+                SELECT p.id, p.nome, p.cpf
+                FROM pacientes_fts f
+                JOIN pacientes p ON p.id = f.rowid
+                WHERE pacientes_fts MATCH ?
+                ORDER BY p.nome
+                LIMIT ?
+            """, (match, limit)).fetchall()
+        
+        return [(row['id'], row['nome'], cls.mask_cpf(row['cpf'])) for row in rows]
+    
     @classmethod
     def count_all(cls):
         """Count all patients"""
@@ -159,8 +206,6 @@ class Patient:
     
     def update(self, nome=None, telefone=None, local_referencia=None, user_id=None):
         """Update patient information"""
-        conn = get_db_connection()
-        
         if nome:
             self.nome = nome
         if telefone is not None:
@@ -168,14 +213,14 @@ class Patient:
         if local_referencia:
             self.local_referencia = local_referencia
         
-        conn.execute("""
+        write_returning("""
             UPDATE pacientes 
             SET nome = ?, telefone = ?, local_referencia = ?
             WHERE id = ?
-        """, (self.nome, self.telefone, self.local_referencia, self.id))
-        
-        conn.commit()
-        log_action(user_id, 'patient_updated', f'Paciente atualizado: {self.nome}')
+            RETURNING id
+        """, (self.nome, self.telefone, self.local_referencia, self.id),
+            audit=lambda row: audit_statement(user_id, 'patient_updated', f'Paciente atualizado: {self.nome}',
+                                              'paciente', self.id))
     
     def get_evaluations(self):
         """Get all evaluations for this patient"""
@@ -187,6 +232,13 @@ class Patient:
         from models.procedure import Procedure
         return Procedure.get_by_patient_id(self.id)
     
+    @staticmethod
+    def mask_cpf(cpf):
+        """Mask CPF for listings, keeping only the middle digits"""
+        if cpf and len(cpf) == 11:
+            return f"***.{cpf[3:6]}.{cpf[6:9]}-**"
+        return '***'
+    
     def format_cpf(self):
         """Format CPF for display"""
         if self.cpf and len(self.cpf) == 11:
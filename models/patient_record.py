@@ -0,0 +1,79 @@
+# Sistema de Registro de Avaliações - Clínica TEA
+# Criado por João Layon
+
+import json
+from models.database import get_db_connection
+from models.patient import Patient
+from models.evaluation import Evaluation
+from models.procedure import Procedure
+
+# Everything the patient page shows, in one statement whatever the history
+# size: evaluations (with their therapies) and procedures come back as JSON
+# arrays built by json_group_array. json() keeps the nested arrays as JSON
+# instead of quoted text. SQLite doesn't promise that an aggregate keeps the
+# order of its subquery, so load() sorts the decoded arrays.
+_SELECT_RECORD = """
+    SELECT p.*,
+           (SELECT json_group_array(json_object(
+                       'id', a.id, 'paciente_id', a.paciente_id, 'medico_id', a.medico_id,
+                       'especialidade', a.especialidade, 'local', a.local,
+                       'observacoes', a.observacoes, 'criado_em', a.criado_em,
+                       'medico_nome', a.medico_nome, 'terapias', json(a.terapias)))
+            FROM (SELECT av.*, u.nome as medico_nome,
+                         (SELECT json_group_array(t.terapia) FROM avaliacao_terapias t
+                          WHERE t.avaliacao_id = av.id) as terapias
+                  FROM avaliacoes av
+                  JOIN users u ON av.medico_id = u.id
+                  WHERE av.paciente_id = p.id) a) as avaliacoes,
+           (SELECT json_group_array(json_object(
+                       'id', pr.id, 'paciente_id', pr.paciente_id, 'especialidade', pr.especialidade,
+                       'estado', pr.estado, 'medico_responsavel_id', pr.medico_responsavel_id,
+                       'motivo_devolucao', pr.motivo_devolucao, 'criado_em', pr.criado_em,
+                       'atualizado_em', pr.atualizado_em, 'medico_nome', pr.medico_nome))
+            FROM (SELECT pc.*, u.nome as medico_nome
+                  FROM procedimentos pc
+                  LEFT JOIN users u ON pc.medico_responsavel_id = u.id
+                  WHERE pc.paciente_id = p.id) pr) as procedimentos
+    FROM pacientes p
+    WHERE p.id = ?
+"""
+
+class PatientRecord:
+    """A patient with their evaluations and procedures, loaded in a single query.
+
+    For pages and services that show the whole history (patient detail, the
+    assistant); Patient.get_evaluations() and get_procedures() cost one query
+    per evaluation on top.
+    """
+
+    def __init__(self, patient, evaluations, procedures):
+        self.patient = patient
+        self.evaluations = evaluations
+        self.procedures = procedures
+
+    @classmethod
+    def load(cls, patient_id):
+        """Load the record, or None when the patient doesn't exist"""
+        conn = get_db_connection()
+        row = conn.execute(_SELECT_RECORD, (patient_id,)).fetchone()
+        if not row:
+            return None
+
+        patient = Patient._from_row(row)
+        # Newest evaluation first; procedures by specialty, latest change first
+        evaluation_items = sorted(json.loads(row['avaliacoes']),
+                                  key=lambda item: (item['criado_em'] or '', item['id']), reverse=True)
+        procedure_items = sorted(json.loads(row['procedimentos']),
+                                 key=lambda item: item['atualizado_em'] or '', reverse=True)
+        procedure_items.sort(key=lambda item: item['especialidade'])
+
+        evaluations = [Evaluation._from_row(item, item['terapias']) for item in evaluation_items]
+        procedures = []
+        for item in procedure_items:
+            item['paciente_nome'] = patient.nome
+            procedures.append(Procedure._from_row(item))
+
+        for evaluation in evaluations:
+            evaluation.paciente_nome = patient.nome
+
+        return cls(patient, evaluations, procedures)
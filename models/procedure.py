@@ -1,8 +1,15 @@
 # Sistema de Registro de Avaliações - Clínica TEA
 # Criado por João Layon
 
-from models.database import get_db_connection, get_db_transaction
-from models.audit import log_action
+from models.database import get_db_connection, get_db_batch
+
+_SELECT_BY_ID = """
+    SELECT p.*, pac.nome as paciente_nome, u.nome as medico_nome
+    FROM procedimentos p
+    JOIN pacientes pac ON p.paciente_id = pac.id
+    LEFT JOIN users u ON p.medico_responsavel_id = u.id
+    WHERE p.id = ?
+"""
 
 class Procedure:
     """Procedure model for managing therapy procedures"""
@@ -27,29 +34,24 @@ class Procedure:
     def get_by_id(cls, procedure_id):
         """Get procedure by ID"""
         conn = get_db_connection()
-        row = conn.execute("""
-            SELECT p.*, pac.nome as paciente_nome, u.nome as medico_nome
-            FROM procedimentos p
-            JOIN pacientes pac ON p.paciente_id = pac.id
-            LEFT JOIN users u ON p.medico_responsavel_id = u.id
-            WHERE p.id = ?
-        """, (procedure_id,)).fetchone()
-        
-        if row:
-            procedure = cls(
-                id=row['id'],
-                paciente_id=row['paciente_id'],
-                especialidade=row['especialidade'],
-                estado=row['estado'],
-                medico_responsavel_id=row['medico_responsavel_id'],
-                motivo_devolucao=row['motivo_devolucao'],
-                criado_em=row['criado_em'],
-                atualizado_em=row['atualizado_em']
-            )
-            procedure.paciente_nome = row['paciente_nome']
-            procedure.medico_nome = row['medico_nome']
-            return procedure
-        return None
+        row = conn.execute(_SELECT_BY_ID, (procedure_id,)).fetchone()
+        return cls._from_row(row) if row else None
+    
+    @classmethod
+    def _from_row(cls, row):
+        procedure = cls(
+            id=row['id'],
+            paciente_id=row['paciente_id'],
+            especialidade=row['especialidade'],
+            estado=row['estado'],
+            medico_responsavel_id=row['medico_responsavel_id'],
+            motivo_devolucao=row['motivo_devolucao'],
+            criado_em=row['criado_em'],
+            atualizado_em=row['atualizado_em']
+        )
+        procedure.paciente_nome = row['paciente_nome']
+        procedure.medico_nome = row['medico_nome']
+        return procedure
     
     @classmethod
     def get_by_patient_id(cls, paciente_id):
@@ -81,10 +83,8 @@ class Procedure:
         return procedures
     
     @classmethod
-    def get_for_distribution(cls, filters=None):
-        """Get procedures for distribution center"""
-        conn = get_db_connection()
-        
+    def _distribution_conditions(cls, filters):
+        """WHERE conditions and parameters shared by the distribution center queries"""
         where_conditions = ["p.estado != 'concluido'"]
         params = []
         
@@ -101,6 +101,19 @@ class Procedure:
                 where_conditions.append("p.medico_responsavel_id = ?")
                 params.append(filters['medico_id'])
         
+        return where_conditions, params
+    
+    @classmethod
+    def _from_distribution_row(cls, row):
+        procedure = cls._from_row(row)
+        procedure.paciente_cpf = row['paciente_cpf']
+        return procedure
+    
+    @classmethod
+    def get_for_distribution(cls, filters=None):
+        """Get procedures for distribution center"""
+        conn = get_db_connection()
+        where_conditions, params = cls._distribution_conditions(filters)
         where_clause = " AND ".join(where_conditions)
         
         rows = conn.execute(f"""
@@ -113,102 +126,199 @@ class Procedure:
             ORDER BY p.especialidade, p.estado, p.atualizado_em
         """, params).fetchall()
         
-        procedures = []
+        return [cls._from_distribution_row(row) for row in rows]
+    
+    @classmethod
+    def iter_for_distribution(cls, filters=None, batch_size=500):
+        """get_for_distribution in the same order, fetched batch_size rows at a time.
+        
+        Each batch continues after the last (especialidade, estado,
+        atualizado_em, id) seen, so memory stays bounded however many
+        procedures there are (used by the PDF report).
+        """
+        conn = get_db_connection()
+        after = None
+        while True:
+            where_conditions, params = cls._distribution_conditions(filters)
+            if after:
+                where_conditions.append("(p.especialidade, p.estado, p.atualizado_em, p.id) > (?, ?, ?, ?)")
+                params += list(after)
+            
+            rows = conn.execute(f"""
+                SELECT p.*, pac.nome as paciente_nome, pac.cpf as paciente_cpf,
+                       u.nome as medico_nome
+                FROM procedimentos p
+                JOIN pacientes pac ON p.paciente_id = pac.id
+                LEFT JOIN users u ON p.medico_responsavel_id = u.id
+                WHERE {" AND ".join(where_conditions)}
+                ORDER BY p.especialidade, p.estado, p.atualizado_em, p.id
+                LIMIT ?
+            """, params + [batch_size]).fetchall()
+            
+            for row in rows:
+                yield cls._from_distribution_row(row)
+            if len(rows) < batch_size:
+                return
+            last = rows[-1]
+            after = (last['especialidade'], last['estado'], last['atualizado_em'], last['id'])
+    
+    @classmethod
+    def count_for_distribution(cls, filters=None):
+        """Open procedures per specialty and state: {especialidade: {estado: total}}"""
+        conn = get_db_connection()
+        where_conditions, params = cls._distribution_conditions(filters)
+        
+        rows = conn.execute(f"""
+            SELECT p.especialidade, p.estado, COUNT(*) as total
+            FROM procedimentos p
+            WHERE {" AND ".join(where_conditions)}
+            GROUP BY p.especialidade, p.estado
+        """, params).fetchall()
+        
+        counts = {}
         for row in rows:
-            procedure = cls(
-                id=row['id'],
-                paciente_id=row['paciente_id'],
-                especialidade=row['especialidade'],
-                estado=row['estado'],
-                medico_responsavel_id=row['medico_responsavel_id'],
-                motivo_devolucao=row['motivo_devolucao'],
-                criado_em=row['criado_em'],
-                atualizado_em=row['atualizado_em']
-            )
-            procedure.paciente_nome = row['paciente_nome']
-            procedure.paciente_cpf = row['paciente_cpf']
-            procedure.medico_nome = row['medico_nome']
-            procedures.append(procedure)
+            counts.setdefault(row['especialidade'], {})[row['estado']] = row['total']
+        return counts
+    
+    @classmethod
+    def get_distribution_windows(cls, filters=None, per_group=20):
+        """The first per_group procedures of every (specialty, state) kanban group.
         
-        return procedures
+        Groups are ordered like get_for_distribution (oldest update first, then
+        id), so get_distribution_page can continue each one from its last card.
+        """
+        conn = get_db_connection()
+        where_conditions, params = cls._distribution_conditions(filters)
+        
+        rows = conn.execute(f"""
+            SELECT p.*, pac.nome as paciente_nome, pac.cpf as paciente_cpf,
+                   u.nome as medico_nome
+            FROM (
+                SELECT p.id, ROW_NUMBER() OVER (
+                    PARTITION BY p.especialidade, p.estado ORDER BY p.atualizado_em, p.id
+                ) as posicao
+                FROM procedimentos p
+                WHERE {" AND ".join(where_conditions)}
+            ) janela
+            JOIN procedimentos p ON p.id = janela.id
+            JOIN pacientes pac ON p.paciente_id = pac.id
+            LEFT JOIN users u ON p.medico_responsavel_id = u.id
+            WHERE janela.posicao <= ?
+            ORDER BY p.especialidade, p.estado, p.atualizado_em, p.id
+        """, params + [per_group]).fetchall()
+        
+        windows = {}
+        for row in rows:
+            windows.setdefault((row['especialidade'], row['estado']), []).append(
+                cls._from_distribution_row(row))
+        return windows
     
     @classmethod
-    def pull_to_doctor(cls, procedure_id, medico_id, especialidade_medico, user_id=None):
-        """Pull procedure to doctor with exclusive locking"""
-        with get_db_transaction() as conn:
-            # Check if procedure exists and is available
-            procedure_row = conn.execute("""
-                SELECT p.*, pac.nome as paciente_nome
+    def get_distribution_page(cls, especialidade, estado, after=None, limit=20, filters=None):
+        """Procedures of one kanban group following the (atualizado_em, id) cursor after"""
+        conn = get_db_connection()
+        where_conditions, params = cls._distribution_conditions(filters)
+        where_conditions += ["p.especialidade = ?", "p.estado = ?"]
+        params += [especialidade, estado]
+        if after:
+            where_conditions.append("(p.atualizado_em, p.id) > (?, ?)")
+            params += list(after)
+        
+        rows = conn.execute(f"""
+            SELECT p.*, pac.nome as paciente_nome, pac.cpf as paciente_cpf,
+                   u.nome as medico_nome
+            FROM procedimentos p
+            JOIN pacientes pac ON p.paciente_id = pac.id
+            LEFT JOIN users u ON p.medico_responsavel_id = u.id
+            WHERE {" AND ".join(where_conditions)}
+            ORDER BY p.atualizado_em, p.id
+            LIMIT ?
+        """, params + [limit]).fetchall()
+        
+        return [cls._from_distribution_row(row) for row in rows]
+    
+    @classmethod
+    def _transition(cls, procedure_id, update, params, acao, detalhe, detalhe_params, user_id):
+        """Run update on the procedure, audit it if it changed the row, and read it back.
+        
+        One request: the audit INSERT only happens when the UPDATE changed the
+        row, and changes() in the final SELECT tells whether the audit row (and
+        so the update) went in. Returns (row after the update or None, applied).
+        """
+        with get_db_batch() as batch:
+            batch.add(update, params)
+            
+            # Log action
+            batch.add(f"""
+                INSERT INTO auditoria (user_id, acao, detalhe, entidade, entidade_id)
+                SELECT ?, ?, {detalhe}, 'paciente', p.paciente_id
                 FROM procedimentos p
                 JOIN pacientes pac ON p.paciente_id = pac.id
-                WHERE p.id = ?
-            """, (procedure_id,)).fetchone()
+                WHERE p.id = ? AND changes() > 0
+            """, (user_id, acao) + tuple(detalhe_params) + (procedure_id,))
             
-            if not procedure_row:
+            batch.add("""
+                SELECT changes() as aplicado, p.*, pac.nome as paciente_nome, u.nome as medico_nome
+                FROM procedimentos p
+                JOIN pacientes pac ON p.paciente_id = pac.id
+                LEFT JOIN users u ON p.medico_responsavel_id = u.id
+                WHERE p.id = ?
+            """, (procedure_id,))
+            rows = batch.run()
+        
+        # Nothing was written when the update didn't apply, so the commit is a no-op
+        row = rows[0] if rows else None
+        return row, bool(row and row['aplicado'])
+    
+    @classmethod
+    def pull_to_doctor(cls, procedure_id, medico_id, especialidade_medico, user_id=None):
+        """Pull procedure to doctor with exclusive locking"""
+        # Only pending procedures of the doctor's specialty, and only if the
+        # patient isn't already allocated for that specialty
+        row, applied = cls._transition(procedure_id, """
+            UPDATE procedimentos 
+            SET estado = 'alocado', medico_responsavel_id = ?, 
+                motivo_devolucao = NULL, atualizado_em = CURRENT_TIMESTAMP
+            WHERE id = ? AND estado = 'pendente' AND especialidade = ?
+            AND NOT EXISTS (
+                SELECT 1 FROM procedimentos o
+                WHERE o.paciente_id = procedimentos.paciente_id AND o.especialidade = ?
+                AND o.estado IN ('alocado', 'em_atendimento') AND o.id != procedimentos.id
+            )
+        """, (medico_id, procedure_id, especialidade_medico, especialidade_medico),
+            'procedure_pulled', "'Procedimento puxado: ' || pac.nome || ' - ' || ?",
+            (especialidade_medico,), user_id)
+        
+        if not applied:
+            if not row:
                 raise ValueError("Procedimento não encontrado")
-            
-            if procedure_row['estado'] not in ['pendente']:
+            if row['estado'] not in ['pendente']:
                 raise ValueError("Procedimento não está disponível para alocação")
-            
-            # Check if doctor specialty matches procedure
-            if procedure_row['especialidade'] != especialidade_medico:
+            if row['especialidade'] != especialidade_medico:
                 raise ValueError("Especialidade do médico não corresponde ao procedimento")
-            
-            # Check for existing allocation to same specialty
-            existing = conn.execute("""
-                SELECT id FROM procedimentos 
-                WHERE paciente_id = ? AND especialidade = ? 
-                AND estado IN ('alocado', 'em_atendimento')
-            """, (procedure_row['paciente_id'], especialidade_medico)).fetchone()
-            
-            if existing and existing['id'] != procedure_id:
-                raise ValueError("Paciente já alocado para outro médico desta especialidade")
-            
-            # Allocate procedure to doctor
-            conn.execute("""
-                UPDATE procedimentos 
-                SET estado = 'alocado', medico_responsavel_id = ?, 
-                    motivo_devolucao = NULL, atualizado_em = CURRENT_TIMESTAMP
-                WHERE id = ?
-            """, (medico_id, procedure_id))
-            
-            # Log action
-            log_action(user_id, 'procedure_pulled', 
-                      f'Procedimento puxado: {procedure_row["paciente_nome"]} - {especialidade_medico}')
+            raise ValueError("Paciente já alocado para outro médico desta especialidade")
         
-        return cls.get_by_id(procedure_id)
+        return cls._from_row(row)
     
     @classmethod
     def release_from_doctor(cls, procedure_id, motivo, user_id=None):
         """Release procedure from doctor"""
-        with get_db_transaction() as conn:
-            # Get procedure info
-            procedure_row = conn.execute("""
-                SELECT p.*, pac.nome as paciente_nome
-                FROM procedimentos p
-                JOIN pacientes pac ON p.paciente_id = pac.id
-                WHERE p.id = ?
-            """, (procedure_id,)).fetchone()
-            
-            if not procedure_row:
+        row, applied = cls._transition(procedure_id, """
+            UPDATE procedimentos 
+            SET estado = 'pendente', medico_responsavel_id = NULL, 
+                motivo_devolucao = ?, atualizado_em = CURRENT_TIMESTAMP
+            WHERE id = ? AND estado IN ('alocado', 'em_atendimento')
+        """, (motivo, procedure_id),
+            'procedure_released',
+            "'Procedimento liberado: ' || pac.nome || ' - ' || p.especialidade || '. Motivo: ' || ?",
+            (motivo,), user_id)
+        
+        if not applied:
+            if not row:
                 raise ValueError("Procedimento não encontrado")
-            
-            if procedure_row['estado'] not in ['alocado', 'em_atendimento']:
-                raise ValueError("Procedimento não está alocado")
-            
-            # Release procedure
-            conn.execute("""
-                UPDATE procedimentos 
-                SET estado = 'pendente', medico_responsavel_id = NULL, 
-                    motivo_devolucao = ?, atualizado_em = CURRENT_TIMESTAMP
-                WHERE id = ?
-            """, (motivo, procedure_id))
-            
-            # Log action
-            log_action(user_id, 'procedure_released', 
-                      f'Procedimento liberado: {procedure_row["paciente_nome"]} - {procedure_row["especialidade"]}. Motivo: {motivo}')
+            raise ValueError("Procedimento não está alocado")
         
-        return cls.get_by_id(procedure_id)
+        return cls._from_row(row)
     
     @classmethod
     def update_state(cls, procedure_id, new_state, user_id=None):
@@ -217,30 +327,19 @@ class Procedure:
         if new_state not in valid_states:
             raise ValueError("Estado inválido")
         
-        with get_db_transaction() as conn:
-            # Get procedure info
-            procedure_row = conn.execute("""
-                SELECT p.*, pac.nome as paciente_nome
-                FROM procedimentos p
-                JOIN pacientes pac ON p.paciente_id = pac.id
-                WHERE p.id = ?
-            """, (procedure_id,)).fetchone()
-            
-            if not procedure_row:
-                raise ValueError("Procedimento não encontrado")
-            
-            # Update state
-            conn.execute("""
-                UPDATE procedimentos 
-                SET estado = ?, atualizado_em = CURRENT_TIMESTAMP
-                WHERE id = ?
-            """, (new_state, procedure_id))
-            
-            # Log action
-            log_action(user_id, 'procedure_state_updated', 
-                      f'Estado do procedimento alterado: {procedure_row["paciente_nome"]} - {procedure_row["especialidade"]} para {new_state}')
+        row, applied = cls._transition(procedure_id, """
+            UPDATE procedimentos 
+            SET estado = ?, atualizado_em = CURRENT_TIMESTAMP
+            WHERE id = ?
+        """, (new_state, procedure_id),
+            'procedure_state_updated',
+            "'Estado do procedimento alterado: ' || pac.nome || ' - ' || p.especialidade || ' para ' || ?",
+            (new_state,), user_id)
+        
+        if not applied:
+            raise ValueError("Procedimento não encontrado")
         
-        return cls.get_by_id(procedure_id)
+        return cls._from_row(row)
     
     @classmethod
     def get_statistics_by_specialty(cls):
@@ -0,0 +1,376 @@
+# Sistema de Registro de Avaliações - Clínica TEA
+# Criado por João Layon
+
+import json
+import logging
+import os
+import re
+import socket
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from config import Config
+from models.change_log import CDC_TABLES, ChangeLogGapError
+
+logger = logging.getLogger(__name__)
+
+# The replica is a local SQLite file with a copy of the tables pages read
+# most. Patients, evaluations and procedures follow the change log (migration
+# 0007) in seq order; users, specialties and locations are small and are
+# copied whole when versoes_dados('replica') moves (migration 0009). The
+# copy's position is (last applied seq, lookup version), kept in
+# replica_estado next to the schema version it was built from.
+#
+# Each thread's connection sends SELECTs that only touch mirrored tables to
+# the copy and everything else (writes, transactions, audit, change log) to
+# the primary. Before a local read the copy is synced if it is older than
+# DATABASE_REPLICA_MAX_STALENESS or behind the position the caller requires.
+#
+# The copy is registered as a change log consumer ('replica:<host>'), so
+# compaction keeps the entries it has not applied yet. seq has no gaps
+# (AUTOINCREMENT, rolled back with its transaction), so a gap in what the
+# primary returns means entries were dropped anyway and the copy is rebuilt.
+
+LOOKUP_TABLES = ('users', 'especialidades', 'locais')
+# Full-text indexes recreated on the copy from their content table
+SEARCH_INDEXES = {'pacientes_fts': 'pacientes'}
+MIRRORED_TABLES = frozenset(CDC_TABLES + LOOKUP_TABLES + tuple(SEARCH_INDEXES))
+
+_READ = re.compile(r'^\s*(?:SELECT|WITH)\b', re.IGNORECASE)
+_TABLE_REF = re.compile(r'\b(?:FROM|JOIN)\s+([A-Za-z_]\w*)', re.IGNORECASE)
+
+_POSITION_SQL = """
+    SELECT (SELECT seq FROM sqlite_sequence WHERE name = 'alteracoes') AS alteracoes,
+           (SELECT valor FROM versoes_dados WHERE chave = 'replica') AS cadastros
+"""
+
+# Connections inherited through fork(), never closed in the child (see
+# models.database.reset_after_fork)
+_inherited = []
+
+@lru_cache(maxsize=1024)
+def is_local_read(sql):
+    """True for a SELECT whose tables are all mirrored (decided once per statement text)"""
+    if not _READ.match(sql):
+        return False
+    tables = {name.lower() for name in _TABLE_REF.findall(sql)}
+    return bool(tables) and tables <= MIRRORED_TABLES
+
+def covers(position, required):
+    """Whether position (seq, version) already includes required"""
+    return position[0] >= required[0] and position[1] >= required[1]
+
+def merge(a, b):
+    return (max(a[0], b[0]), max(a[1], b[1]))
+
+class Replica:
+    """Local copy of the primary database, kept current from the change log"""
+
+    def __init__(self, primary_url, path, max_staleness=None, sync_interval=None):
+        self.primary_url = primary_url
+        self.path = path[10:] if path.startswith('sqlite:///') else path
+        self.max_staleness = Config.DATABASE_REPLICA_MAX_STALENESS if max_staleness is None else max_staleness
+        self.sync_interval = Config.DATABASE_REPLICA_SYNC_INTERVAL if sync_interval is None else sync_interval
+        self.consumer = f'replica:{socket.gethostname()}'
+        self.position = (0, 0)
+        self._synced_at = float('-inf')
+        self._lock = threading.Lock()
+        self._primary = None
+        self._writer = None
+        self._thread = None
+        self._stop = threading.Event()
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+
+    # Connections
+
+    def connect(self):
+        """New per-thread connection routing reads to the copy"""
+        return ReplicaConnection(self)
+
+    def open_reader(self):
+        reader = sqlite3.connect(self.path, check_same_thread=False)
+        reader.row_factory = sqlite3.Row
+        reader.execute('PRAGMA query_only = 1')
+        return reader
+
+    def _primary_connection(self):
+        if self._primary is None:
+            from models.database import open_connection
+            self._primary = open_connection(self.primary_url)
+        return self._primary
+
+    def _writer_connection(self):
+        if self._writer is None:
+            # Autocommit: transactions are opened explicitly with BEGIN IMMEDIATE,
+            # which also serializes syncs of other processes sharing the file
+            self._writer = sqlite3.connect(self.path, check_same_thread=False,
+                                           isolation_level=None, timeout=30)
+            self._writer.row_factory = sqlite3.Row
+            self._writer.execute('PRAGMA journal_mode=WAL')
+            self._writer.execute("""
+                CREATE TABLE IF NOT EXISTS replica_estado (
+                    chave TEXT PRIMARY KEY,
+                    valor INTEGER NOT NULL
+                )
+            """)
+        return self._writer
+
+    def close(self):
+        with self._lock:
+            for conn in (self._primary, self._writer):
+                if conn is not None:
+                    conn.close()
+            self._primary = self._writer = None
+
+    def after_fork(self):
+        """Drop connections, lock and thread inherited from the parent process"""
+        _inherited.append((self._primary, self._writer))
+        self._primary = self._writer = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    # Positions
+
+    def primary_position(self, conn=None):
+        """Current (seq, version) of the primary; pass the connection that just wrote"""
+        row = (conn or self._primary_connection()).execute(_POSITION_SQL).fetchone()
+        return (row['alteracoes'] or 0, row['cadastros'] or 0)
+
+    def is_fresh(self, required=(0, 0)):
+        return (time.monotonic() - self._synced_at <= self.max_staleness
+                and covers(self.position, required))
+
+    def ensure(self, required=(0, 0)):
+        """Sync first when the copy is too old or misses a position the caller needs"""
+        if self.is_fresh(required):
+            return
+        with self._lock:
+            if not self.is_fresh(required):
+                self._sync()
+
+    # Synchronization
+
+    def sync(self):
+        """Bring the copy up to the primary's current position; returns changes applied"""
+        with self._lock:
+            return self._sync()
+
+    def _sync(self):
+        started = time.monotonic()
+        primary = self._primary_connection()
+        target = primary.execute(_POSITION_SQL + """,
+                   (SELECT valor FROM alteracoes_meta WHERE chave = 'descartado_ate') AS descartado,
+                   (SELECT MAX(version) FROM schema_version) AS schema
+        """).fetchone()
+        target_seq, target_version = target['alteracoes'] or 0, target['cadastros'] or 0
+
+        writer = self._writer_connection()
+        writer.execute('BEGIN IMMEDIATE')
+        try:
+            state = {row['chave']: row['valor'] for row in writer.execute("SELECT chave, valor FROM replica_estado")}
+            applied = 0
+            if state.get('schema') != target['schema'] or state.get('alteracoes', 0) < (target['descartado'] or 0):
+                # New copy, migrated primary, or entries we still needed were compacted away
+                self._rebuild(primary, writer)
+                state = {'schema': target['schema'], 'alteracoes': target_seq, 'cadastros': target_version}
+            else:
+                if state['cadastros'] < target_version:
+                    for table in LOOKUP_TABLES:
+                        writer.execute(f"DELETE FROM {table}")
+                        self._copy_table(primary, writer, table)
+                    state['cadastros'] = target_version
+                if state['alteracoes'] < target_seq:
+                    try:
+                        applied = self._apply_changes(primary, writer, state['alteracoes'], target_seq)
+                    except (ChangeLogGapError, sqlite3.IntegrityError) as e:
+                        # Entries compacted away, or rows of one statement colliding
+                        # mid-way (e.g. two swapped CPFs)
+                        logger.warning("Réplica recriada: %s", e)
+                        self._rebuild(primary, writer)
+                        state['cadastros'] = target_version
+                    state['alteracoes'] = target_seq
+
+            writer.executemany("INSERT OR REPLACE INTO replica_estado (chave, valor) VALUES (?, ?)",
+                               list(state.items()))
+            writer.execute('COMMIT')
+        except BaseException:
+            writer.execute('ROLLBACK')
+            raise
+
+        if state['alteracoes'] > self.position[0]:
+            primary.execute("""
+                INSERT INTO alteracoes_consumidores (nome, posicao) VALUES (?, ?)
+                ON CONFLICT (nome) DO UPDATE SET
+                    posicao = MAX(posicao, excluded.posicao), atualizado_em = CURRENT_TIMESTAMP
+            """, (self.consumer, state['alteracoes']))
+            primary.commit()
+        self.position = (state['alteracoes'], state['cadastros'])
+        self._synced_at = started
+        return applied
+
+    def _apply_changes(self, primary, writer, after_seq, until_seq):
+        applied = 0
+        while after_seq < until_seq:
+            rows = primary.execute("""
+                SELECT seq, tabela, operacao, registro_id, dados FROM alteracoes
+                WHERE seq > ? AND seq <= ?
+                ORDER BY seq LIMIT ?
+            """, (after_seq, until_seq, Config.CDC_BATCH_SIZE)).fetchall()
+            if not rows or rows[0]['seq'] != after_seq + 1:
+                raise ChangeLogGapError(f"alterações após {after_seq} já foram descartadas no primário")
+            for row in rows:
+                if row['tabela'] not in CDC_TABLES:
+                    continue
+                if row['operacao'] == 'D':
+                    writer.execute(f"DELETE FROM {row['tabela']} WHERE id = ?", (row['registro_id'],))
+                else:
+                    # Upsert instead of INSERT OR REPLACE so the copy's FTS triggers see an UPDATE
+                    dados = json.loads(row['dados'])
+                    columns = list(dados)
+                    writer.execute(f"""
+                        INSERT INTO {row['tabela']} ({', '.join(columns)})
+                        VALUES ({', '.join('?' for _ in columns)})
+                        ON CONFLICT (id) DO UPDATE SET
+                            {', '.join(f'{column} = excluded.{column}' for column in columns if column != 'id')}
+                    """, [dados[column] for column in columns])
+                applied += 1
+            after_seq = rows[-1]['seq']
+        return applied
+
+    def _rebuild(self, primary, writer):
+        """Recreate the copy from the primary's schema and rows (inside the caller's transaction)"""
+        started = time.perf_counter()
+        for fts in SEARCH_INDEXES:
+            writer.execute(f"DROP TABLE IF EXISTS {fts}")
+        for row in writer.execute("""
+            SELECT name FROM sqlite_master
+            WHERE type = 'table' AND name NOT LIKE 'sqlite_%' AND name != 'replica_estado'
+        """).fetchall():
+            writer.execute(f"DROP TABLE IF EXISTS {row['name']}")
+
+        objects = primary.execute("SELECT type, name, tbl_name, sql FROM sqlite_master WHERE sql IS NOT NULL").fetchall()
+        base_tables = CDC_TABLES + LOOKUP_TABLES
+        for obj in objects:
+            if obj['type'] == 'table' and (obj['name'] in base_tables or obj['name'] in SEARCH_INDEXES):
+                writer.execute(obj['sql'])
+
+        # The caller read the target position before this copy: changes committed
+        # meanwhile are in the copy and get applied again next time, harmlessly
+        for table in base_tables:
+            self._copy_table(primary, writer, table)
+        for fts in SEARCH_INDEXES:
+            writer.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+
+        for obj in objects:
+            if obj['type'] == 'index' and obj['tbl_name'] in base_tables:
+                writer.execute(obj['sql'])
+            elif obj['type'] == 'trigger' and any(obj['name'].startswith(f'{fts}_') for fts in SEARCH_INDEXES):
+                writer.execute(obj['sql'])
+        logger.info("Réplica recriada em %.1f s", time.perf_counter() - started)
+
+    def _copy_table(self, primary, writer, table):
+        cursor = primary.execute(f"SELECT * FROM {table}")
+        columns = [column[0] for column in cursor.description]
+        writer.executemany(f"""
+            INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})
+        """, [tuple(row) for row in cursor.fetchall()])
+
+    # Background sync
+
+    def _loop(self):
+        while not self._stop.wait(self.sync_interval):
+            try:
+                self.sync()
+            except Exception:
+                logger.exception("Falha ao sincronizar a réplica local")
+
+    def start(self):
+        """Pull changes every sync_interval seconds in a daemon thread (one per process)"""
+        if self.sync_interval <= 0 or (self._thread and self._thread.is_alive()):
+            return self._thread
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='replica-sync', daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout)
+
+class ReplicaConnection:
+    """Per-thread connection: mirrored reads from the copy, everything else on the primary.
+
+    Once a statement other than a SELECT runs, reads go to the primary until
+    commit or rollback, so a transaction sees its own changes. A commit that
+    wrote raises `required` to the primary's new position, and later local
+    reads wait for the copy to reach it (read-your-writes).
+    """
+
+    def __init__(self, replica):
+        self.replica = replica
+        self.required = (0, 0)
+        self._primary = None
+        self._reader = replica.open_reader()
+        self._pending = False
+
+    @property
+    def primary(self):
+        if self._primary is None:
+            from models.database import open_connection
+            self._primary = open_connection(self.replica.primary_url)
+        return self._primary
+
+    def position(self):
+        """Position of the data local reads will see (synced first if needed)"""
+        self.replica.ensure(self.required)
+        return self.replica.position
+
+    def execute(self, sql, parameters=()):
+        if not self._pending and is_local_read(sql):
+            self.replica.ensure(self.required)
+            try:
+                return self._reader.execute(sql, parameters)
+            except sqlite3.OperationalError as e:
+                # Copy being recreated by another process: the primary has it
+                if 'no such table' not in str(e):
+                    raise
+        elif not _READ.match(sql):
+            self._pending = True
+        return self.primary.execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._pending = True
+        return self.primary.executemany(sql, seq_of_parameters)
+
+    def execute_batch(self, statements):
+        from models.database import send_batch
+        self._pending = True
+        return send_batch(self.primary, statements)
+
+    def executescript(self, script):
+        self._pending = True
+        return self.primary.executescript(script)
+
+    def commit(self):
+        if self._primary is None:
+            return
+        self._primary.commit()
+        if self._pending:
+            self._pending = False
+            self.required = merge(self.required, self.replica.primary_position(self._primary))
+
+    def rollback(self):
+        if self._primary is not None:
+            self._primary.rollback()
+        self._pending = False
+
+    def close(self):
+        self._reader.close()
+        if self._primary is not None:
+            self._primary.close()
+
+    def __getattr__(self, name):
+        return getattr(self.primary, name)
@@ -1,9 +1,9 @@
 # Sistema de Registro de Avaliações - Clínica TEA
 # Criado por João Layon
 
-from werkzeug.security import generate_password_hash, check_password_hash
-from models.database import get_db_connection
-from models.audit import log_action
+from models.database import get_db_connection, write_returning
+from models.audit import log_action, audit_statement
+from utils.passwords import hash_password, verify_password, needs_rehash, dummy_verify
 
 class User:
     """User model with authentication and authorization"""
@@ -20,20 +20,29 @@ class User:
     @classmethod
     def create(cls, nome, email, senha, perfil, especialidade=None):
         """Create a new user"""
-        conn = get_db_connection()
-        senha_hash = generate_password_hash(senha)
+        senha_hash = hash_password(senha)
         
-        cursor = conn.execute("""
+        row = write_returning("""
             INSERT INTO users (nome, email, senha_hash, perfil, especialidade)
             VALUES (?, ?, ?, ?, ?)
-        """, (nome, email, senha_hash, perfil, especialidade))
-        
-        conn.commit()
+            RETURNING *
+        """, (nome, email, senha_hash, perfil, especialidade),
+            audit=lambda row: audit_statement(None, 'user_created', f'Usuário criado: {nome} ({email})',
+                                              'usuario', row['id']))
         
-        user = cls.get_by_id(cursor.lastrowid)
-        log_action(None, 'user_created', f'Usuário criado: {nome} ({email})')
-        
-        return user
+        return cls._from_row(row)
+    
+    @classmethod
+    def _from_row(cls, row):
+        return cls(
+            id=row['id'],
+            nome=row['nome'],
+            email=row['email'],
+            perfil=row['perfil'],
+            especialidade=row['especialidade'],
+            ativo=row['ativo'],
+            foto_perfil=row['foto_perfil']
+        )
     
     @classmethod
     def get_by_id(cls, user_id):
@@ -44,15 +53,7 @@ class User:
         """, (user_id,)).fetchone()
         
         if row:
-            return cls(
-                id=row['id'],
-                nome=row['nome'],
-                email=row['email'],
-                perfil=row['perfil'],
-                especialidade=row['especialidade'],
-                ativo=row['ativo'],
-                foto_perfil=row['foto_perfil'] if 'foto_perfil' in row.keys() else None
-            )
+            return cls._from_row(row)
         return None
     
     @classmethod
@@ -64,15 +65,7 @@ class User:
         """, (email,)).fetchone()
         
         if row:
-            return cls(
-                id=row['id'],
-                nome=row['nome'],
-                email=row['email'],
-                perfil=row['perfil'],
-                especialidade=row['especialidade'],
-                ativo=row['ativo'],
-                foto_perfil=row['foto_perfil'] if 'foto_perfil' in row.keys() else None
-            )
+            return cls._from_row(row)
         return None
     
     @classmethod
@@ -83,17 +76,19 @@ class User:
             SELECT * FROM users WHERE email = ? AND ativo = 1
         """, (email,)).fetchone()
         
-        if row and check_password_hash(row['senha_hash'], senha):
-            user = cls(
-                id=row['id'],
-                nome=row['nome'],
-                email=row['email'],
-                perfil=row['perfil'],
-                especialidade=row['especialidade'],
-                ativo=row['ativo'],
-                foto_perfil=row['foto_perfil'] if 'foto_perfil' in row.keys() else None
-            )
-            log_action(user.id, 'login', f'Login realizado: {email}')
+        if not row:
+            # Unknown or inactive email: hash anyway so timing doesn't reveal it
+            dummy_verify(senha)
+        elif verify_password(row['senha_hash'], senha):
+            # Transparently upgrade hashes made under an older policy
+            if needs_rehash(row['senha_hash']):
+                conn.execute("""
+                    UPDATE users SET senha_hash = ? WHERE id = ?
+                """, (hash_password(senha), row['id']))
+                conn.commit()
+            
+            user = cls._from_row(row)
+            log_action(user.id, 'login', f'Login realizado: {email}', 'usuario', user.id)
             return user
         
         log_action(None, 'login_failed', f'Tentativa de login falhada: {email}')
@@ -107,15 +102,7 @@ class User:
             SELECT * FROM users WHERE ativo = 1 ORDER BY nome
         """).fetchall()
         
-        return [cls(
-            id=row['id'],
-            nome=row['nome'],
-            email=row['email'],
-            perfil=row['perfil'],
-            especialidade=row['especialidade'],
-            ativo=row['ativo'],
-            foto_perfil=row['foto_perfil'] if 'foto_perfil' in row.keys() else None
-        ) for row in rows]
+        return [cls._from_row(row) for row in rows]
     
     @classmethod
     def get_doctors_by_specialty(cls, especialidade):
@@ -127,20 +114,10 @@ class User:
             ORDER BY nome
         """, (especialidade,)).fetchall()
         
-        return [cls(
-            id=row['id'],
-            nome=row['nome'],
-            email=row['email'],
-            perfil=row['perfil'],
-            especialidade=row['especialidade'],
-            ativo=row['ativo'],
-            foto_perfil=row['foto_perfil'] if 'foto_perfil' in row.keys() else None
-        ) for row in rows]
+        return [cls._from_row(row) for row in rows]
     
     def update(self, nome=None, email=None, perfil=None, especialidade=None, foto_perfil=None):
         """Update user information"""
-        conn = get_db_connection()
-        
         if nome:
             self.nome = nome
         if email:
@@ -152,23 +129,23 @@ class User:
         if foto_perfil is not None:
             self.foto_perfil = foto_perfil
         
-        conn.execute("""
+        write_returning("""
             UPDATE users 
             SET nome = ?, email = ?, perfil = ?, especialidade = ?, foto_perfil = ?
             WHERE id = ?
-        """, (self.nome, self.email, self.perfil, self.especialidade, self.foto_perfil, self.id))
-        
-        conn.commit()
-        log_action(self.id, 'user_updated', f'Usuário atualizado: {self.nome}')
+            RETURNING id
+        """, (self.nome, self.email, self.perfil, self.especialidade, self.foto_perfil, self.id),
+            audit=lambda row: audit_statement(self.id, 'user_updated', f'Usuário atualizado: {self.nome}',
+                                              'usuario', self.id))
     
     def deactivate(self):
         """Deactivate user"""
-        conn = get_db_connection()
-        conn.execute("UPDATE users SET ativo = 0 WHERE id = ?", (self.id,))
-        conn.commit()
+        write_returning("UPDATE users SET ativo = 0 WHERE id = ? RETURNING id", (self.id,),
+                        audit=lambda row: audit_statement(self.id, 'user_deactivated',
+                                                          f'Usuário desativado: {self.nome}',
+                                                          'usuario', self.id))
         
         self.ativo = False
-        log_action(self.id, 'user_deactivated', f'Usuário desativado: {self.nome}')
     
     def is_authenticated(self):
         return True
@@ -201,36 +178,35 @@ class User:
             SELECT senha_hash FROM users WHERE id = ?
         """, (self.id,)).fetchone()
         
-        if not row or not check_password_hash(row['senha_hash'], current_password):
+        if not row or not verify_password(row['senha_hash'], current_password):
             return False, 'Senha atual incorreta'
         
         # Update password
-        new_hash = generate_password_hash(new_password)
-        conn.execute("""
+        new_hash = hash_password(new_password)
+        write_returning("""
             UPDATE users SET senha_hash = ? WHERE id = ?
-        """, (new_hash, self.id))
-        
-        conn.commit()
-        log_action(self.id, 'password_changed', f'Senha alterada para usuário: {self.nome}')
+            RETURNING id
+        """, (new_hash, self.id),
+            audit=lambda row: audit_statement(self.id, 'password_changed',
+                                              f'Senha alterada para usuário: {self.nome}',
+                                              'usuario', self.id))
         
         return True, 'Senha alterada com sucesso'
     
     def update_profile(self, nome=None, foto_perfil=None):
         """Update user profile (nome e foto)"""
-        conn = get_db_connection()
-        
         if nome:
             self.nome = nome
         if foto_perfil is not None:
             self.foto_perfil = foto_perfil
         
-        conn.execute("""
+        write_returning("""
             UPDATE users 
             SET nome = ?, foto_perfil = ?
             WHERE id = ?
-        """, (self.nome, self.foto_perfil, self.id))
-        
-        conn.commit()
-        log_action(self.id, 'profile_updated', f'Perfil atualizado: {self.nome}')
+            RETURNING id
+        """, (self.nome, self.foto_perfil, self.id),
+            audit=lambda row: audit_statement(self.id, 'profile_updated', f'Perfil atualizado: {self.nome}',
+                                              'usuario', self.id))
         
         return True, 'Perfil atualizado com sucesso'
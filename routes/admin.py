@@ -1,10 +1,14 @@
 # Sistema de Registro de Avaliações - Clínica TEA
 # Criado por João Layon
 
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session
+import re
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify, current_app
 from models.user import User
 from models.database import get_db_connection
-from models.audit import get_audit_logs, count_audit_logs
+from models.audit import get_audit_logs, get_audit_facets, ENTITY_LABELS
+from services.backup import BackupError, SnapshotStore, get_backup_job, start_backup_job
+from services.jobs import enqueue_job
+from services.purge import purge_bounds
 from utils.auth import require_login, require_permission
 from utils.helpers import get_specialties, get_locations
 
@@ -15,7 +19,9 @@ admin_bp = Blueprint('admin', __name__)
 @require_permission(['admin'])
 def index():
     """Admin dashboard"""
-    return render_template('admin/index.html')
+    return render_template('admin/index.html',
+                         snapshots=SnapshotStore().list()[:5],
+                         backup_job=get_backup_job())
 
 @admin_bp.route('/usuarios')
 @require_login
@@ -238,66 +244,89 @@ def new_location():
 @require_login
 @require_permission(['admin'])
 def audit():
-    """View audit logs"""
+    """View audit logs with search and facet filters"""
     page = int(request.args.get('page', 1))
     per_page = 50
     offset = (page - 1) * per_page
     
-    logs = get_audit_logs(limit=per_page, offset=offset)
-    total = count_audit_logs()
+    filters = {}
     
-    has_next = offset + per_page < total
+    if request.args.get('q', '').strip():
+        filters['q'] = request.args.get('q').strip()
+    
+    if request.args.get('user_id', '').isdigit():
+        filters['user_id'] = int(request.args.get('user_id'))
+    
+    if request.args.get('acao'):
+        filters['acao'] = request.args.get('acao')
+    
+    if request.args.get('entidade') in ENTITY_LABELS:
+        filters['entidade'] = request.args.get('entidade')
+        if request.args.get('entidade_id', '').isdigit():
+            filters['entidade_id'] = int(request.args.get('entidade_id'))
+    
+    for key in ('data_inicio', 'data_fim'):
+        if re.fullmatch(r'\d{4}-\d{2}-\d{2}', request.args.get(key, '')):
+            filters[key] = request.args.get(key)
+    
+    # One extra row tells whether there is a next page, without counting
+    logs = get_audit_logs(limit=per_page + 1, offset=offset, **filters)
+    
+    has_next = len(logs) > per_page
+    logs = logs[:per_page]
     has_prev = page > 1
     
+    facets = get_audit_facets(user_id=filters.get('user_id'), acao=filters.get('acao'),
+                              data_inicio=filters.get('data_inicio'), data_fim=filters.get('data_fim'))
+    
     return render_template('admin/audit.html',
                          logs=logs,
                          page=page,
                          has_next=has_next,
-                         has_prev=has_prev)
+                         has_prev=has_prev,
+                         filters=filters,
+                         facets=facets,
+                         entity_labels=ENTITY_LABELS)
+
+@admin_bp.route('/backup', methods=['POST'])
+@require_login
+@require_permission(['admin'])
+def backup():
+    """Queue an online snapshot of the database (a backup job)"""
+    try:
+        if start_backup_job(current_app.config['DATABASE_URL'], session.get('user_id')):
+            flash('Backup iniciado. O sistema continua disponível durante a cópia.', 'success')
+        else:
+            flash('Já existe um backup em andamento.', 'warning')
+    except BackupError as e:
+        flash(f'Erro ao iniciar backup: {str(e)}', 'error')
+    
+    return redirect(url_for('admin.index'))
+
+@admin_bp.route('/backup/status')
+@require_login
+@require_permission(['admin'])
+def backup_status():
+    """Progress of the running backup"""
+    return jsonify(get_backup_job())
 
 @admin_bp.route('/reset-pacientes', methods=['POST'])
 @require_login
 @require_permission(['admin'])
 def reset_patients():
-    """Reset patient data while keeping doctors"""
+    """Queue the removal of all patient data (doctors are kept)"""
     confirmation = request.form.get('confirmation', '').strip()
     
     if confirmation != 'CONFIRMO':
         flash('Você deve digitar "CONFIRMO" para confirmar a operação', 'error')
         return redirect(url_for('admin.index'))
     
-    try:
-        conn = get_db_connection()
-        
-        # Start transaction
-        conn.execute('BEGIN')
-        
-        # Delete procedures first (foreign key constraint)
-        conn.execute('DELETE FROM procedimentos')
-        
-        # Delete evaluation therapies (foreign key constraint)
-        conn.execute('DELETE FROM avaliacao_terapias')
-        
-        # Delete evaluations (foreign key constraint)
-        conn.execute('DELETE FROM avaliacoes')
-        
-        # Finally delete patients
-        conn.execute('DELETE FROM pacientes')
-        
-        # Add audit log
-        from models.audit import log_action
-        log_action(
-            user_id=session.get('user_id'),
-            acao='RESET_PACIENTES',
-            detalhe='Administrador resetou todos os dados de pacientes'
-        )
-        
-        conn.commit()
-        
-        flash('Todos os dados de pacientes foram removidos com sucesso! Os médicos foram mantidos.', 'success')
-        
-    except Exception as e:
-        conn.rollback()
-        flash(f'Erro ao resetar dados: {str(e)}', 'error')
-    
-    return redirect(url_for('admin.index'))
+    # Runs in a job worker: the request returns at once and the page follows the progress.
+    # Only patients that exist now are removed (ate_id), even if the job is resumed later.
+    ate_id, total = purge_bounds('pacientes')
+    job = enqueue_job('reset_pacientes',
+                      {'ate_id': ate_id, 'total': total,
+                       'liberar_espaco': request.form.get('liberar_espaco') == '1'},
+                      usuario_id=session.get('user_id'), chave='reset_pacientes')
+    flash('Remoção dos dados de pacientes iniciada. Os médicos serão mantidos.', 'success')
+    return redirect(url_for('jobs.status', id=job.id))
@@ -1,6 +1,6 @@
 from flask import Blueprint, render_template, request, jsonify, session, flash, redirect, url_for
-from utils.auth import require_login
-from services.ai_assistant import AIAssistant
+from utils.auth import require_login, require_permission
+from services.ai_assistant import AIAssistant, get_assistant_stats
 from models.audit import log_action
 
 assistant_bp = Blueprint('assistant', __name__)
@@ -52,6 +52,13 @@ def ask_question():
             'error': f'Erro interno do servidor: {str(e)}'
         }), 500
 
+@assistant_bp.route('/estatisticas')
+@require_login
+@require_permission(['admin'])
+def stats():
+    """Contadores do caminho rápido e do cache de respostas"""
+    return jsonify(get_assistant_stats())
+
 @assistant_bp.route('/examples')
 @require_login  
 def examples():
@@ -4,13 +4,11 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session
 from models.user import User
 from models.audit import log_action
-import time
+from utils.rate_limit import get_login_limiters
+import math
 
 auth_bp = Blueprint('auth', __name__)
 
-# Simple rate limiting in memory
-login_attempts = {}
-
 @auth_bp.route('/login', methods=['GET', 'POST'])
 def login():
     """Login page and handler"""
@@ -18,21 +16,28 @@ def login():
         email = request.form.get('email', '').strip().lower()
         senha = request.form.get('senha', '')
         
-        # Simple rate limiting
-        client_ip = request.environ.get('REMOTE_ADDR', '127.0.0.1')
-        current_time = time.time()
-        
-        if client_ip in login_attempts:
-            attempts, last_attempt = login_attempts[client_ip]
-            if current_time - last_attempt < 60 and attempts >= 5:
-                flash('Muitas tentativas de login. Tente novamente em 1 minuto.', 'error')
-                return render_template('auth/login.html')
-        
         # Validate input
         if not email or not senha:
             flash('Email e senha são obrigatórios', 'error')
             return render_template('auth/login.html')
         
+        # Rate limiting per client IP and per account: the attempt is taken
+        # before the password is checked, so concurrent guesses (in any
+        # worker) can't all slip through on the same remaining token
+        client_ip = request.environ.get('REMOTE_ADDR', '127.0.0.1')
+        ip_limiter, account_limiter = get_login_limiters()
+        
+        taken = []
+        for limiter, key in ((ip_limiter, client_ip), (account_limiter, email)):
+            if not limiter.acquire(key):
+                # Refused attempts don't count against the other bucket
+                for other, other_key in taken:
+                    other.refund(other_key)
+                wait = math.ceil(limiter.retry_after(key))
+                flash(f'Muitas tentativas de login. Tente novamente em {wait} segundos.', 'error')
+                return render_template('auth/login.html')
+            taken.append((limiter, key))
+        
         # Attempt authentication
         user = User.authenticate(email, senha)
         if user:
@@ -41,20 +46,16 @@ def login():
             session['user_perfil'] = user.perfil
             session['user_especialidade'] = user.especialidade
             
-            # Reset login attempts
-            if client_ip in login_attempts:
-                del login_attempts[client_ip]
+            # Reset the account counter and give back this attempt's IP token;
+            # the rest of the IP bucket refills on its own, so a valid login
+            # cannot be used to reset guessing against other accounts
+            account_limiter.reset(email)
+            ip_limiter.refund(client_ip)
             
             flash(f'Bem-vindo(a), {user.nome}!', 'success')
             return redirect(url_for('dashboard.index'))
         else:
-            # Track failed attempt
-            if client_ip not in login_attempts:
-                login_attempts[client_ip] = [0, current_time]
-            
-            attempts, _ = login_attempts[client_ip]
-            login_attempts[client_ip] = [attempts + 1, current_time]
-            
+            # The failed attempt keeps the tokens it took
             flash('Email ou senha incorretos', 'error')
     
     return render_template('auth/login.html')
@@ -6,11 +6,13 @@ from models.patient import Patient
 from models.evaluation import Evaluation
 from models.procedure import Procedure
 from utils.auth import require_login
+from utils.conditional import conditional_get
 
 dashboard_bp = Blueprint('dashboard', __name__)
 
 @dashboard_bp.route('/dashboard')
 @require_login
+@conditional_get(daily=True)
 def index():
     """Main dashboard with metrics"""
     user_perfil = session.get('user_perfil')
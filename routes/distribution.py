@@ -1,21 +1,19 @@
 # Sistema de Registro de Avaliações - Clínica TEA
 # Criado por João Layon
 
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify, current_app
 from models.procedure import Procedure
 from models.user import User
 from utils.auth import require_login, require_permission
+from utils.conditional import conditional_get
 from utils.helpers import get_specialties
 
 distribution_bp = Blueprint('distribution', __name__)
 
-@distribution_bp.route('/')
-@require_login
-def center():
-    """Distribution center view"""
-    view_type = request.args.get('view', 'table')  # table or kanban
-    
-    # Build filters
+KANBAN_STATES = ('pendente', 'alocado', 'em_atendimento')
+
+def _distribution_filters():
+    """Filters from the query string, shared by the page and the kanban card pages"""
     filters = {}
     
     if request.args.get('especialidade'):
@@ -24,28 +22,52 @@ def center():
     if request.args.get('estado'):
         filters['estado'] = request.args.get('estado')
     
-    user_perfil = session.get('user_perfil')
-    user_id = session.get('user_id')
-    
     # If doctor, can see option to filter by their procedures
-    if user_perfil == 'medico' and request.args.get('meus_procedimentos') == '1':
-        filters['medico_id'] = user_id
+    if session.get('user_perfil') == 'medico' and request.args.get('meus_procedimentos') == '1':
+        filters['medico_id'] = session.get('user_id')
     
-    procedures = Procedure.get_for_distribution(filters)
+    return filters
+
+def _cursor(procedure):
+    """Where the next page of a kanban group starts"""
+    return {'depois_em': procedure.atualizado_em, 'depois_id': procedure.id}
+
+def _kanban_columns(filters, page_size):
+    """Kanban columns: per state, the specialty groups with their totals and first cards"""
+    counts = Procedure.count_for_distribution(filters)
+    windows = Procedure.get_distribution_windows(filters, page_size)
+    
+    columns = {state: {'total': 0, 'groups': []} for state in KANBAN_STATES}
+    for especialidade in sorted(counts):
+        for state, total in counts[especialidade].items():
+            if state not in columns:
+                continue
+            cards = windows.get((especialidade, state), [])
+            columns[state]['total'] += total
+            columns[state]['groups'].append({
+                'especialidade': especialidade,
+                'total': total,
+                'cards': cards,
+                'next': _cursor(cards[-1]) if cards and total > len(cards) else None,
+            })
+    return columns
+
+@distribution_bp.route('/')
+@require_login
+@conditional_get()
+def center():
+    """Distribution center view"""
+    view_type = request.args.get('view', 'table')  # table or kanban
+    filters = _distribution_filters()
     
-    # Group by specialty for kanban view
-    procedures_by_specialty = {}
+    # The kanban only renders the first cards of each group; the rest come
+    # from kanban_cards as the columns scroll
+    procedures = []
+    kanban = None
     if view_type == 'kanban':
-        for procedure in procedures:
-            if procedure.especialidade not in procedures_by_specialty:
-                procedures_by_specialty[procedure.especialidade] = {
-                    'pendente': [],
-                    'alocado': [],
-                    'em_atendimento': []
-                }
-            
-            if procedure.estado in procedures_by_specialty[procedure.especialidade]:
-                procedures_by_specialty[procedure.especialidade][procedure.estado].append(procedure)
+        kanban = _kanban_columns(filters, current_app.config['KANBAN_PAGE_SIZE'])
+    else:
+        procedures = Procedure.get_for_distribution(filters)
     
     # Get filter options
     specialties = get_specialties()
@@ -57,12 +79,39 @@ def center():
     
     return render_template('distribution/center.html',
                          procedures=procedures,
-                         procedures_by_specialty=procedures_by_specialty,
+                         kanban=kanban,
                          specialties=specialties,
                          states=states,
                          filters=filters,
                          view_type=view_type)
 
+@distribution_bp.route('/cartoes')
+@require_login
+@conditional_get()
+def kanban_cards():
+    """Next page of one kanban group: rendered cards plus the cursor of the page after"""
+    especialidade = request.args.get('especialidade', '')
+    estado = request.args.get('estado', '')
+    if not especialidade or estado not in KANBAN_STATES:
+        return jsonify({'error': 'Grupo do quadro inválido'}), 400
+    
+    after = None
+    depois_id = request.args.get('depois_id', type=int)
+    if depois_id is not None:
+        after = (request.args.get('depois_em', ''), depois_id)
+    
+    page_size = current_app.config['KANBAN_PAGE_SIZE']
+    # One extra row tells whether another page follows
+    procedures = Procedure.get_distribution_page(especialidade, estado, after, page_size + 1,
+                                                 filters=_distribution_filters())
+    has_more = len(procedures) > page_size
+    procedures = procedures[:page_size]
+    
+    return jsonify({
+        'html': render_template('distribution/_kanban_cards.html', procedures=procedures),
+        'next': _cursor(procedures[-1]) if has_more else None,
+    })
+
 @distribution_bp.route('/puxar', methods=['POST'])
 @require_login
 @require_permission(['medico'])
@@ -11,6 +11,13 @@ from utils.helpers import validate_date, get_specialties, get_locations
 
 evaluations_bp = Blueprint('evaluations', __name__)
 
+def _selected_patient():
+    """Patient preselected by the submitted form or the query string"""
+    patient_id = request.form.get('paciente_id') or request.args.get('paciente_id')
+    if patient_id and patient_id.isdigit():
+        return Patient.get_by_id(int(patient_id))
+    return None
+
 @evaluations_bp.route('/')
 @require_login
 def list():
@@ -98,7 +105,7 @@ def new():
             for error in errors:
                 flash(error, 'error')
             return render_template('evaluations/form.html',
-                                 patients=Patient.search(limit=100),
+                                 selected_patient=_selected_patient(),
                                  specialties=get_specialties(),
                                  locations=get_locations(),
                                  available_therapies=Config.DEFAULT_SPECIALTIES,
@@ -122,14 +129,14 @@ def new():
         except Exception as e:
             flash(f'Erro ao criar avaliação: {str(e)}', 'error')
             return render_template('evaluations/form.html',
-                                 patients=Patient.search(limit=100),
+                                 selected_patient=_selected_patient(),
                                  specialties=get_specialties(),
                                  locations=get_locations(),
                                  available_therapies=Config.DEFAULT_SPECIALTIES,
                                  form_data=request.form)
     
     return render_template('evaluations/form.html',
-                         patients=Patient.search(limit=100),
+                         selected_patient=_selected_patient(),
                          specialties=get_specialties(),
                          locations=get_locations(),
                          available_therapies=Config.DEFAULT_SPECIALTIES)
@@ -0,0 +1,87 @@
+# Sistema de Registro de Avaliações - Clínica TEA
+# Criado por João Layon
+
+import hmac
+import os
+from flask import Blueprint, jsonify, request, session, abort, make_response
+from config import Config
+from models.database import get_db_connection
+from models.migrations import discover_migrations, get_schema_version
+from models.user import User
+from utils import metrics
+
+health_bp = Blueprint('health', __name__)
+
+@health_bp.route('/healthz')
+def liveness():
+    """Liveness probe: the worker is up and answering (no database access)"""
+    response = jsonify({'status': 'ok', 'pid': os.getpid()})
+    response.cache_control.no_store = True
+    return response
+
+@health_bp.route('/readyz')
+def readiness():
+    """Readiness probe: database reachable and schema at the latest migration"""
+    status = {'pid': os.getpid()}
+    try:
+        conn = get_db_connection()
+        status['schema'] = get_schema_version(conn)
+        status['schema_esperado'] = discover_migrations()[-1][0]
+        ready = status['schema'] >= status['schema_esperado']
+    except Exception as e:
+        status['erro'] = str(e)
+        ready = False
+
+    status['status'] = 'ok' if ready else 'indisponivel'
+    response = jsonify(status)
+    response.status_code = 200 if ready else 503
+    response.cache_control.no_store = True
+    return response
+
+def _metrics_allowed():
+    """A scraper with the METRICS_TOKEN bearer token, or a logged-in admin"""
+    auth = request.headers.get('Authorization', '')
+    if Config.METRICS_TOKEN and auth.startswith('Bearer '):
+        return hmac.compare_digest(auth[7:].encode(), Config.METRICS_TOKEN.encode())
+    if session.get('user_perfil') != 'admin':
+        return False
+    user = User.get_by_id(session.get('user_id'))
+    return bool(user and user.is_active() and user.perfil == 'admin')
+
+@health_bp.route('/metrics')
+def metrics_endpoint():
+    """Prometheus scrape target: counters of every worker plus domain gauges"""
+    if not Config.METRICS_ENABLED:
+        abort(404)
+    if not _metrics_allowed():
+        response = make_response('Acesso restrito\n', 401)
+        response.headers['WWW-Authenticate'] = 'Bearer realm="metrics"'
+        return response
+
+    response = make_response(metrics.render())
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    response.cache_control.no_store = True
+    return response
+
+# Gauges read from the database on each scrape
+
+@metrics.register_collector
+def procedure_gauges():
+    from models.procedure import Procedure
+    stats = Procedure.get_statistics_by_specialty()
+    samples = [((especialidade, estado), counts[estado])
+               for especialidade, counts in sorted(stats.items())
+               for estado in ('pendente', 'alocado', 'em_atendimento', 'concluido')]
+    return [('tea_procedimentos', 'Procedimentos por especialidade e estado',
+             ('especialidade', 'estado'), samples)]
+
+@metrics.register_collector
+def queue_gauges():
+    from models.audit import count_archive_backlog
+    from models.job import Job
+    return [
+        ('tea_auditoria_fila_arquivamento', 'Registros de auditoria esperando o arquivamento',
+         (), [((), count_archive_backlog())]),
+        ('tea_tarefas', 'Tarefas em segundo plano por estado',
+         ('estado',), [((estado,), count) for estado, count in Job.count_by_state().items()]),
+    ]
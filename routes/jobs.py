@@ -0,0 +1,66 @@
+# Sistema de Registro de Avaliações - Clínica TEA
+# Criado por João Layon
+
+import os
+from flask import Blueprint, render_template, redirect, url_for, flash, session, jsonify, send_file
+from models.job import Job
+from services.jobs import LABELS
+from utils.auth import require_login
+
+jobs_bp = Blueprint('jobs', __name__)
+
+def _visible_job(id):
+    """The job, if the current user may see it (their own, or any for admins)"""
+    job = Job.get_by_id(id)
+    if job and (session.get('user_perfil') == 'admin' or job.usuario_id == session.get('user_id')):
+        return job
+    return None
+
+@jobs_bp.route('/')
+@require_login
+def index():
+    """Recent background jobs"""
+    usuario_id = None if session.get('user_perfil') == 'admin' else session.get('user_id')
+    return render_template('jobs/index.html', jobs=Job.get_recent(usuario_id), labels=LABELS)
+
+@jobs_bp.route('/<int:id>')
+@require_login
+def status(id):
+    """Progress page of a job; downloads its file when it finishes"""
+    job = _visible_job(id)
+    if not job:
+        flash('Tarefa não encontrada', 'error')
+        return redirect(url_for('jobs.index'))
+
+    return render_template('jobs/status.html', job=job, labels=LABELS)
+
+@jobs_bp.route('/<int:id>/status')
+@require_login
+def status_json(id):
+    """Job status for polling"""
+    job = _visible_job(id)
+    if not job:
+        return jsonify({'erro': 'Tarefa não encontrada'}), 404
+
+    data = job.to_dict()
+    data['tipo_display'] = LABELS.get(job.tipo, job.tipo)
+    data['download'] = url_for('jobs.download', id=job.id) if job.arquivo else None
+    return jsonify(data)
+
+@jobs_bp.route('/<int:id>/arquivo')
+@require_login
+def download(id):
+    """File produced by a finished job"""
+    job = _visible_job(id)
+    if not job or job.estado != 'concluido' or not job.arquivo:
+        flash('Tarefa não encontrada', 'error')
+        return redirect(url_for('jobs.index'))
+
+    # The report cache prune may remove the file at any moment
+    try:
+        return send_file(os.path.abspath(job.arquivo), mimetype=job.resultado.get('mimetype'),
+                         as_attachment=True, download_name=job.resultado.get('nome'),
+                         conditional=True, max_age=0)
+    except FileNotFoundError:
+        flash('O arquivo desta tarefa não está mais disponível. Gere-o novamente.', 'warning')
+        return redirect(url_for('jobs.status', id=job.id))
@@ -1,10 +1,11 @@
 # Sistema de Registro de Avaliações - Clínica TEA
 # Criado por João Layon
 
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify
 from models.patient import Patient
 from models.evaluation import Evaluation
 from models.procedure import Procedure
+from models.patient_record import PatientRecord
 from utils.auth import require_login, require_permission
 from utils.helpers import validate_date
 
@@ -33,6 +34,19 @@ def list():
                          has_next=has_next,
                          has_prev=has_prev)
 
+@patients_bp.route('/busca')
+@require_login
+def typeahead():
+    """Patient picker typeahead: compact [id, nome, masked CPF] rows as JSON"""
+    query = request.args.get('q', '').strip()
+    results = Patient.typeahead(query) if len(query) >= 2 else []
+    
+    response = jsonify({'q': query, 'results': results})
+    response.cache_control.private = True
+    response.cache_control.max_age = 30
+    response.add_etag()
+    return response.make_conditional(request)
+
 @patients_bp.route('/novo', methods=['GET', 'POST'])
 @require_login
 @require_permission(['coordenacao', 'admin', 'medico'])
@@ -93,19 +107,16 @@ def new():
 @require_login
 def detail(id):
     """Patient detail view"""
-    patient = Patient.get_by_id(id)
-    if not patient:
+    # Patient, evaluations and procedures in a single query
+    record = PatientRecord.load(id)
+    if not record:
         flash('Paciente não encontrado', 'error')
         return redirect(url_for('patients.list'))
     
-    # Get patient's evaluations and procedures
-    evaluations = patient.get_evaluations()
-    procedures = patient.get_procedures()
-    
     return render_template('patients/detail.html',
-                         patient=patient,
-                         evaluations=evaluations,
-                         procedures=procedures)
+                         patient=record.patient,
+                         evaluations=record.evaluations,
+                         procedures=record.procedures)
 
 @patients_bp.route('/<int:id>/editar', methods=['GET', 'POST'])
 @require_login
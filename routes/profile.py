@@ -1,26 +1,20 @@
 # Sistema de Registro de Avaliações - Clínica TEA
 # Criado por João Layon
 
-import os
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session
-from werkzeug.utils import secure_filename
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, current_app
+from werkzeug.exceptions import RequestEntityTooLarge
 from utils.auth import require_login, get_current_user
 from models.user import User
+from services.profile_photos import PhotoError, save_upload, queue_thumbnails
 
 profile_bp = Blueprint('profile', __name__)
 
-# Configuration for file uploads
-UPLOAD_FOLDER = 'static/uploads/profile'
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
-
-def allowed_file(filename):
-    """Check if file has allowed extension"""
-    return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
-
-def ensure_upload_folder():
-    """Ensure upload folder exists"""
-    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+@profile_bp.errorhandler(RequestEntityTooLarge)
+def upload_too_large(e):
+    """Request above MAX_CONTENT_LENGTH (the photo upload form)"""
+    limit = current_app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)
+    flash(f'Arquivo muito grande. O envio é limitado a {limit} MB', 'error')
+    return redirect(url_for('profile.edit'))
 
 @profile_bp.route('/')
 @require_login
@@ -51,23 +45,16 @@ def edit():
         if not nome:
             errors.append('Nome é obrigatório')
         
-        # Handle file upload
-        if 'foto_perfil' in request.files:
-            file = request.files['foto_perfil']
-            if file and file.filename and allowed_file(file.filename):
-                ensure_upload_folder()
-                filename = secure_filename(file.filename)
-                # Add user ID to filename to avoid conflicts
-                filename = f"user_{user.id}_{filename}"
-                filepath = os.path.join(UPLOAD_FOLDER, filename)
-                
-                try:
-                    file.save(filepath)
-                    foto_perfil = f"uploads/profile/{filename}"
-                except Exception as e:
-                    errors.append(f'Erro ao fazer upload da foto: {str(e)}')
-            elif file and file.filename and not allowed_file(file.filename):
-                errors.append('Formato de arquivo não permitido. Use PNG, JPG, JPEG ou GIF')
+        # Handle file upload: streamed to disk, thumbnails made in the background
+        photo_original = None
+        file = request.files.get('foto_perfil')
+        if file and file.filename and not errors:
+            try:
+                foto_perfil, photo_original = save_upload(file.stream, current_app.static_folder)
+            except PhotoError as e:
+                errors.append(str(e))
+            except Exception as e:
+                errors.append(f'Erro ao fazer upload da foto: {str(e)}')
         
         if errors:
             for error in errors:
@@ -76,6 +63,8 @@ def edit():
         
         try:
             success, message = user.update_profile(nome=nome, foto_perfil=foto_perfil)
+            if photo_original:
+                queue_thumbnails(photo_original, current_app.static_folder, usuario_id=user.id)
             if success:
                 # Update session data
                 session['user_nome'] = user.nome
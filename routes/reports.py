@@ -1,19 +1,28 @@
 # Sistema de Registro de Avaliações - Clínica TEA
 # Criado por João Layon
 
-from flask import Blueprint, render_template, request, redirect, url_for, flash, make_response, session
+from flask import Blueprint, render_template, request, redirect, url_for, flash, make_response, session, send_file
 from models.procedure import Procedure
 from models.user import User
 from utils.auth import require_login, require_permission
+from utils.conditional import conditional_get, data_version
 from utils.helpers import get_specialties
+from utils.metrics import Counter
+from services.jobs import cached_result_path, enqueue_job
 import csv
 import io
+import os
 from datetime import datetime
 
 reports_bp = Blueprint('reports', __name__)
 
+# Report files served from REPORT_CACHE_DIR (hit) or queued as a job (miss)
+REPORT_CACHE = Counter('tea_report_cache_total', 'Pedidos de relatório por resultado do cache',
+                       ('report', 'result'))
+
 @reports_bp.route('/')
 @require_login
+@conditional_get()
 def index():
     """Reports dashboard"""
     # Get statistics by specialty
@@ -28,6 +37,7 @@ def index():
 
 @reports_bp.route('/especialidades')
 @require_login
+@conditional_get()
 def specialties():
     """Specialty reports"""
     specialty_stats = Procedure.get_statistics_by_specialty()
@@ -37,6 +47,7 @@ def specialties():
 
 @reports_bp.route('/medicos')
 @require_login
+@conditional_get()
 def doctors():
     """Doctor reports"""
     doctor_stats = Procedure.get_statistics_by_doctor()
@@ -46,6 +57,7 @@ def doctors():
 
 @reports_bp.route('/export/especialidades.csv')
 @require_login
+@conditional_get()
 def export_specialties_csv():
     """Export specialty statistics to CSV"""
     specialty_stats = Procedure.get_statistics_by_specialty()
@@ -78,6 +90,7 @@ def export_specialties_csv():
 
 @reports_bp.route('/export/medicos.csv')
 @require_login
+@conditional_get()
 def export_doctors_csv():
     """Export doctor statistics to CSV"""
     doctor_stats = Procedure.get_statistics_by_doctor()
@@ -110,39 +123,17 @@ def export_doctors_csv():
 @reports_bp.route('/export/procedimentos.csv')
 @require_login
 def export_procedures_csv():
-    """Export all procedures to CSV"""
-    procedures = Procedure.get_for_distribution()
-    
-    # Create CSV content
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # Header
-    writer.writerow([
-        'Paciente', 'CPF', 'Especialidade', 'Estado', 
-        'Médico Responsável', 'Criado em', 'Atualizado em', 'Motivo Devolução'
-    ])
-    
-    # Data
-    for procedure in procedures:
-        writer.writerow([
-            procedure.paciente_nome,
-            procedure.paciente_cpf,
-            procedure.especialidade,
-            procedure.get_state_display(),
-            procedure.medico_nome or '',
-            procedure.criado_em,
-            procedure.atualizado_em,
-            procedure.motivo_devolucao or ''
-        ])
-    
-    # Create response
-    output.seek(0)
-    response = make_response(output.getvalue())
-    response.headers['Content-Type'] = 'text/csv; charset=utf-8'
-    response.headers['Content-Disposition'] = 'attachment; filename=relatorio_procedimentos.csv'
-    
-    return response
+    """Export all procedures to CSV (made by a background job, cached per data version)"""
+    path = cached_result_path('procedimentos', 'csv', data_version())
+    response = _send_report(path, 'text/csv', 'relatorio_procedimentos.csv')
+    if response is not None:
+        REPORT_CACHE.inc('procedimentos', 'hit')
+        return response
+    
+    REPORT_CACHE.inc('procedimentos', 'miss')
+    job = enqueue_job('exportar_procedimentos', {'arquivo': path},
+                      usuario_id=session.get('user_id'), chave=os.path.basename(path))
+    return redirect(url_for('jobs.status', id=job.id))
 
 @reports_bp.route('/distribuicao/imprimir')
 @require_login
@@ -156,6 +147,13 @@ def distribution_print():
     if request.args.get('estado'):
         filters['estado'] = request.args.get('estado')
     
+    # Get current user info for the report
+    user_id = session.get('user_id')
+    user_name = session.get('user_nome', 'Administrador')
+    
+    if request.args.get('formato') == 'pdf':
+        return _distribution_pdf(filters, user_name)
+    
     # Get procedures for the report
     procedures = Procedure.get_for_distribution(filters)
     
@@ -170,13 +168,38 @@ def distribution_print():
             })
         }
     
-    # Get current user info for the report
-    user_id = session.get('user_id')
-    user_name = session.get('user_nome', 'Administrador')
-    
     return render_template('reports/distribution_print.html',
                          procedures=procedures,
                          specialty_stats=specialty_stats,
                          filters=filters,
                          current_date=datetime.now(),
                          user_name=user_name)
+
+def _distribution_pdf(filters, user_name):
+    """The distribution report as a PDF made by a background job, cached per data version"""
+    from services.distribution_pdf import report_path
+    
+    path = report_path(filters, user_name, data_version())
+    response = _send_report(path, 'application/pdf', f"distribuicao_{datetime.now().strftime('%Y%m%d')}.pdf")
+    if response is not None:
+        REPORT_CACHE.inc('distribuicao', 'hit')
+        return response
+    
+    REPORT_CACHE.inc('distribuicao', 'miss')
+    job = enqueue_job('relatorio_distribuicao',
+                      {'arquivo': path, 'filtros': filters, 'autor': user_name},
+                      usuario_id=session.get('user_id'), chave=os.path.basename(path))
+    return redirect(url_for('jobs.status', id=job.id))
+
+def _send_report(path, mimetype, download_name):
+    """The report file already generated for the current data, or None when there is none.
+
+    No separate existence check: the cache prune may remove the file at any
+    moment, and once send_file has opened it the download is safe.
+    """
+    try:
+        os.utime(path)  # keeps the most used ones in the cache
+        return send_file(os.path.abspath(path), mimetype=mimetype, as_attachment=True,
+                         download_name=download_name, conditional=True, max_age=0)
+    except FileNotFoundError:
+        return None
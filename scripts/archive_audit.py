@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+# Sistema de Registro de Avaliações - Clínica TEA
+# Criado por João Layon
+
+"""
+Audit log archival script
+Moves audit rows older than AUDIT_HOT_MONTHS into monthly partitions and
+drops partitions older than AUDIT_RETENTION_MONTHS. Meant for cron when the
+background archiver is disabled (AUDIT_ARCHIVE_INTERVAL=0).
+"""
+
+import sys
+from pathlib import Path
+
+# Add the parent directory to the Python path so we can import our modules
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config import Config
+from models.database import init_db
+from models.audit import get_partitions
+from services.audit_archiver import run_archiver_once
+
+def archive():
+    """Run one archival pass and print the partition summary"""
+    db_url = Config.DATABASE_URL
+    print(f"Usando banco de dados: {db_url}")
+
+    try:
+        init_db(db_url)
+        moved, dropped = run_archiver_once(db_url)
+        print(f"✓ {moved} registros arquivados")
+        for mes, linhas in dropped:
+            print(f"✓ Partição {mes} removida ({linhas} registros)")
+
+        for partition in get_partitions():
+            print(f"  {partition['tabela']}: {partition['linhas']} registros")
+
+    except Exception as e:
+        print(f"❌ Erro ao arquivar auditoria: {str(e)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    archive()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# Sistema de Registro de Avaliações - Clínica TEA
+# Criado por João Layon
+
+"""
+Online backup tool for the local SQLite database
+Takes compressed incremental snapshots while the app is running, and lists,
+verifies (integrity_check), restores and prunes them.
+
+Usage:
+    python scripts/backup.py snapshot
+    python scripts/backup.py list
+    python scripts/backup.py verify [latest|<id>]
+    python scripts/backup.py restore <id|latest> <destino.db> [--force]
+    python scripts/backup.py prune [--keep 14]
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+# Add the parent directory to the Python path so we can import our modules
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config import Config
+from services.backup import BackupError, SnapshotStore, database_path
+
+def snapshot(store, args):
+    db_path = database_path(Config.DATABASE_URL)
+    print(f"Copiando {db_path} para {store.backup_dir}...")
+    manifest = store.create(db_path, pages=args.pages, pause=args.pause)
+    print(f"✓ Snapshot {manifest['id']} criado")
+    print(f"  {manifest['tamanho'] / 1e6:.1f} MB em {manifest['duracao_backup']:.2f} s "
+          f"({manifest['mb_s']:.1f} MB/s), {manifest['passos']} passos")
+    if manifest['modo'] == 'wal':
+        print("  modo WAL: a cópia não bloqueou escritores")
+    else:
+        print(f"  maior passo com lock de leitura: {manifest['maior_passo'] * 1000:.1f} ms "
+              f"(total {manifest['tempo_em_lock'] * 1000:.0f} ms, {manifest['reinicios']} reinícios)")
+    print(f"  {manifest['novos_chunks']} de {len(manifest['chunks'])} blocos novos, "
+          f"{manifest['bytes_gravados'] / 1e6:.2f} MB gravados")
+    removed, freed = store.prune(args.keep)
+    if removed:
+        print(f"✓ {len(removed)} snapshots antigos removidos ({freed / 1e6:.2f} MB liberados)")
+
+def list_snapshots(store, args):
+    manifests = store.list()
+    if not manifests:
+        print("Nenhum snapshot encontrado")
+    for manifest in manifests:
+        print(f"{manifest['id']}  {manifest['criado_em']}  {manifest['tamanho'] / 1e6:8.1f} MB  "
+              f"{manifest['novos_chunks']:5d} blocos novos")
+
+def verify(store, args):
+    manifest = store.verify(args.snapshot)
+    print(f"✓ Snapshot {manifest['id']} íntegro (checksum e integrity_check ok)")
+
+def restore(store, args):
+    manifest = store.restore(args.snapshot, args.destino, overwrite=args.force)
+    print(f"✓ Snapshot {manifest['id']} restaurado em {args.destino}")
+
+def prune(store, args):
+    removed, freed = store.prune(args.keep)
+    print(f"✓ {len(removed)} snapshots removidos ({freed / 1e6:.2f} MB liberados)")
+
+COMMANDS = {
+    'snapshot': snapshot,
+    'list': list_snapshots,
+    'verify': verify,
+    'restore': restore,
+    'prune': prune,
+}
+
+def main():
+    parser = argparse.ArgumentParser(description='Backup online do Sistema TEA')
+    parser.add_argument('command', choices=sorted(COMMANDS))
+    parser.add_argument('snapshot', nargs='?', default='latest')
+    parser.add_argument('destino', nargs='?')
+    parser.add_argument('--dir', default=Config.BACKUP_DIR)
+    parser.add_argument('--pages', type=int, default=Config.BACKUP_PAGES_PER_STEP)
+    parser.add_argument('--pause', type=float, default=Config.BACKUP_STEP_PAUSE)
+    parser.add_argument('--keep', type=int, default=Config.BACKUP_KEEP)
+    parser.add_argument('--force', action='store_true', help='sobrescrever o destino do restore')
+    args = parser.parse_args()
+
+    if args.command == 'restore' and not args.destino:
+        parser.error('restore precisa do snapshot e do arquivo de destino')
+
+    try:
+        COMMANDS[args.command](SnapshotStore(args.dir), args)
+    except BackupError as e:
+        print(f"❌ {str(e)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1209 @@
+#!/usr/bin/env python3
+# Sistema de Registro de Avaliações - Clínica TEA
+# Criado por João Layon
+
+"""
+Performance benchmarks
+Runs each benchmark against a throwaway local SQLite database populated with
+synthetic data, so it never touches instance/app.db or SQLiteCloud.
+
+Usage:
+    python scripts/benchmark.py assistant [--latency-ms 800] [--rounds 20]
+    python scripts/benchmark.py assistant-cache [--latency-ms 800] [--rounds 20]
+    python scripts/benchmark.py rate-limit [--keys 1000000]
+    python scripts/benchmark.py login [--rounds 20]
+    python scripts/benchmark.py audit [--rows 200000] [--rounds 20]
+    python scripts/benchmark.py backup [--rows 200000] [--pages 256] [--write-interval-ms 5]
+    python scripts/benchmark.py cdc [--patients 500]
+    python scripts/benchmark.py importtime [--rounds 20]
+    python scripts/benchmark.py server [--patients 500] [--clients 8] [--rounds 20]
+    python scripts/benchmark.py replica [--patients 500] [--rtt-ms 40] [--rounds 20]
+    python scripts/benchmark.py batch [--patients 500] [--rtt-ms 40] [--rounds 20]
+    python scripts/benchmark.py patient-record [--patients 500] [--evaluations 40] [--rtt-ms 40] [--rounds 20]
+    python scripts/benchmark.py kanban [--patients 500] [--rounds 20]
+    python scripts/benchmark.py pdf [--patients 500] [--rounds 20] [--workers 2]
+    python scripts/benchmark.py jobs [--patients 500] [--rounds 20] [--workers 2]
+    python scripts/benchmark.py purge [--patients 500]
+    python scripts/benchmark.py metrics [--patients 500] [--rounds 20] [--clients 8]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Add the parent directory to the Python path so we can import our modules
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+FIRST_NAMES = ['Ana', 'Bruno', 'Carlos', 'Daniela', 'Eduardo', 'Fernanda', 'Gabriel',
+               'Helena', 'Igor', 'Julia', 'Lucas', 'Mariana', 'Pedro', 'Sofia']
+LAST_NAMES = ['Silva', 'Santos', 'Oliveira', 'Souza', 'Costa', 'Pereira', 'Almeida',
+              'Ferreira', 'Rodrigues', 'Lima']
+
+def setup_fixture_db(num_patients=500):
+    """Create a temporary database with doctors, patients and evaluations"""
+    from models.database import init_db, get_db_connection
+    from models.evaluation import Evaluation
+    from models.user import User
+
+    tmp_dir = tempfile.mkdtemp(prefix='tea-bench-')
+    db_path = os.path.join(tmp_dir, 'bench.db')
+    init_db(db_path)
+    conn = get_db_connection()
+
+    doctors = [
+        User.create('Dra. Fernanda Lima', 'fernanda@bench.local', 'bench123', 'medico', 'Fonoaudiologia'),
+        User.create('Dr. Roberto Souza', 'roberto@bench.local', 'bench123', 'medico', 'Psicologia'),
+        User.create('Dra. Paula Costa', 'paula@bench.local', 'bench123', 'medico', 'Terapia Ocupacional'),
+    ]
+
+    for i in range(num_patients):
+        nome = f'{FIRST_NAMES[i % len(FIRST_NAMES)]} {LAST_NAMES[(i // len(FIRST_NAMES)) % len(LAST_NAMES)]} {i:05d}'
+        conn.execute("""
+            INSERT INTO pacientes (nome, cpf, data_nascimento, telefone, local_referencia)
+            VALUES (?, ?, ?, ?, ?)
+        """, (nome, f'{i:011d}', '2015-01-01', None, 'Clínica Principal'))
+    conn.commit()
+
+    patient_ids = [row['id'] for row in conn.execute("SELECT id FROM pacientes ORDER BY id").fetchall()]
+    for i, patient_id in enumerate(patient_ids):
+        doctor = doctors[i % len(doctors)]
+        Evaluation.create(patient_id, doctor.id, doctor.especialidade, 'Clínica Principal',
+                          'Avaliação sintética', [doctor.especialidade], user_id=doctor.id)
+        if i % 2 == 0:
+            conn.execute("""
+                UPDATE procedimentos SET estado = 'alocado', medico_responsavel_id = ?
+                WHERE paciente_id = ? AND especialidade = ?
+            """, (doctor.id, patient_id, doctor.especialidade))
+            conn.commit()
+
+    return db_path
+
+def report(label, samples):
+    """Print latency summary for a list of samples in seconds"""
+    ms = sorted(s * 1000 for s in samples)
+    p95 = ms[min(len(ms) - 1, int(len(ms) * 0.95))]
+    print(f"{label:<28} n={len(ms):<5} média={statistics.mean(ms):9.2f} ms  "
+          f"p50={statistics.median(ms):9.2f} ms  p95={p95:9.2f} ms")
+
+class StubModelClient:
+    """Stand-in for genai.Client that sleeps instead of calling the API"""
+
+    class _Response:
+        text = 'Resposta simulada do modelo.'
+
+    def __init__(self, latency_ms):
+        self.latency = latency_ms / 1000.0
+        self.models = self
+
+    def generate_content(self, model, contents):
+        time.sleep(self.latency)
+        return self._Response()
+
+def bench_assistant(args):
+    """Compare the structured fast path with the model path"""
+    from services.ai_assistant import AIAssistant, get_assistant_stats, reset_assistant_stats
+    from services.response_cache import ResponseCache
+
+    setup_fixture_db(args.patients)
+    # Cache desligado (TTL 0) para medir o custo real do modelo
+    assistant = AIAssistant(client=StubModelClient(args.latency_ms),
+                            cache=ResponseCache(':memory:', ttl=0))
+
+    fast_questions = [
+        'Onde está o paciente Ana Silva 00000?',
+        'Com qual médico está Bruno Silva 00001?',
+        'Qual o status do paciente com CPF 000.000.000-02?',
+        'Quem avaliou Daniela Silva 00003?',
+        'Qual médico fez a primeira avaliação de Eduardo Silva 00004?',
+        'Quantos pacientes tem a Dra. Fernanda?',
+        'Quais pacientes estão com Dr. Roberto?',
+        'Quem são os médicos de Fonoaudiologia?',
+    ]
+    # As duas últimas casam com padrões do caminho rápido sem apontar para
+    # ninguém cadastrado: ficam para o modelo
+    model_questions = [
+        'Resuma a situação geral da clínica hoje',
+        'Quais cuidados devo ter com Ana Silva 00000 na próxima sessão?',
+        'Quantos pacientes tem a clínica?',
+        'Onde está o prontuário do João?',
+    ]
+
+    reset_assistant_stats()
+    fast_samples, model_samples = [], []
+    for _ in range(args.rounds):
+        for question in fast_questions:
+            started = time.perf_counter()
+            result = assistant.ask_question(question)
+            fast_samples.append(time.perf_counter() - started)
+            assert result['source'] == 'fast_path', question
+        for question in model_questions:
+            started = time.perf_counter()
+            result = assistant.ask_question(question)
+            model_samples.append(time.perf_counter() - started)
+            assert result['source'] == 'model', question
+
+    stats = get_assistant_stats()
+    print(f"Modelo simulado com {args.latency_ms} ms de latência, {args.patients} pacientes\n")
+    report('caminho rápido', fast_samples)
+    report('modelo (stub)', model_samples)
+    print(f"\nTaxa de acerto do caminho rápido: {stats['fast_path_hit_rate']:.1%} "
+          f"({stats['fast_path_hits']}/{stats['total_questions']})")
+    print(f"Aceleração média: {statistics.mean(model_samples) / statistics.mean(fast_samples):.0f}x")
+
+def bench_assistant_cache(args):
+    """Measure response cache hit ratio, saved latency and invalidation"""
+    from models.database import get_db_connection
+    from services.ai_assistant import AIAssistant
+    from services.response_cache import ResponseCache
+
+    db_path = setup_fixture_db(args.patients)
+    cache = ResponseCache(os.path.join(os.path.dirname(db_path), 'cache.db'))
+    assistant = AIAssistant(client=StubModelClient(args.latency_ms), cache=cache)
+
+    # Pacientes pares têm procedimento alocado: as atribuições entram na chave do cache
+    questions = [
+        'Quais cuidados devo ter com Ana Silva 00000 na próxima sessão?',
+        'Como está a evolução de Bruno Santos 00015?',
+        'Resuma o histórico de Carlos Oliveira 00030',
+    ]
+
+    samples = {'cache': [], 'model': []}
+    for _ in range(args.rounds):
+        for question in questions:
+            started = time.perf_counter()
+            result = assistant.ask_question(question)
+            assert result['success'], (question, result['error'])
+            samples[result['source']].append(time.perf_counter() - started)
+
+    report('modelo (miss)', samples['model'])
+    report('cache (hit)', samples['cache'])
+    stats = cache.get_stats()
+    print(f"\nTaxa de acerto: {stats['hit_ratio']:.1%} ({stats['hits']} hits, {stats['misses']} misses)")
+    print(f"Latência economizada: {stats['saved_seconds']:.2f} s")
+
+    # Mudança nos dados do paciente invalida apenas as perguntas sobre ele
+    conn = get_db_connection()
+    conn.execute("""
+        UPDATE procedimentos SET atualizado_em = datetime('now', '+1 minute')
+        WHERE paciente_id = (SELECT id FROM pacientes WHERE nome = 'Ana Silva 00000')
+    """)
+    conn.commit()
+    print("Após alterar procedimento de Ana Silva 00000:")
+    for question in questions:
+        print(f"  {assistant.ask_question(question)['source']:<6} {question}")
+
+class FakeClock:
+    """Manually advanced clock for time-dependent components"""
+
+    def __init__(self, start=1_000_000.0):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+def bench_rate_limit(args):
+    """Load test: login limiter memory stays bounded under many distinct IPs"""
+    import tracemalloc
+    from config import Config
+    from utils.rate_limit import MemoryBackend, SQLiteBackend, RateLimiter
+
+    attempts, period = Config.RATELIMIT_LOGIN_IP
+
+    def run(backend, keys, spread_seconds, measure_memory=False):
+        clock = FakeClock()
+        limiter = RateLimiter(backend, attempts, period, prefix='login:ip:', clock=clock)
+        step = spread_seconds / keys
+        peak_keys = 0
+        if measure_memory:
+            tracemalloc.start()
+        started = time.perf_counter()
+        for i in range(keys):
+            clock.now += step
+            ip = f'10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}#{i >> 24}'
+            limiter.acquire(ip)
+            if i % 10000 == 0:
+                peak_keys = max(peak_keys, len(backend))
+        elapsed = time.perf_counter() - started
+        peak_mem = tracemalloc.get_traced_memory()[1] if measure_memory else None
+        if measure_memory:
+            tracemalloc.stop()
+        return elapsed, peak_keys, len(backend), peak_mem
+
+    print(f"Limite por IP: {attempts} tentativas / {period} s\n")
+
+    for label, spread in (('rajada (mesmo instante)', 0.0), ('1 hora de tráfego', 3600.0)):
+        backend = MemoryBackend(max_keys=100000)
+        elapsed, peak_keys, final_keys, peak_mem = run(backend, args.keys, spread, measure_memory=True)
+        print(f"memória, {label}: {args.keys:,} IPs em {elapsed:.1f} s "
+              f"({args.keys / elapsed:,.0f} ops/s), chaves máx={peak_keys:,}, "
+              f"finais={final_keys:,}, pico de memória={peak_mem / 1e6:.1f} MB")
+
+    sqlite_keys = min(args.keys, 200000)
+    tmp_dir = tempfile.mkdtemp(prefix='tea-bench-')
+    backend = SQLiteBackend(os.path.join(tmp_dir, 'rate_limit.db'))
+    elapsed, peak_keys, final_keys, _ = run(backend, sqlite_keys, 3600.0 * sqlite_keys / args.keys)
+    print(f"sqlite, 1 hora de tráfego: {sqlite_keys:,} IPs em {elapsed:.1f} s "
+          f"({sqlite_keys / elapsed:,.0f} ops/s), linhas máx={peak_keys:,}, finais={final_keys:,}")
+
+    # Tentativas simultâneas contra a mesma conta, de vários processos: nenhuma
+    # passa além do orçamento
+    from concurrent.futures import ProcessPoolExecutor
+    path = os.path.join(tmp_dir, 'concurrent.db')
+    SQLiteBackend(path)
+    with ProcessPoolExecutor(args.clients) as pool:
+        granted = sum(pool.map(_acquire_attempts, [path] * args.clients, [attempts] * args.clients))
+    print(f"concorrência: {args.clients} processos x {attempts} tentativas na mesma chave, "
+          f"{granted} aceitas (limite {attempts})")
+    assert granted == attempts, granted
+
+def _acquire_attempts(path, count):
+    """Worker of bench_rate_limit: tries count logins against one key"""
+    from config import Config
+    from utils.rate_limit import SQLiteBackend, RateLimiter
+    limiter = RateLimiter(SQLiteBackend(path), *Config.RATELIMIT_LOGIN_IP, prefix='login:ip:')
+    return sum(limiter.acquire('10.0.0.1') for _ in range(count))
+
+def bench_login(args):
+    """Login throughput, rehash-on-login and unknown-user timing"""
+    from concurrent.futures import ThreadPoolExecutor
+    from werkzeug.security import generate_password_hash
+    from config import Config
+    from models.database import get_db_connection
+    from models.user import User
+
+    db_path = setup_fixture_db(num_patients=0)
+    conn = get_db_connection()
+    emails = [f'user{i}@bench.local' for i in range(8)]
+    for email in emails:
+        User.create('Usuário de Teste', email, 'senha123', 'coordenacao')
+
+    print(f"Política: {Config.PASSWORD_HASH_METHOD}, até {Config.PASSWORD_HASH_CONCURRENCY} hashes simultâneos\n")
+
+    samples = []
+    for i in range(args.rounds):
+        started = time.perf_counter()
+        assert User.authenticate(emails[i % len(emails)], 'senha123')
+        samples.append(time.perf_counter() - started)
+    report('login (serial)', samples)
+
+    def login_in_thread(i):
+        get_db_connection(db_path)
+        return User.authenticate(emails[i % len(emails)], 'senha123') is not None
+
+    for threads in (2, 4, 8):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            assert all(pool.map(login_in_thread, range(args.rounds * 2)))
+        elapsed = time.perf_counter() - started
+        print(f"{threads} threads de requisição: {args.rounds * 2 / elapsed:6.1f} logins/s "
+              f"(serial: {1 / statistics.mean(samples):6.1f} logins/s)")
+
+    # Hash legado (pbkdf2 padrão do werkzeug) é trocado no primeiro login
+    conn.execute("UPDATE users SET senha_hash = ? WHERE email = ?",
+                 (generate_password_hash('senha123', method='pbkdf2'), emails[0]))
+    conn.commit()
+    legacy = []
+    for _ in range(3):
+        started = time.perf_counter()
+        User.authenticate(emails[0], 'senha123')
+        legacy.append(time.perf_counter() - started)
+    print(f"\nhash legado pbkdf2: 1º login {legacy[0] * 1000:.0f} ms (rehash), "
+          f"seguintes {statistics.mean(legacy[1:]) * 1000:.0f} ms")
+
+    known, unknown = [], []
+    for _ in range(args.rounds):
+        started = time.perf_counter()
+        User.authenticate(emails[1], 'errada')
+        known.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        User.authenticate('ninguem@bench.local', 'errada')
+        unknown.append(time.perf_counter() - started)
+    report('\nsenha errada (conta existe)', known)
+    report('conta inexistente', unknown)
+
+def bench_audit(args):
+    """Audit page, search and facet cost before and after moving cold rows to monthly partitions"""
+    from datetime import datetime, timedelta
+    from models.database import init_db, get_db_connection
+    from models.audit import (get_audit_logs, count_audit_logs, archive_audit_logs, get_partitions,
+                              get_audit_facets)
+
+    tmp_dir = tempfile.mkdtemp(prefix='tea-bench-')
+    init_db(os.path.join(tmp_dir, 'bench.db'))
+    conn = get_db_connection()
+
+    # Two years of history, evenly spread, ending now
+    now = datetime.utcnow()
+    step = timedelta(days=730) / args.rows
+    actions = ['login', 'logout', 'patient_updated', 'evaluation_created', 'assistant_question']
+    def patient_name(n):
+        return f'{FIRST_NAMES[n % len(FIRST_NAMES)]} {LAST_NAMES[n % len(LAST_NAMES)]} {n:05d}'
+    conn.executemany("""
+        INSERT INTO auditoria (user_id, acao, detalhe, criado_em, entidade, entidade_id)
+        VALUES (?, ?, ?, ?, 'paciente', ?)
+    """, ((None, actions[i % len(actions)], f'Paciente atualizado: {patient_name(i % 5000)}',
+           (now - step * (args.rows - i)).strftime('%Y-%m-%d %H:%M:%S'), i % 5000 + 1)
+          for i in range(args.rows)))
+    conn.commit()
+    print(f"{args.rows:,} registros de auditoria em 24 meses\n")
+
+    def legacy_page():
+        conn.execute("""
+            SELECT a.*, u.nome as user_nome FROM auditoria a
+            LEFT JOIN users u ON a.user_id = u.id
+            ORDER BY a.criado_em DESC LIMIT 50 OFFSET 0
+        """).fetchall()
+        conn.execute("SELECT COUNT(*) FROM auditoria").fetchone()
+
+    def measure(label, fn):
+        samples = []
+        for _ in range(args.rounds):
+            started = time.perf_counter()
+            fn()
+            samples.append(time.perf_counter() - started)
+        report(label, samples)
+
+    name = patient_name(1234)
+    measure('antes: página 1 + COUNT(*)', legacy_page)
+    measure('antes: LIKE no detalhe', lambda: conn.execute("""
+        SELECT * FROM auditoria WHERE detalhe LIKE ? ORDER BY id DESC LIMIT 51
+    """, (f'%{name}%',)).fetchall())
+    measure('página 1 (sem partições)', lambda: get_audit_logs(limit=51))
+
+    started = time.perf_counter()
+    moved = archive_audit_logs(pause=0)
+    elapsed = time.perf_counter() - started
+    print(f"\narquivador: {moved:,} registros em {elapsed:.2f} s ({moved / elapsed:,.0f} linhas/s), "
+          f"{len(get_partitions())} partições\n")
+
+    measure('página 1', lambda: get_audit_logs(limit=51))
+    measure('página 1 + contagem mantida', lambda: (get_audit_logs(limit=51), count_audit_logs()))
+    measure('página 1, filtro por ação', lambda: get_audit_logs(limit=51, acao='login'))
+    measure('página 2000 (atravessa meses)', lambda: get_audit_logs(limit=51, offset=100000))
+    month = (now - timedelta(days=400)).strftime('%Y-%m')
+    measure(f'intervalo {month}-01..10', lambda: get_audit_logs(
+        limit=51, data_inicio=f'{month}-01', data_fim=f'{month}-10'))
+
+    print()
+    measure(f'busca "{name}"', lambda: get_audit_logs(limit=51, q=name))
+    measure('busca + contagem', lambda: (get_audit_logs(limit=51, q=name), count_audit_logs(q=name)))
+    measure('entidade paciente #1235', lambda: get_audit_logs(limit=51, entidade='paciente', entidade_id=1235))
+    measure('facetas (todo o período)', lambda: get_audit_facets())
+    measure('facetas, filtro por ação', lambda: get_audit_facets(acao='login'))
+    measure('contagem por ação (resumo)', lambda: count_audit_logs(acao='login'))
+
+def bench_backup(args):
+    """Backup throughput and the write latency a concurrent writer sees meanwhile"""
+    import shutil
+    import sqlite3
+    import threading
+    from models.database import get_db_connection
+    from services.backup import BackupError, online_backup
+
+    db_path = setup_fixture_db(args.patients)
+    conn = get_db_connection()
+    conn.executemany("""
+        INSERT INTO auditoria (acao, detalhe) VALUES ('bench', ?)
+    """, ((f'Registro sintético {i} ' + 'x' * 100,) for i in range(args.rows)))
+    conn.commit()
+
+    # One copy of the fixture per journal mode
+    paths = {}
+    for mode in ('delete', 'wal'):
+        paths[mode] = os.path.join(os.path.dirname(db_path), f'{mode}.db')
+        target = sqlite3.connect(paths[mode])
+        conn.backup(target)
+        target.execute(f'PRAGMA journal_mode={mode}')
+        target.close()
+    size = os.path.getsize(paths['delete'])
+    print(f"Banco de {size / 1e6:.1f} MB, escritor com BEGIN IMMEDIATE a cada {args.write_interval_ms:.0f} ms\n")
+
+    def run(path, copy=None, seconds=1.0, interval_ms=args.write_interval_ms):
+        stop = threading.Event()
+        latencies = []
+
+        def writer():
+            wconn = sqlite3.connect(path, timeout=60, isolation_level=None)
+            while not stop.is_set():
+                started = time.perf_counter()
+                wconn.execute('BEGIN IMMEDIATE')
+                wconn.execute("INSERT INTO auditoria (acao, detalhe) VALUES ('bench', 'escrita concorrente')")
+                wconn.execute('COMMIT')
+                latencies.append(time.perf_counter() - started)
+                time.sleep(interval_ms / 1000.0)
+            wconn.close()
+
+        thread = threading.Thread(target=writer)
+        thread.start()
+        time.sleep(0.2)
+        started = time.perf_counter()
+        try:
+            result = copy() if copy else time.sleep(seconds)
+        finally:
+            elapsed = time.perf_counter() - started
+            stop.set()
+            thread.join()
+        return elapsed, latencies, result
+
+    _, baseline, _ = run(paths['wal'])
+    normal = statistics.median(baseline)
+
+    def show(label, elapsed, latencies, note=''):
+        stall = sum(max(0.0, latency - normal) for latency in latencies)
+        print(f"{label:<34} {size / 1e6 / elapsed:7.1f} MB/s  escritas={len(latencies):<4} "
+              f"maior espera={max(latencies) * 1000:8.1f} ms  travamento total={stall * 1000:8.1f} ms  {note}")
+
+    def locked_copy(path, dest):
+        lconn = sqlite3.connect(path, isolation_level=None)
+        lconn.execute('BEGIN IMMEDIATE')
+        shutil.copyfile(path, dest)
+        lconn.execute('ROLLBACK')
+        lconn.close()
+
+    dest = os.path.join(os.path.dirname(db_path), 'copia.db')
+    # Without WAL any commit from another connection restarts a paced backup,
+    # so it is also measured with the sparse writes of a normal clinic day
+    scenarios = [
+        ('cópia do arquivo com lock', paths['delete'], lambda: locked_copy(paths['delete'], dest), None),
+        ('backup online, passo único', paths['delete'],
+         lambda: online_backup(paths['delete'], dest, pages=-1), None),
+        (f'backup online, {args.pages} págs/passo', paths['delete'],
+         lambda: online_backup(paths['delete'], dest, pages=args.pages), None),
+        ('  idem, escrita a cada 1 s', paths['delete'],
+         lambda: online_backup(paths['delete'], dest, pages=args.pages), 1000),
+        ('backup online, WAL', paths['wal'], lambda: online_backup(paths['wal'], dest), None),
+    ]
+    for label, path, copy, interval_ms in scenarios:
+        if os.path.exists(dest):
+            os.remove(dest)
+        try:
+            elapsed, latencies, stats = run(path, copy, interval_ms=interval_ms or args.write_interval_ms)
+            note = f"passos={stats['passos']} reinícios={stats['reinicios']}" if stats else ''
+            show(label, elapsed, latencies, note)
+        except BackupError as e:
+            print(f"{label:<34} falhou: {e}")
+
+def bench_cdc(args):
+    """Trigger overhead of the change log on Evaluation.create, and consumer/compaction throughput"""
+    from models.database import get_db_connection
+    from models.evaluation import Evaluation
+    from models.change_log import ChangeConsumer, compact_changes
+    from models.user import User
+
+    setup_fixture_db(args.patients)
+    conn = get_db_connection()
+    doctor = User.get_by_email('fernanda@bench.local')
+    patient_ids = [row['id'] for row in conn.execute("SELECT id FROM pacientes ORDER BY id").fetchall()]
+    triggers = conn.execute("""
+        SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND name LIKE '%_cdc_%'
+    """).fetchall()
+    print(f"{len(patient_ids)} pacientes, {len(triggers)} gatilhos de captura\n")
+
+    def create_all():
+        samples = []
+        for patient_id in patient_ids:
+            started = time.perf_counter()
+            Evaluation.create(patient_id, doctor.id, doctor.especialidade, 'Clínica Principal',
+                              'Reavaliação sintética', ['Fonoaudiologia', 'Psicologia', 'Musicoterapia'],
+                              user_id=doctor.id)
+            samples.append(time.perf_counter() - started)
+        return samples
+
+    # Alternate with and without triggers so disk cache warm-up doesn't favour either side
+    results = {'com gatilhos': [], 'sem gatilhos': []}
+    for _ in range(2):
+        results['com gatilhos'] += create_all()
+        for trigger in triggers:
+            conn.execute(f"DROP TRIGGER {trigger['name']}")
+        conn.commit()
+        results['sem gatilhos'] += create_all()
+        for trigger in triggers:
+            conn.execute(trigger['sql'])
+        conn.commit()
+
+    for label, samples in results.items():
+        report(f'Evaluation.create {label}', samples)
+        print(f"{'':<28} {len(samples) / sum(samples):,.0f} avaliações/s")
+    overhead = statistics.median(results['com gatilhos']) / statistics.median(results['sem gatilhos']) - 1
+    print(f"\nsobrecarga dos gatilhos (mediana): {overhead * 100:+.1f}%")
+
+    total = conn.execute("SELECT COUNT(*) FROM alteracoes").fetchone()[0]
+    for batch_size in (100, 500, 2000):
+        consumer = ChangeConsumer(f'bench-{batch_size}', batch_size=batch_size, from_start=True)
+        started = time.perf_counter()
+        handled = consumer.consume(lambda changes: None)
+        elapsed = time.perf_counter() - started
+        print(f"consumidor, lotes de {batch_size:<5} {handled:,} alterações em {elapsed * 1000:7.1f} ms "
+              f"({handled / elapsed:,.0f}/s)")
+
+    started = time.perf_counter()
+    consumed, _ = compact_changes(retention_days=0)
+    print(f"compactação: {consumed:,} de {total:,} entradas removidas em "
+          f"{(time.perf_counter() - started) * 1000:.1f} ms")
+
+def bench_importtime(args):
+    """Cold start cost (python -X importtime) of the app and its slowest imports.
+
+    The budget itself is enforced by tests/test_budgets.py.
+    """
+    import subprocess
+
+    root = str(Path(__file__).parent.parent)
+    tmp_dir = tempfile.mkdtemp(prefix='tea-bench-')
+    env = dict(os.environ, DATABASE_URL=os.path.join(tmp_dir, 'bench.db'), AUDIT_ARCHIVE_INTERVAL='0')
+
+    def import_times(module):
+        """{module: (cumulative µs, depth)} for a fresh interpreter importing module"""
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                                cwd=root, env=env, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"import {module} falhou:\n{result.stderr[-2000:]}")
+        times = {}
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            _, cumulative, name = line.split('|')
+            times[name.strip()] = (int(cumulative), len(name) - len(name.lstrip()))
+        return times
+
+    import_times('app')  # the first start applies the migrations to the empty database
+    samples = []
+    for _ in range(args.rounds):
+        times = import_times('app')
+        samples.append(times['app'][0] / 1e6)
+    report('import app (create_app)', samples)
+
+    depth = times['app'][1] + 2
+    children = sorted(((cumulative, name) for name, (cumulative, level) in times.items() if level == depth),
+                      reverse=True)
+    for cumulative, name in children[:8]:
+        print(f"  {name:<34} {cumulative / 1000:8.1f} ms")
+
+SERVER_PROFILES = [
+    ('sync, 2 workers', {'GUNICORN_WORKER_CLASS': 'sync', 'GUNICORN_WORKERS': '2',
+                         'GUNICORN_THREADS': '1', 'GUNICORN_PRELOAD': '0'}),
+    ('gthread 2x4', {'GUNICORN_WORKER_CLASS': 'gthread', 'GUNICORN_WORKERS': '2',
+                     'GUNICORN_THREADS': '4', 'GUNICORN_PRELOAD': '0'}),
+    ('gthread 2x4 + preload', {'GUNICORN_WORKER_CLASS': 'gthread', 'GUNICORN_WORKERS': '2',
+                               'GUNICORN_THREADS': '4', 'GUNICORN_PRELOAD': '1'}),
+]
+
+SERVER_PAGES = ('/dashboard', '/distribuicao/', '/pacientes/')
+
+def bench_server(args):
+    """gunicorn.conf.py under load: sync vs gthread vs gthread + preload_app"""
+    import http.cookiejar
+    import signal
+    import socket
+    import subprocess
+    import urllib.error
+    import urllib.parse
+    import urllib.request
+    from concurrent.futures import ThreadPoolExecutor
+
+    root = str(Path(__file__).parent.parent)
+    db_path = setup_fixture_db(num_patients=args.patients)
+    tmp_dir = os.path.dirname(db_path)
+    env = dict(os.environ, DATABASE_URL=db_path, AUDIT_ARCHIVE_INTERVAL='0',
+               RATELIMIT_STORAGE_URL=f"sqlite:///{os.path.join(tmp_dir, 'rate_limit.db')}",
+               ASSISTANT_CACHE_PATH=os.path.join(tmp_dir, 'assistant_cache.db'),
+               GUNICORN_ACCESSLOG='', GUNICORN_MAX_REQUESTS='0')
+
+    def free_port():
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            return s.getsockname()[1]
+
+    def client(base):
+        """An opener logged in as the fixture doctor (keeps its own session cookie)"""
+        opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+        form = urllib.parse.urlencode({'email': 'fernanda@bench.local', 'senha': 'bench123'}).encode()
+        opener.open(base + '/login', form, timeout=30).read()
+        return opener
+
+    print(f"{args.patients} pacientes, {args.clients} clientes simultâneos, "
+          f"{args.rounds} requisições por página e cliente\n")
+
+    for label, settings in SERVER_PROFILES:
+        port = free_port()
+        base = f'http://127.0.0.1:{port}'
+        started = time.perf_counter()
+        server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+                                   '--bind', f'127.0.0.1:{port}', 'app:app'],
+                                  cwd=root, env=dict(env, **settings),
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        try:
+            while True:
+                if server.poll() is not None:
+                    raise RuntimeError(f"gunicorn encerrou:\n{server.stderr.read().decode()[-2000:]}")
+                try:
+                    if urllib.request.urlopen(base + '/readyz', timeout=1).status == 200:
+                        break
+                except (urllib.error.URLError, ConnectionError):
+                    time.sleep(0.05)
+            boot = time.perf_counter() - started
+
+            clients = [client(base) for _ in range(args.clients)]
+
+            def fetch(job):
+                opener, path = job
+                t0 = time.perf_counter()
+                opener.open(base + path, timeout=60).read()
+                return time.perf_counter() - t0
+
+            jobs = [(opener, path) for _ in range(args.rounds) for path in SERVER_PAGES for opener in clients]
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.clients) as pool:
+                samples = list(pool.map(fetch, jobs))
+            elapsed = time.perf_counter() - started
+
+            ms = sorted(s * 1000 for s in samples)
+            print(f"{label:<24} boot={boot * 1000:6.0f} ms  {len(samples) / elapsed:7.1f} req/s  "
+                  f"p50={ms[len(ms) // 2]:7.1f} ms  p95={ms[min(len(ms) - 1, int(len(ms) * 0.95))]:7.1f} ms")
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait(timeout=60)
+
+def bench_replica(args):
+    """Pages against a remote primary (simulated round trip) with and without the local read replica"""
+    from config import Config
+    from models.database import SimulatedLatencyConnection, close_db_connection, get_replica
+
+    db_path = setup_fixture_db(num_patients=args.patients)
+    tmp_dir = os.path.dirname(db_path)
+    Config.DATABASE_URL = db_path
+    Config.AUDIT_ARCHIVE_INTERVAL = 0
+    Config.RATELIMIT_STORAGE_URL = f"sqlite:///{os.path.join(tmp_dir, 'rate_limit.db')}"
+    Config.ASSISTANT_CACHE_PATH = os.path.join(tmp_dir, 'assistant_cache.db')
+    Config.DATABASE_SIMULATED_LATENCY_MS = args.rtt_ms
+    Config.DATABASE_REPLICA_SYNC_INTERVAL = 0  # syncs happen inline, inside the measured requests
+    close_db_connection()  # reconnect with the simulated latency
+    from app import create_app
+
+    print(f"{args.patients} pacientes, {args.rtt_ms:.0f} ms por ida e volta ao primário, "
+          f"réplica com até {Config.DATABASE_REPLICA_MAX_STALENESS:g} s de atraso\n")
+
+    modes = (('direto no primário', ''), ('réplica local', os.path.join(tmp_dir, 'replica.db')))
+    for mode, (label, replica_path) in enumerate(modes):
+        Config.DATABASE_REPLICA_PATH = replica_path
+        app = create_app()
+        client = app.test_client()
+        client.post('/login', data={'email': 'fernanda@bench.local', 'senha': 'bench123'})
+
+        print(label)
+        for path in SERVER_PAGES + ('/relatorios/',):
+            samples = []
+            trips = SimulatedLatencyConnection.round_trips
+            for _ in range(args.rounds):
+                started = time.perf_counter()
+                assert client.get(path).status_code == 200, path
+                samples.append(time.perf_counter() - started)
+            report(f"  {path}", samples)
+            print(f"  {'':<26} {(SimulatedLatencyConnection.round_trips - trips) / args.rounds:.1f} "
+                  f"idas e voltas por página")
+
+        # Write, then the redirect target must already show it (read-your-writes)
+        samples = []
+        for i in range(args.rounds):
+            cpf = f'{900000000 + mode * 1000 + i:09d}'
+            cpf += str((sum(int(d) * w for d, w in zip(cpf, range(10, 1, -1))) * 10 % 11) % 10)
+            cpf += str((sum(int(d) * w for d, w in zip(cpf, range(11, 1, -1))) * 10 % 11) % 10)
+            started = time.perf_counter()
+            response = client.post('/pacientes/novo', data={'nome': f'Paciente Novo {label} {i}',
+                                                            'cpf': cpf, 'data_nascimento': '2015-01-01'})
+            page = client.get(response.headers['Location'])
+            samples.append(time.perf_counter() - started)
+            assert f'Paciente Novo {label} {i}' in page.data.decode(), 'escrita não visível'
+        report('  cadastro + redirecionamento', samples)
+        if get_replica():
+            print(f"  posição da réplica: {get_replica().position}")
+        print()
+
+def bench_batch(args):
+    """Evaluation.create and procedure transitions against a remote stand-in, one request vs one per statement"""
+    from config import Config
+    from models.database import SimulatedLatencyConnection, close_db_connection, get_db_connection
+    from models.evaluation import Evaluation
+    from models.patient import Patient
+    from models.procedure import Procedure
+
+    setup_fixture_db(num_patients=args.patients)
+    doctor = get_db_connection().execute("""
+        SELECT id, especialidade FROM users WHERE email = 'fernanda@bench.local'
+    """).fetchone()
+    pending = [row['id'] for row in get_db_connection().execute("""
+        SELECT id FROM procedimentos WHERE especialidade = ? AND estado = 'pendente' ORDER BY id
+    """, (doctor['especialidade'],)).fetchall()]
+    Config.DATABASE_SIMULATED_LATENCY_MS = args.rtt_ms
+    close_db_connection()  # reconnect with the simulated latency
+    therapies = ['Fonoaudiologia', 'Psicologia', 'Terapia Ocupacional']
+
+    print(f"{args.rtt_ms:.0f} ms por ida e volta, {len(therapies)} terapias por avaliação\n")
+    for mode, (label, pipeline) in enumerate((('um comando por requisição', False),
+                                              ('lote em uma requisição', True))):
+        SimulatedLatencyConnection.pipeline = pipeline
+        print(label)
+        timings = {'Patient.create': [], 'Evaluation.create': [], 'pull_to_doctor': [],
+                   'release_from_doctor': []}
+        trips = {name: 0 for name in timings}
+
+        def measure(name, fn, *fn_args, **fn_kwargs):
+            before = SimulatedLatencyConnection.round_trips
+            started = time.perf_counter()
+            fn(*fn_args, **fn_kwargs)
+            timings[name].append(time.perf_counter() - started)
+            trips[name] += SimulatedLatencyConnection.round_trips - before
+
+        for i in range(args.rounds):
+            cpf = f'{800000000 + mode * 1000 + i:09d}'
+            cpf += str((sum(int(d) * w for d, w in zip(cpf, range(10, 1, -1))) * 10 % 11) % 10)
+            cpf += str((sum(int(d) * w for d, w in zip(cpf, range(11, 1, -1))) * 10 % 11) % 10)
+            measure('Patient.create', Patient.create, f'Paciente Lote {mode}-{i}', cpf, '2015-01-01',
+                    user_id=doctor['id'])
+            measure('Evaluation.create', Evaluation.create, (i % args.patients) + 1, doctor['id'],
+                    doctor['especialidade'], 'Clínica Principal', 'Reavaliação', therapies, user_id=doctor['id'])
+            procedure_id = pending[i % len(pending)]
+            measure('pull_to_doctor', Procedure.pull_to_doctor, procedure_id, doctor['id'],
+                    doctor['especialidade'], user_id=doctor['id'])
+            measure('release_from_doctor', Procedure.release_from_doctor, procedure_id, 'Benchmark',
+                    user_id=doctor['id'])
+
+        for name, samples in timings.items():
+            report(f"  {name}", samples)
+            print(f"  {'':<26} {trips[name] / args.rounds:.1f} idas e voltas")
+        print()
+    SimulatedLatencyConnection.pipeline = True
+
+    # Evaluation.create is set-based (pinned by tests/test_budgets.py)
+    statements = {}
+    for count in (1, len(Config.DEFAULT_SPECIALTIES)):
+        before = SimulatedLatencyConnection.statements
+        Evaluation.create(1, doctor['id'], doctor['especialidade'], 'Clínica Principal', 'Reavaliação',
+                          Config.DEFAULT_SPECIALTIES[:count], user_id=doctor['id'])
+        statements[count] = SimulatedLatencyConnection.statements - before
+    print("Comandos por Evaluation.create: " +
+          ", ".join(f"{n} com {count} terapia(s)" for count, n in statements.items()))
+
+    # Values inlined into a multi-statement request read back as if bound
+    import sqlite3
+    from models.database import _inline_parameters
+    values = (None, True, 7, -2.5, float('nan'), float('inf'), float('-inf'), b'\x00\xff', "d'Ávila ?")
+    sql = 'SELECT ' + ', '.join('?' for _ in values)
+    memory = sqlite3.connect(':memory:')
+    bound = memory.execute(sql, values).fetchone()
+    inlined = memory.execute(_inline_parameters(sql, values)).fetchone()
+    assert inlined == bound, (inlined, bound)
+    print(f"Parâmetros embutidos no lote iguais aos vinculados: {inlined}")
+
+def bench_patient_record(args):
+    """Patient detail page data: PatientRecord.load against the per-evaluation queries it replaces"""
+    from config import Config
+    from models.database import SimulatedLatencyConnection, close_db_connection, get_db_connection
+    from models.evaluation import Evaluation
+    from models.patient import Patient
+    from models.patient_record import PatientRecord
+
+    setup_fixture_db(num_patients=args.patients)
+    doctor = get_db_connection().execute("""
+        SELECT id, especialidade FROM users WHERE email = 'fernanda@bench.local'
+    """).fetchone()
+    for i in range(args.evaluations):
+        Evaluation.create(1, doctor['id'], doctor['especialidade'], 'Clínica Principal', f'Retorno {i}',
+                          Config.DEFAULT_SPECIALTIES[:i % 3 + 1], user_id=doctor['id'])
+    Config.DATABASE_SIMULATED_LATENCY_MS = args.rtt_ms
+    close_db_connection()  # reconnect with the simulated latency
+
+    def separate_queries():
+        patient = Patient.get_by_id(1)
+        return patient, patient.get_evaluations(), patient.get_procedures()
+
+    def aggregate():
+        record = PatientRecord.load(1)
+        return record.patient, record.evaluations, record.procedures
+
+    print(f"{args.rtt_ms:.0f} ms por ida e volta, paciente com {args.evaluations} avaliações\n")
+    statements = {}
+    for label, load in (('consultas separadas', separate_queries), ('PatientRecord.load', aggregate)):
+        samples = []
+        before = SimulatedLatencyConnection.statements
+        for _ in range(args.rounds):
+            started = time.perf_counter()
+            load()
+            samples.append(time.perf_counter() - started)
+        statements[label] = (SimulatedLatencyConnection.statements - before) / args.rounds
+        report(label, samples)
+        print(f"{'':<28} {statements[label]:.0f} comandos")
+
+def bench_kanban(args):
+    """Distribution center: full table vs windowed kanban and its scroll pages"""
+    import re
+    from config import Config
+
+    db_path = setup_fixture_db(num_patients=args.patients)
+    tmp_dir = os.path.dirname(db_path)
+    Config.DATABASE_URL = db_path
+    Config.AUDIT_ARCHIVE_INTERVAL = 0
+    Config.RATELIMIT_STORAGE_URL = f"sqlite:///{os.path.join(tmp_dir, 'rate_limit.db')}"
+    Config.ASSISTANT_CACHE_PATH = os.path.join(tmp_dir, 'assistant_cache.db')
+    from app import create_app
+
+    app = create_app()
+    client = app.test_client()
+    client.post('/login', data={'email': 'fernanda@bench.local', 'senha': 'bench123'})
+
+    kanban = client.get('/distribuicao/?view=kanban').get_data(as_text=True)
+    pages = [('tabela completa', '/distribuicao/'), ('quadro (janelas)', '/distribuicao/?view=kanban')]
+    # Small fixtures may fit every group in its first page
+    group = re.search(r'data-url="([^"]+)"\s+data-depois-em="([^"]+)" data-depois-id="(\d+)"', kanban)
+    if group:
+        pages.append(('próxima página', f"{group.group(1).replace('&amp;', '&')}"
+                                        f"&depois_em={group.group(2)}&depois_id={group.group(3)}"))
+
+    print(f"{args.patients} pacientes, {Config.KANBAN_PAGE_SIZE} cartões por grupo\n")
+    if not group:
+        print("Nenhum grupo tem uma segunda página; rolagem não medida\n")
+    for label, path in pages:
+        samples = []
+        for _ in range(args.rounds):
+            started = time.perf_counter()
+            response = client.get(path)
+            samples.append(time.perf_counter() - started)
+            assert response.status_code == 200, (path, response.status_code)
+        report(label, samples)
+        print(f"{'':<28} {len(response.get_data()) / 1024:.0f} KiB")
+
+def _job_bench_app(args):
+    """Fixture database, app, admin client and a job runner for the job benchmarks"""
+    from config import Config
+
+    db_path = setup_fixture_db(num_patients=args.patients)
+    tmp_dir = os.path.dirname(db_path)
+    Config.DATABASE_URL = db_path
+    Config.AUDIT_ARCHIVE_INTERVAL = 0
+    Config.RATELIMIT_STORAGE_URL = f"sqlite:///{os.path.join(tmp_dir, 'rate_limit.db')}"
+    Config.ASSISTANT_CACHE_PATH = os.path.join(tmp_dir, 'assistant_cache.db')
+    Config.REPORT_CACHE_DIR = os.path.join(tmp_dir, 'reports')
+    # The runner is another process: it reads the settings from the environment
+    os.environ['REPORT_CACHE_DIR'] = Config.REPORT_CACHE_DIR
+    os.environ['JOB_POLL_INTERVAL'] = '0.1'
+    from app import create_app
+    from models.user import User
+    from services.jobs import start_job_runner
+
+    app = create_app()
+    User.create('Administrador', 'admin@bench.local', 'bench123', 'admin')
+    client = app.test_client()
+    client.post('/login', data={'email': 'admin@bench.local', 'senha': 'bench123'})
+    start_job_runner(db_path, args.workers)
+    return db_path, client
+
+def _follow_job(client, response):
+    """Poll the job a request redirected to until it ends; returns its status"""
+    assert response.status_code == 302, response.status_code
+    status_url = response.location.rstrip('/') + '/status'
+    while True:
+        job = client.get(status_url).get_json()
+        if job['estado'] in ('concluido', 'erro'):
+            assert job['estado'] == 'concluido', job['erro']
+            return job
+        time.sleep(0.05)
+
+def bench_pdf(args):
+    """Distribution report: HTML print page vs the PDF (job and cached)"""
+    import tracemalloc
+    from models.database import get_db_connection
+    from services.distribution_pdf import render_distribution_pdf
+    from services.jobs import stop_job_runner
+
+    db_path, client = _job_bench_app(args)
+    tmp_dir = os.path.dirname(db_path)
+
+    # Memory of the render itself, in this process (the route uses a job worker)
+    tracemalloc.start()
+    render_distribution_pdf(db_path, {}, 'Benchmark', os.path.join(tmp_dir, 'memoria.pdf'))
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    try:
+        print(f"{args.patients} pacientes\n")
+        samples = []
+        for _ in range(args.rounds):
+            started = time.perf_counter()
+            response = client.get('/relatorios/distribuicao/imprimir')
+            samples.append(time.perf_counter() - started)
+        report('HTML para impressão', samples)
+        print(f"{'':<28} {len(response.get_data()) / 1024:.0f} KiB")
+
+        started = time.perf_counter()
+        response = client.get('/relatorios/distribuicao/imprimir?formato=pdf')
+        enqueued = time.perf_counter() - started
+        job = _follow_job(client, response)
+        first = time.perf_counter() - started
+        response = client.get(job['download'])
+        size = len(response.get_data())
+        response.close()
+        report('PDF: requisição', [enqueued])
+        report('PDF: tarefa até o fim', [first])
+        print(f"{'':<28} {size / 1024:.0f} KiB, pico de memória {peak / 1024 / 1024:.1f} MiB")
+
+        samples = []
+        for _ in range(args.rounds):
+            started = time.perf_counter()
+            response = client.get('/relatorios/distribuicao/imprimir?formato=pdf')
+            samples.append(time.perf_counter() - started)
+            assert response.status_code == 200, response.status_code
+            response.close()
+        report('PDF (cache)', samples)
+
+        # A write bumps the data version: the next download is a new report
+        conn = get_db_connection()
+        conn.execute("UPDATE pacientes SET telefone = '11999990000' WHERE id = 1")
+        conn.commit()
+        started = time.perf_counter()
+        _follow_job(client, client.get('/relatorios/distribuicao/imprimir?formato=pdf'))
+        report('PDF após alteração', [time.perf_counter() - started])
+    finally:
+        stop_job_runner(timeout=10)
+
+def bench_jobs(args):
+    """Page latency while the CSV export and the PDF report run as jobs"""
+    import threading
+    from models.database import get_db_connection
+    from services.jobs import HANDLERS, stop_job_runner
+
+    db_path, client = _job_bench_app(args)
+    tmp_dir = os.path.dirname(db_path)
+
+    class InlineContext:
+        """Stand-in JobContext: runs the export the way the request used to"""
+        def progress(self, fraction, mensagem=None):
+            pass
+
+    started = time.perf_counter()
+    HANDLERS['exportar_procedimentos'](InlineContext(), os.path.join(tmp_dir, 'inline.csv'))
+    inline = time.perf_counter() - started
+
+    def page_latency(until):
+        samples = []
+        while not until() and len(samples) < args.rounds * 10:
+            started = time.perf_counter()
+            response = client.get('/dashboard')
+            samples.append(time.perf_counter() - started)
+            assert response.status_code in (200, 304), response.status_code
+        return samples
+
+    def job_done(response):
+        status_url = response.location.rstrip('/') + '/status'
+        return lambda: client.get(status_url).get_json()['estado'] in ('concluido', 'erro')
+
+    try:
+        print(f"{args.patients} pacientes, {args.workers} trabalhadores\n")
+        report('exportação na requisição', [inline])
+        report('/dashboard (fila vazia)', page_latency(lambda: False))
+
+        enqueue, busy = [], []
+        conn = get_db_connection()
+        for round_number in range(args.rounds):
+            # A write changes the data version, so every round is new work
+            conn.execute("UPDATE pacientes SET telefone = ? WHERE id = 1", (f'11{round_number:09d}',))
+            conn.commit()
+            started = time.perf_counter()
+            export = client.get('/relatorios/export/procedimentos.csv')
+            pdf = client.get('/relatorios/distribuicao/imprimir?formato=pdf')
+            enqueue.append((time.perf_counter() - started) / 2)
+            busy.extend(page_latency(lambda: job_done(export)() and job_done(pdf)()))
+            _follow_job(client, export)
+            _follow_job(client, pdf)
+        report('requisição que enfileira', enqueue)
+        report('/dashboard (tarefas rodando)', busy)
+    finally:
+        stop_job_runner(timeout=10)
+
+def bench_purge(args):
+    """Patient reset: one transaction vs chunked purge, seen by a concurrent writer"""
+    import shutil
+    import threading
+    from models.database import init_db, get_db_connection, close_db_connection, open_connection
+    from services.purge import PATIENT_PURGE, purge_bounds, purge_range, reclaim_space
+
+    db_path = setup_fixture_db(num_patients=args.patients)
+    get_db_connection().execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    close_db_connection()
+    copies = {}
+    for label in ('single', 'chunked'):
+        copies[label] = db_path.replace('.db', f'-{label}.db')
+        shutil.copy(db_path, copies[label])
+
+    def single_transaction():
+        conn = get_db_connection()
+        conn.execute('BEGIN')
+        for table in ('procedimentos', 'avaliacao_terapias', 'avaliacoes', 'pacientes'):
+            conn.execute(f'DELETE FROM {table}')
+        conn.commit()
+
+    def chunked():
+        ate_id, _ = purge_bounds('pacientes')
+        purge_range('pacientes', PATIENT_PURGE, ate_id)
+
+    def run(path, purge):
+        """Run purge while another connection writes every 5 ms; returns (seconds, write latencies)"""
+        close_db_connection()
+        init_db(path)
+        stop = threading.Event()
+        latencies = []
+
+        def writer():
+            conn = open_connection(path)
+            while not stop.is_set():
+                started = time.perf_counter()
+                conn.execute("UPDATE users SET nome = nome WHERE id = 1")
+                conn.commit()
+                latencies.append(time.perf_counter() - started)
+                time.sleep(0.005)
+            conn.close()
+
+        thread = threading.Thread(target=writer)
+        thread.start()
+        time.sleep(0.1)
+        started = time.perf_counter()
+        purge()
+        elapsed = time.perf_counter() - started
+        time.sleep(0.1)
+        stop.set()
+        thread.join()
+        return elapsed, latencies
+
+    print(f"{args.patients} pacientes\n")
+    for label, purge in (('single', single_transaction), ('chunked', chunked)):
+        elapsed, latencies = run(copies[label], purge)
+        name = 'uma transação' if label == 'single' else 'em lotes'
+        report(f'remoção {name}', [elapsed])
+        report('  escrita concorrente', latencies)
+        print(f"{'':<28} espera máxima {max(latencies) * 1000:.0f} ms")
+        assert get_db_connection().execute("SELECT COUNT(*) FROM pacientes").fetchone()[0] == 0
+
+    size = os.path.getsize(copies['chunked'])
+    started = time.perf_counter()
+    freed = reclaim_space(full=True)
+    report('VACUUM (primeira vez)', [time.perf_counter() - started])
+    print(f"{'':<28} {size / 1e6:.1f} MB -> {os.path.getsize(copies['chunked']) / 1e6:.1f} MB "
+          f"({freed / 1e6:.1f} MB livres)")
+
+def bench_metrics(args):
+    """Metrics: recording cost per call and per thread, request overhead, scrape time"""
+    import threading
+    from config import Config
+    from models.database import close_db_connection
+    from utils import metrics
+
+    counter = metrics.Counter('bench_total', 'benchmark', ('a',))
+    histogram = metrics.Histogram('bench_seconds', 'benchmark', ('a',))
+    lock = threading.Lock()
+    locked = {}
+
+    def locked_inc(key):
+        with lock:
+            locked[key] = locked.get(key, 0) + 1
+
+    calls = 200000
+    print(f"{calls} registros por thread, {args.clients} threads\n")
+    for label, record in (('Counter.inc', lambda: counter.inc('x')),
+                          ('Histogram.observe', lambda: histogram.observe(0.03, 'x')),
+                          ('dict sob um Lock', lambda: locked_inc('x'))):
+        for threads in (1, args.clients):
+            def work():
+                for _ in range(calls):
+                    record()
+            workers = [threading.Thread(target=work) for _ in range(threads)]
+            started = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - started
+            print(f"{label:<20} {threads} thread(s): {elapsed / (calls * threads) * 1e9:7.0f} ns/registro")
+
+    db_path = setup_fixture_db(num_patients=args.patients)
+    tmp_dir = os.path.dirname(db_path)
+    Config.DATABASE_URL = db_path
+    Config.AUDIT_ARCHIVE_INTERVAL = 0
+    Config.RATELIMIT_STORAGE_URL = f"sqlite:///{os.path.join(tmp_dir, 'rate_limit.db')}"
+    Config.ASSISTANT_CACHE_PATH = os.path.join(tmp_dir, 'assistant_cache.db')
+    Config.METRICS_DIR = os.path.join(tmp_dir, 'metrics')
+    from app import create_app
+    from models.user import User
+
+    User.create('Administrador', 'admin@bench.local', 'bench123', 'admin')
+    print(f"\n{args.patients} pacientes\n")
+    for enabled in (False, True):
+        Config.METRICS_ENABLED = enabled
+        close_db_connection()
+        app = create_app()
+        client = app.test_client()
+        client.post('/login', data={'email': 'admin@bench.local', 'senha': 'bench123'})
+        for path in ('/dashboard', '/distribuicao/'):
+            for _ in range(10):
+                client.get(path)  # templates compiled, caches warm
+            samples = []
+            for _ in range(args.rounds):
+                started = time.perf_counter()
+                response = client.get(path)
+                samples.append(time.perf_counter() - started)
+                assert response.status_code == 200, (path, response.status_code)
+            report(f"{path} {'com' if enabled else 'sem'} métricas", samples)
+
+    metrics.flush()
+    samples = []
+    for _ in range(args.rounds):
+        started = time.perf_counter()
+        response = client.get('/metrics')
+        samples.append(time.perf_counter() - started)
+        assert response.status_code == 200, response.status_code
+    report('/metrics', samples)
+    print(f"{'':<28} {len(response.get_data()) / 1024:.0f} KiB, "
+          f"{response.get_data(as_text=True).count(chr(10))} linhas")
+
+BENCHMARKS = {
+    'assistant': bench_assistant,
+    'assistant-cache': bench_assistant_cache,
+    'rate-limit': bench_rate_limit,
+    'login': bench_login,
+    'audit': bench_audit,
+    'backup': bench_backup,
+    'cdc': bench_cdc,
+    'importtime': bench_importtime,
+    'server': bench_server,
+    'replica': bench_replica,
+    'batch': bench_batch,
+    'patient-record': bench_patient_record,
+    'kanban': bench_kanban,
+    'pdf': bench_pdf,
+    'jobs': bench_jobs,
+    'purge': bench_purge,
+    'metrics': bench_metrics,
+}
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks do Sistema TEA')
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS))
+    parser.add_argument('--patients', type=int, default=500)
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--latency-ms', type=float, default=800)
+    parser.add_argument('--keys', type=int, default=1000000)
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--pages', type=int, default=256)
+    parser.add_argument('--write-interval-ms', type=float, default=5)
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--rtt-ms', type=float, default=40)
+    parser.add_argument('--evaluations', type=int, default=40)
+    parser.add_argument('--workers', type=int, default=2)
+    args = parser.parse_args()
+
+    BENCHMARKS[args.benchmark](args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# Sistema de Registro de Avaliações - Clínica TEA
+# Criado por João Layon
+
+"""
+Static asset build
+Produces, in static/dist:
+- app.<hash>.css: Tailwind purged to the classes used in templates/ and
+  static/js, plus static/css/custom.css (its @apply rules are compiled too)
+- app.<hash>.js: static/src/icons.js + static/js/app.js, minified
+- icons.<hash>.svg: sprite with only the Feather icons the pages reference
+- .gz and .br copies of each, and manifest.json (read by utils/assets.py)
+
+Needs Node.js and the dev dependencies in package.json (npm install).
+
+Usage:
+    python scripts/build_assets.py
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+# Add the parent directory to the Python path so we can import our modules
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from utils.assets import DIST_DIR, MANIFEST_FILE, load_manifest
+
+ROOT = Path(__file__).parent.parent
+STATIC = ROOT / 'static'
+DIST = STATIC / DIST_DIR
+ICONS_DIR = ROOT / 'node_modules' / 'feather-icons' / 'dist' / 'icons'
+
+# Icons whose names are built at runtime and can't be found by scanning
+EXTRA_ICONS = []
+
+ICON_PATTERN = re.compile(r'''data-feather=["']([a-z0-9-]+)["']''')
+
+# Node's zlib has brotli built in, so no Python package is needed for .br files
+BROTLI_JS = """
+const fs = require('fs'), zlib = require('zlib');
+for (const file of process.argv.slice(1)) {
+    const data = fs.readFileSync(file);
+    fs.writeFileSync(file + '.br', zlib.brotliCompressSync(data, {
+        params: {[zlib.constants.BROTLI_PARAM_QUALITY]: 11, [zlib.constants.BROTLI_PARAM_SIZE_HINT]: data.length}
+    }));
+}
+"""
+
+def run(command, stdin=None):
+    result = subprocess.run(command, cwd=ROOT, input=stdin, capture_output=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"{' '.join(command)} falhou:\n{result.stderr.decode('utf-8', 'replace')}")
+    return result.stdout
+
+def build_css():
+    return run(['npx', '--no-install', 'tailwindcss', '-c', 'tailwind.config.js',
+                '-i', 'static/src/main.css', '--minify'])
+
+def build_js():
+    source = b'\n;\n'.join((STATIC / name).read_bytes() for name in ('src/icons.js', 'js/app.js'))
+    # Transform mode (no bundling) keeps app.js's top-level functions global,
+    # since templates call them from inline handlers
+    return run(['npx', '--no-install', 'esbuild', '--minify', '--loader=js', '--target=es2017'], stdin=source)
+
+def used_icons():
+    names = set(EXTRA_ICONS)
+    for folder, pattern in ((ROOT / 'templates', '*.html'), (STATIC / 'js', '*.js'), (STATIC / 'src', '*.js')):
+        for path in folder.rglob(pattern):
+            names.update(ICON_PATTERN.findall(path.read_text(encoding='utf-8')))
+    return sorted(names)
+
+def build_sprite():
+    symbols = []
+    for name in used_icons():
+        path = ICONS_DIR / f'{name}.svg'
+        if not path.exists():
+            print(f"  aviso: ícone '{name}' não existe no Feather, ignorado")
+            continue
+        inner = re.search(r'<svg[^>]*>(.*)</svg>', path.read_text(encoding='utf-8'), re.S).group(1)
+        symbols.append(f'<symbol id="{name}" viewBox="0 0 24 24">{inner.strip()}</symbol>')
+    sprite = '<svg xmlns="http://www.w3.org/2000/svg">' + ''.join(symbols) + '</svg>'
+    return sprite.encode('utf-8'), len(symbols)
+
+def write_fingerprinted(logical_name, content):
+    """Write dist/<stem>.<hash>.<ext> with .gz/.br siblings; returns its path under static/"""
+    stem, ext = os.path.splitext(logical_name)
+    digest = hashlib.sha256(content).hexdigest()[:10]
+    filename = f'{stem}.{digest}{ext}'
+    path = DIST / filename
+    path.write_bytes(content)
+    # mtime=0 keeps the .gz byte-identical between builds of the same content
+    with open(f'{path}.gz', 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=9, mtime=0) as f:
+        f.write(content)
+    run(['node', '-e', BROTLI_JS, str(path)])
+    return f'{DIST_DIR}/{filename}'
+
+def remove_stale(keep):
+    for path in DIST.iterdir():
+        base = path.name.removesuffix('.gz').removesuffix('.br')
+        if path.name != MANIFEST_FILE and f'{DIST_DIR}/{base}' not in keep:
+            path.unlink()
+
+def main():
+    print("🔨 Gerando assets estáticos...")
+    try:
+        DIST.mkdir(parents=True, exist_ok=True)
+        sprite, icon_count = build_sprite()
+        bundles = {
+            'app.css': build_css(),
+            'app.js': build_js(),
+            'icons.svg': sprite,
+        }
+
+        # Files from the previous build stay until the next one, so processes
+        # still running with the old manifest keep serving them
+        previous = load_manifest(str(STATIC))
+
+        manifest = {}
+        for logical_name, content in bundles.items():
+            manifest[logical_name] = write_fingerprinted(logical_name, content)
+            sizes = [os.path.getsize(STATIC / (manifest[logical_name] + suffix)) for suffix in ('', '.gz', '.br')]
+            print(f"✓ {manifest[logical_name]:<32} {sizes[0] / 1024:7.1f} KB  "
+                  f"gz {sizes[1] / 1024:6.1f} KB  br {sizes[2] / 1024:6.1f} KB")
+        print(f"  {icon_count} ícones no sprite")
+
+        (DIST / MANIFEST_FILE).write_text(json.dumps(manifest, indent=2, sort_keys=True), encoding='utf-8')
+        remove_stale(set(manifest.values()) | set(previous.values()))
+        print(f"✓ {DIST_DIR}/{MANIFEST_FILE} atualizado (reinicie a aplicação para usar os novos arquivos)")
+
+    except Exception as e:
+        print(f"❌ Erro ao gerar assets: {str(e)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# Sistema de Registro de Avaliações - Clínica TEA
+# Criado por João Layon
+
+"""
+Background job workers
+Keeps --workers processes taking jobs from the tarefas queue (patient reset,
+CSV exports, PDF reports) until SIGTERM or Ctrl+C, restarting any that die.
+The server starts this script by itself when JOB_WORKERS > 0; with
+JOB_WORKERS=0 run it separately (another container, a systemd unit...).
+
+Usage:
+    python scripts/job_worker.py [--workers 2]
+"""
+
+import argparse
+import logging
+import os
+import sys
+from pathlib import Path
+
+# Add the parent directory to the Python path so we can import our modules
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config import Config
+from services.jobs import run_job_workers
+
+def detach():
+    """Go on in a grandchild that nobody waits for; the parent prints its pid and exits"""
+    pid = os.fork()
+    if pid:
+        print(pid, flush=True)
+        os._exit(0)
+    # The caller reads stdout up to EOF: the grandchild must not keep it open
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+def main():
+    parser = argparse.ArgumentParser(description='Trabalhadores de tarefas em segundo plano')
+    parser.add_argument('--database', default=Config.DATABASE_URL)
+    parser.add_argument('--workers', type=int, default=Config.JOB_WORKERS or 1)
+    parser.add_argument('--parent-pid', type=int, default=None,
+                        help='sair quando este processo sair (usado pelo servidor)')
+    parser.add_argument('--detach', action='store_true',
+                        help='seguir em segundo plano e escrever o pid (usado pelo servidor)')
+    args = parser.parse_args()
+
+    if args.detach:
+        detach()
+
+    logging.basicConfig(level=logging.INFO)
+    run_job_workers(args.database, args.workers, parent_pid=args.parent_pid)
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,126 @@
 import json
 import os
-from google import genai
-from google.genai import types
+import re
+import time
+from threading import Lock
 from models.patient import Patient
 from models.user import User
-from models.evaluation import Evaluation
 from models.procedure import Procedure
+from models.patient_record import PatientRecord
 from models.database import get_db_connection
+from utils.helpers import format_date, format_datetime
+from utils.metrics import Histogram
+from services.response_cache import ResponseCache, get_response_cache
+
+# Perguntas estruturadas respondidas direto do banco, sem chamada ao modelo.
+# A ordem importa: o primeiro padrão que casar define a intenção.
+FAST_PATH_INTENTS = [
+    ('patient_location', re.compile(
+        r'^(?:onde est[aá]|com qual (?:m[eé]dico|profissional) est[aá]|qual (?:[eé] )?o status d[oa])\s+(?P<alvo>.+?)\s*\??$',
+        re.IGNORECASE)),
+    ('patient_evaluators', re.compile(
+        r'^(?:quem avaliou|quais (?:m[eé]dicos|profissionais) j[aá] (?:atenderam|avaliaram))\s+(?P<alvo>.+?)\s*\??$',
+        re.IGNORECASE)),
+    ('patient_evaluator_ordinal', re.compile(
+        r'^qual (?:m[eé]dico|profissional) fez a (?P<ordem>primeira|[uú]ltima) avalia[cç][aã]o d[eoa]\s+(?P<alvo>.+?)\s*\??$',
+        re.IGNORECASE)),
+    ('doctor_patient_count', re.compile(
+        r'^quantos pacientes (?:tem|possui|est[aã]o com)\s+(?P<alvo>.+?)\s*\??$',
+        re.IGNORECASE)),
+    ('doctor_patients', re.compile(
+        r'^quais pacientes (?:est[aã]o com|s[aã]o d[oa]|tem)\s+(?P<alvo>.+?)\s*\??$',
+        re.IGNORECASE)),
+    ('specialty_doctors', re.compile(
+        r'^quem s[aã]o os (?:m[eé]dicos|profissionais) de\s+(?P<alvo>.+?)\s*\??$',
+        re.IGNORECASE)),
+]
+
+_PATIENT_PREFIX = re.compile(r'^(?:(?:o|a|do|da)\s+)?(?:paciente\s+)?(?:com\s+)?(?:cpf\s+)?', re.IGNORECASE)
+_DOCTOR_PREFIX = re.compile(r'^(?:(?:o|a|do|da)\s+)?(?:(?:dra|dr)\.?|doutora?)?\s*', re.IGNORECASE)
+
+_DOCTOR_TITLE = re.compile(r'^(?:dra|dr|doutora?)\b', re.IGNORECASE)
+
+STATE_LABELS = {
+    'pendente': 'Pendente',
+    'alocado': 'Alocado',
+    'em_atendimento': 'Em Atendimento',
+    'concluido': 'Concluído'
+}
+
+def _doctor_label(nome):
+    """Nome do médico com título, sem duplicar quando o cadastro já o inclui"""
+    if _DOCTOR_TITLE.match(nome or ''):
+        return nome
+    return f'Dr(a). {nome}'
+
+# Contadores do caminho rápido (compartilhados entre requisições do processo)
+_stats_lock = Lock()
+_stats = {
+    'fast_path_hits': 0,
+    'cache_hits': 0,
+    'model_calls': 0,
+    'fast_path_seconds': 0.0,
+    'cache_seconds': 0.0,
+    'model_seconds': 0.0
+}
+
+# Mesmas medidas para o /metrics, por origem da resposta (fast_path, cache,
+# model ou error); a taxa de acerto do cache sai das contagens de cache e model
+ANSWER_SECONDS = Histogram('tea_assistant_answer_seconds',
+                           'Tempo de resposta do assistente por origem', ('source',))
+
+def _record_stat(source, elapsed):
+    ANSWER_SECONDS.observe(elapsed, source)
+    with _stats_lock:
+        if source == 'fast_path':
+            _stats['fast_path_hits'] += 1
+            _stats['fast_path_seconds'] += elapsed
+        elif source == 'cache':
+            _stats['cache_hits'] += 1
+            _stats['cache_seconds'] += elapsed
+        else:
+            _stats['model_calls'] += 1
+            _stats['model_seconds'] += elapsed
+
+def get_assistant_stats():
+    """Retorna contadores do caminho rápido e taxa de acerto"""
+    with _stats_lock:
+        stats = dict(_stats)
+    
+    total = stats['fast_path_hits'] + stats['cache_hits'] + stats['model_calls']
+    stats['total_questions'] = total
+    stats['fast_path_hit_rate'] = stats['fast_path_hits'] / total if total else 0.0
+    cacheable = stats['cache_hits'] + stats['model_calls']
+    stats['cache_hit_ratio'] = stats['cache_hits'] / cacheable if cacheable else 0.0
+    stats['fast_path_avg_ms'] = (stats['fast_path_seconds'] / stats['fast_path_hits'] * 1000
+                                 if stats['fast_path_hits'] else 0.0)
+    stats['model_avg_ms'] = (stats['model_seconds'] / stats['model_calls'] * 1000
+                             if stats['model_calls'] else 0.0)
+    stats['cache_saved_seconds'] = get_response_cache().get_stats()['saved_seconds']
+    return stats
+
+def reset_assistant_stats():
+    """Zera os contadores do caminho rápido"""
+    with _stats_lock:
+        for key in _stats:
+            _stats[key] = 0 if isinstance(_stats[key], int) else 0.0
 
 class AIAssistant:
-    def __init__(self):
-        api_key = os.environ.get("GEMINI_API_KEY")
-        if not api_key:
-            raise ValueError("GEMINI_API_KEY não encontrada nas variáveis de ambiente")
+    def __init__(self, client=None, cache=None):
+        if client is None:
+            api_key = os.environ.get("GEMINI_API_KEY")
+            if not api_key:
+                raise ValueError("GEMINI_API_KEY não encontrada nas variáveis de ambiente")
+            
+            # google.genai leva ~0.5 s para importar: só carrega quando o cliente é criado
+            from google import genai
+            
+            # IMPORTANT: Note that the newest Gemini model series is "gemini-2.5-flash" or gemini-2.5-pro"
+            # do not change this unless explicitly requested by the user
+            client = genai.Client(api_key=api_key)
         
-        # IMPORTANT: Note that the newest Gemini model series is "gemini-2.5-flash" or gemini-2.5-pro"
-        # do not change this unless explicitly requested by the user
-        self.client = genai.Client(api_key=api_key)
+        self.client = client
+        self.cache = cache if cache is not None else get_response_cache()
         
     def get_patient_info(self, patient_query):
         """Busca informações do paciente por nome ou CPF"""
@@ -35,34 +139,34 @@ class AIAssistant:
             print(f"Erro ao buscar paciente: {e}")
             return []
     
-    def get_patient_current_status(self, patient_id):
-        """Obtém o status atual do paciente - com que profissional está"""
-        try:
-            conn = get_db_connection()
-            
-            # Busca procedimentos ativos (alocado ou em atendimento)
-            active_procedures = conn.execute("""
-                SELECT p.*, u.nome as medico_nome, u.especialidade
-                FROM procedimentos p
-                LEFT JOIN users u ON p.medico_responsavel_id = u.id
-                WHERE p.paciente_id = ? AND p.estado IN ('alocado', 'em_atendimento')
-                ORDER BY p.atualizado_em DESC
-            """, (patient_id,)).fetchall()
-            
-            return [dict(row) for row in active_procedures]
-        except Exception as e:
-            print(f"Erro ao buscar status do paciente: {e}")
-            return []
-    
     def get_patient_evaluations(self, patient_id):
         """Obtém avaliações do paciente"""
         try:
-            evaluations = Evaluation.get_by_patient_id(patient_id)
-            return evaluations
+            record = PatientRecord.load(patient_id)
+            return record.evaluations if record else []
         except Exception as e:
             print(f"Erro ao buscar avaliações: {e}")
             return []
     
+    def add_patient_history(self, context_data, patient_id):
+        """Adiciona atribuições atuais e avaliações do paciente ao contexto, em uma única consulta"""
+        try:
+            record = PatientRecord.load(patient_id)
+        except Exception as e:
+            print(f"Erro ao buscar histórico do paciente: {e}")
+            return
+        if not record:
+            return
+        
+        # id, atualizado_em e medico_responsavel_id entram na chave do cache (context_fingerprint)
+        context_data["current_assignments"].extend(
+            {'id': p.id, 'especialidade': p.especialidade, 'estado': p.estado,
+             'atualizado_em': p.atualizado_em, 'medico_responsavel_id': p.medico_responsavel_id,
+             'medico_nome': p.medico_nome}
+            for p in record.procedures if p.estado in ('alocado', 'em_atendimento')
+        )
+        context_data["evaluations"].extend(record.evaluations)
+    
     def get_doctor_info(self, doctor_query):
         """Busca informações do médico por nome"""
         try:
@@ -108,11 +212,7 @@ class AIAssistant:
                     
                     # Para cada paciente encontrado, busca status atual e avaliações
                     for patient in patients:
-                        status = self.get_patient_current_status(patient.id)
-                        context_data["current_assignments"].extend(status)
-                        
-                        evaluations = self.get_patient_evaluations(patient.id)
-                        context_data["evaluations"].extend(evaluations)
+                        self.add_patient_history(context_data, patient.id)
         
         # Procura por CPFs na pergunta (sequência de números)
         import re
@@ -124,11 +224,7 @@ class AIAssistant:
                 context_data["patients"].extend(patients)
                 
                 for patient in patients:
-                    status = self.get_patient_current_status(patient.id)
-                    context_data["current_assignments"].extend(status)
-                    
-                    evaluations = self.get_patient_evaluations(patient.id)
-                    context_data["evaluations"].extend(evaluations)
+                    self.add_patient_history(context_data, patient.id)
         
         # Se a pergunta menciona médicos
         if "médico" in question_lower or "doutor" in question_lower or "dra" in question_lower:
@@ -167,11 +263,207 @@ class AIAssistant:
         
         return "\n".join(formatted_context)
     
+    def match_intent(self, user_question):
+        """Identifica perguntas estruturadas que dispensam o modelo"""
+        question = ' '.join(user_question.split())
+        for intent, pattern in FAST_PATH_INTENTS:
+            match = pattern.match(question)
+            if match:
+                return intent, match.groupdict()
+        return None, None
+    
+    def find_patients_indexed(self, target):
+        """Localiza pacientes por CPF (índice único) ou prefixo do nome (idx_pacientes_nome)"""
+        target = _PATIENT_PREFIX.sub('', target).strip()
+        if not target:
+            return []
+        
+        digits = re.sub(r'\D', '', target)
+        if len(digits) == 11:
+            patient = Patient.get_by_cpf(digits)
+            return [patient] if patient else []
+        
+        patients = Patient.find_by_name_prefix(target, limit=5)
+        if not patients:
+            # Nome digitado em minúsculas ou parcial: busca por conteúdo
+            patients = Patient.search(target, limit=5)
+        return patients
+    
+    def find_doctors(self, target):
+        """Localiza médicos pelo nome, ignorando títulos (Dr., Dra.)"""
+        target = _DOCTOR_PREFIX.sub('', target).strip()
+        if not target:
+            return []
+        return self.get_doctor_info(target)
+    
+    def answer_fast_path(self, user_question):
+        """Responde perguntas estruturadas direto do banco.
+
+        Retorna None quando não reconhece a pergunta ou quando ela casa com um
+        padrão mas não aponta para um paciente/médico existente ("Quantos
+        pacientes tem a clínica?"): essas ficam para o modelo.
+        """
+        intent, params = self.match_intent(user_question)
+        if not intent:
+            return None
+        
+        handler = getattr(self, f'_answer_{intent}')
+        return handler(**params)
+    
+    def _answer_patient_location(self, alvo):
+        patients = self.find_patients_indexed(alvo)
+        if not patients:
+            return None
+        
+        conn = get_db_connection()
+        lines = []
+        for patient in patients:
+            rows = conn.execute("""
+                SELECT p.especialidade, p.estado, u.nome as medico_nome
+                FROM procedimentos p
+                LEFT JOIN users u ON p.medico_responsavel_id = u.id
+                WHERE p.paciente_id = ? AND p.estado != 'concluido'
+                ORDER BY p.especialidade
+            """, (patient.id,)).fetchall()
+            
+            active = [r for r in rows if r['estado'] in ('alocado', 'em_atendimento')]
+            pending = [r['especialidade'] for r in rows if r['estado'] == 'pendente']
+            
+            if active:
+                details = '; '.join(
+                    f"{_doctor_label(r['medico_nome'])} ({r['especialidade']}, {STATE_LABELS[r['estado']]})"
+                    for r in active
+                )
+                line = f'{patient.nome} está com: {details}.'
+            else:
+                line = f'{patient.nome} não está alocado(a) a nenhum profissional no momento.'
+            
+            if pending:
+                line += f' Aguardando distribuição em: {", ".join(pending)}.'
+            lines.append(line)
+        
+        return ' '.join(lines), True
+    
+    def _answer_patient_evaluators(self, alvo, ordem=None):
+        patients = self.find_patients_indexed(alvo)
+        if not patients:
+            return None
+        
+        direction = 'ASC' if ordem and ordem.lower() == 'primeira' else 'DESC'
+        conn = get_db_connection()
+        lines = []
+        for patient in patients:
+            rows = conn.execute(f"""
+                SELECT a.especialidade, a.criado_em, u.nome as medico_nome
+                FROM avaliacoes a
+                JOIN users u ON a.medico_id = u.id
+                WHERE a.paciente_id = ?
+                ORDER BY a.criado_em {direction}, a.id {direction}
+            """, (patient.id,)).fetchall()
+            
+            if not rows:
+                lines.append(f'{patient.nome} ainda não possui avaliações registradas.')
+            elif ordem:
+                row = rows[0]
+                lines.append(f'A {ordem.lower()} avaliação de {patient.nome} foi feita por '
+                             f'{_doctor_label(row["medico_nome"])} ({row["especialidade"]}) em {format_datetime(row["criado_em"])}.')
+            else:
+                details = '; '.join(
+                    f'{_doctor_label(r["medico_nome"])} ({r["especialidade"]}, {format_date(r["criado_em"])})' for r in rows
+                )
+                lines.append(f'{patient.nome} foi avaliado(a) por: {details}.')
+        
+        return ' '.join(lines), True
+    
+    def _answer_patient_evaluator_ordinal(self, alvo, ordem):
+        return self._answer_patient_evaluators(alvo, ordem=ordem)
+    
+    def _doctor_active_patients(self, doctor_id):
+        conn = get_db_connection()
+        return conn.execute("""
+            SELECT DISTINCT pac.nome
+            FROM procedimentos p
+            JOIN pacientes pac ON p.paciente_id = pac.id
+            WHERE p.medico_responsavel_id = ? AND p.estado IN ('alocado', 'em_atendimento')
+            ORDER BY pac.nome
+        """, (doctor_id,)).fetchall()
+    
+    def _answer_doctor_patient_count(self, alvo):
+        doctors = self.find_doctors(alvo)
+        if not doctors:
+            return None
+        
+        conn = get_db_connection()
+        lines = []
+        for doctor in doctors:
+            count = conn.execute("""
+                SELECT COUNT(DISTINCT paciente_id) FROM procedimentos
+                WHERE medico_responsavel_id = ? AND estado IN ('alocado', 'em_atendimento')
+            """, (doctor['id'],)).fetchone()[0]
+            noun = 'paciente' if count == 1 else 'pacientes'
+            lines.append(f'{_doctor_label(doctor["nome"])} ({doctor["especialidade"]}) tem {count} {noun} '
+                         f'alocado(s) ou em atendimento.')
+        return ' '.join(lines), True
+    
+    def _answer_doctor_patients(self, alvo):
+        doctors = self.find_doctors(alvo)
+        if not doctors:
+            return None
+        
+        lines = []
+        for doctor in doctors:
+            names = [row['nome'] for row in self._doctor_active_patients(doctor['id'])]
+            if names:
+                lines.append(f'Pacientes com {_doctor_label(doctor["nome"])}: {", ".join(names)}.')
+            else:
+                lines.append(f'{_doctor_label(doctor["nome"])} não tem pacientes alocados no momento.')
+        return ' '.join(lines), True
+    
+    def _answer_specialty_doctors(self, alvo):
+        conn = get_db_connection()
+        rows = conn.execute("""
+            SELECT nome, especialidade FROM users
+            WHERE perfil = 'medico' AND ativo = 1 AND especialidade = ? COLLATE NOCASE
+            ORDER BY nome
+        """, (alvo.strip(),)).fetchall()
+        
+        if not rows:
+            return None
+        
+        names = ', '.join(_doctor_label(row['nome']) for row in rows)
+        return f'Médicos de {rows[0]["especialidade"]}: {names}.', True
+    
     def ask_question(self, user_question, user_name=None):
         """Processa uma pergunta do usuário e retorna uma resposta"""
+        started = time.perf_counter()
         try:
+            fast_answer = self.answer_fast_path(user_question)
+            if fast_answer is not None:
+                answer, context_found = fast_answer
+                _record_stat('fast_path', time.perf_counter() - started)
+                return {
+                    "success": True,
+                    "answer": answer,
+                    "context_found": context_found,
+                    "source": "fast_path"
+                }
+            
             # Prepara dados do contexto
             context_data = self.prepare_context_data(user_question)
+            context_found = len(context_data["patients"]) > 0 or len(context_data["doctors"]) > 0
+            
+            # Reaproveita a resposta enquanto os dados usados não mudarem
+            cache_key = ResponseCache.make_key(user_question, context_data)
+            cached_answer = self.cache.get(cache_key)
+            if cached_answer is not None:
+                _record_stat('cache', time.perf_counter() - started)
+                return {
+                    "success": True,
+                    "answer": cached_answer,
+                    "context_found": context_found,
+                    "source": "cache"
+                }
+            
             formatted_context = self.format_context_for_ai(context_data)
             
             # Prepara o prompt para a IA
@@ -204,13 +496,20 @@ class AIAssistant:
                 contents=combined_prompt
             )
             
+            elapsed = time.perf_counter() - started
+            _record_stat('model', elapsed)
+            if response.text:
+                self.cache.set(cache_key, response.text, elapsed)
+            
             return {
                 "success": True,
                 "answer": response.text or "Não consegui processar sua pergunta.",
-                "context_found": len(context_data["patients"]) > 0 or len(context_data["doctors"]) > 0
+                "context_found": context_found,
+                "source": "model"
             }
             
         except Exception as e:
+            ANSWER_SECONDS.observe(time.perf_counter() - started, 'error')
             return {
                 "success": False,
                 "error": f"Erro ao processar pergunta: {str(e)}",
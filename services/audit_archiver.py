@@ -0,0 +1,62 @@
+# Sistema de Registro de Avaliações - Clínica TEA
+# Criado por João Layon
+
+import logging
+import threading
+from models.database import get_db_connection, close_db_connection
+
+logger = logging.getLogger(__name__)
+
+_thread = None
+_stop = threading.Event()
+
+def run_archiver_once(db_url=None):
+    """Arquiva linhas frias e aplica a retenção; retorna (movidas, partições removidas)"""
+    from models.audit import archive_audit_logs, apply_audit_retention
+    get_db_connection(db_url)
+    moved = archive_audit_logs()
+    dropped = apply_audit_retention()
+    if moved or dropped:
+        logger.info("Auditoria: %d registros arquivados, %d partições removidas", moved, len(dropped))
+    return moved, dropped
+
+def run_change_log_compaction(db_url=None):
+    """Remove do log de alterações o que todos os consumidores já leram ou expirou"""
+    from models.change_log import compact_changes
+    get_db_connection(db_url)
+    consumed, expired = compact_changes()
+    if consumed or expired:
+        logger.info("Alterações: %d consumidas e %d expiradas removidas", consumed, expired)
+    return consumed, expired
+
+def _loop(db_url, interval):
+    # A conexão é por thread: abre a do banco configurado antes de qualquer consulta
+    get_db_connection(db_url)
+    while not _stop.is_set():
+        try:
+            run_archiver_once(db_url)
+        except Exception:
+            logger.exception("Falha ao arquivar registros de auditoria")
+        try:
+            run_change_log_compaction(db_url)
+        except Exception:
+            logger.exception("Falha ao compactar o log de alterações")
+        _stop.wait(interval)
+    close_db_connection()
+
+def start_audit_archiver(db_url, interval):
+    """Inicia o arquivador em segundo plano (uma thread daemon por processo)"""
+    global _thread
+    if interval <= 0 or (_thread and _thread.is_alive()):
+        return _thread
+    _stop.clear()
+    _thread = threading.Thread(target=_loop, args=(db_url, interval),
+                               name='audit-archiver', daemon=True)
+    _thread.start()
+    return _thread
+
+def stop_audit_archiver(timeout=None):
+    """Sinaliza o fim do arquivador e espera até timeout segundos pela thread"""
+    _stop.set()
+    if _thread and _thread.is_alive():
+        _thread.join(timeout)
@@ -0,0 +1,326 @@
+# Sistema de Registro de Avaliações - Clínica TEA
+# Criado por João Layon
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+import zlib
+from contextlib import contextmanager
+from datetime import datetime
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class BackupError(Exception):
+    """Falha ao criar, verificar ou restaurar um snapshot"""
+
+def database_path(db_url):
+    """Caminho do arquivo SQLite local para a URL configurada"""
+    if db_url.startswith('sqlitecloud://'):
+        raise BackupError("Backup online disponível apenas para banco SQLite local")
+    if db_url.startswith('sqlite:///'):
+        return db_url[10:]
+    return db_url
+
+def online_backup(src_path, dest_path, pages=None, pause=None, progress=None, max_restarts=None):
+    """Cópia consistente pela API de backup online do SQLite.
+
+    Em modo WAL a cópia é feita num único passo: ela lê um snapshot fixo e
+    escritores nunca esperam por leitores. Nos outros modos cada passo copia
+    `pages` páginas segurando um lock de leitura, liberado entre os passos
+    (com uma pausa de `pause` segundos), então um escritor com BEGIN
+    IMMEDIATE espera no máximo um passo. Uma escrita de outra conexão faz o
+    SQLite recomeçar a cópia; depois de `max_restarts` recomeços o backup
+    desiste em vez de travar os escritores.
+
+    Retorna a duração, o número de passos e o maior passo (o pior atraso
+    imposto a um escritor).
+    """
+    pages = pages or Config.BACKUP_PAGES_PER_STEP
+    pause = Config.BACKUP_STEP_PAUSE if pause is None else pause
+    max_restarts = Config.BACKUP_MAX_RESTARTS if max_restarts is None else max_restarts
+    stats = {'passos': 0, 'maior_passo': 0.0, 'tempo_em_lock': 0.0, 'reinicios': 0}
+    state = {'started': time.perf_counter(), 'remaining': None}
+
+    def on_step(status, remaining, total):
+        elapsed = time.perf_counter() - state['started']
+        stats['passos'] += 1
+        stats['tempo_em_lock'] += elapsed
+        stats['maior_passo'] = max(stats['maior_passo'], elapsed)
+
+        if state['remaining'] is not None and remaining >= state['remaining']:
+            stats['reinicios'] += 1
+            if stats['reinicios'] > max_restarts:
+                raise BackupError("O banco foi alterado durante toda a cópia; "
+                                  "ative o modo WAL ou tente em um horário com menos escritas")
+        state['remaining'] = remaining
+
+        if progress:
+            progress(total - remaining, total)
+        if remaining:
+            time.sleep(pause)
+        state['started'] = time.perf_counter()
+
+    started = time.perf_counter()
+    src = sqlite3.connect(src_path, timeout=30)
+    dst = sqlite3.connect(dest_path)
+    try:
+        stats['modo'] = src.execute('PRAGMA journal_mode').fetchone()[0]
+        if stats['modo'] == 'wal':
+            pages = -1
+        src.backup(dst, pages=pages, progress=on_step)
+    finally:
+        dst.close()
+        src.close()
+    stats['duracao'] = time.perf_counter() - started
+    return stats
+
+def integrity_check(path):
+    """Resultado do PRAGMA integrity_check ('ok' quando íntegro)"""
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        rows = conn.execute('PRAGMA integrity_check').fetchall()
+    finally:
+        conn.close()
+    return '; '.join(row[0] for row in rows)
+
+class SnapshotStore:
+    """Snapshots incrementais comprimidos de um banco SQLite.
+
+    O arquivo copiado é dividido em blocos de tamanho fixo, endereçados pelo
+    SHA-256 e gravados com zlib em chunks/. Cada snapshot é um manifesto JSON
+    com a lista de blocos, então um snapshot novo só grava os blocos que
+    mudaram desde os anteriores.
+
+    Gravar um snapshot e apagar blocos órfãos se excluem por um flock em
+    .lock (os trabalhadores de tarefas e scripts/backup.py podem rodar ao
+    mesmo tempo): sem isso a limpeza apagaria um bloco que o snapshot em
+    gravação encontrou pronto e não regravou.
+    """
+
+    def __init__(self, backup_dir=None, chunk_size=None):
+        self.backup_dir = backup_dir or Config.BACKUP_DIR
+        self.chunk_size = chunk_size or Config.BACKUP_CHUNK_SIZE
+        self.chunks_dir = os.path.join(self.backup_dir, 'chunks')
+        self.snapshots_dir = os.path.join(self.backup_dir, 'snapshots')
+
+    def _chunk_path(self, digest):
+        return os.path.join(self.chunks_dir, digest[:2], digest + '.z')
+
+    def _manifest_path(self, snapshot_id):
+        if not snapshot_id.replace('-', '').isdigit():
+            raise BackupError(f"Snapshot inválido: {snapshot_id}")
+        return os.path.join(self.snapshots_dir, snapshot_id + '.json')
+
+    @contextmanager
+    def _locked(self, exclusive=True):
+        """Lock de gravação (exclusive) ou de leitura dos blocos, entre processos"""
+        import fcntl
+        os.makedirs(self.backup_dir, exist_ok=True)
+        with open(os.path.join(self.backup_dir, '.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            yield
+
+    def create(self, db_path, pages=None, pause=None, progress=None):
+        """Copia o banco online e grava um snapshot; retorna o manifesto"""
+        os.makedirs(self.chunks_dir, exist_ok=True)
+        os.makedirs(self.snapshots_dir, exist_ok=True)
+
+        fd, copy_path = tempfile.mkstemp(suffix='.db', dir=self.backup_dir)
+        os.close(fd)
+        try:
+            stats = online_backup(db_path, copy_path, pages, pause, progress)
+            # Do primeiro bloco ao manifesto: a partir daqui prune não pode rodar
+            with self._locked():
+                manifest = self._store(db_path, copy_path, stats)
+        finally:
+            os.remove(copy_path)
+        return manifest
+
+    def _store(self, db_path, copy_path, stats):
+        started = time.perf_counter()
+        chunks, new_chunks, stored_bytes = [], 0, 0
+        file_hash = hashlib.sha256()
+        with open(copy_path, 'rb') as f:
+            while True:
+                block = f.read(self.chunk_size)
+                if not block:
+                    break
+                file_hash.update(block)
+                digest = hashlib.sha256(block).hexdigest()
+                chunks.append(digest)
+
+                path = self._chunk_path(digest)
+                if not os.path.exists(path):
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    data = zlib.compress(block, 6)
+                    _write_atomic(path, data)
+                    new_chunks += 1
+                    stored_bytes += len(data)
+        size = os.path.getsize(copy_path)
+
+        snapshot_id = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+        manifest = {
+            'id': snapshot_id,
+            'criado_em': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'origem': os.path.abspath(db_path),
+            'tamanho': size,
+            'sha256': file_hash.hexdigest(),
+            'chunk_size': self.chunk_size,
+            'chunks': chunks,
+            'novos_chunks': new_chunks,
+            'bytes_gravados': stored_bytes,
+            'duracao_backup': stats['duracao'],
+            'duracao_compressao': time.perf_counter() - started,
+            'passos': stats['passos'],
+            'maior_passo': stats['maior_passo'],
+            'tempo_em_lock': stats['tempo_em_lock'],
+            'reinicios': stats['reinicios'],
+            'modo': stats['modo'],
+            'mb_s': size / 1e6 / stats['duracao'] if stats['duracao'] else 0.0,
+        }
+        _write_atomic(self._manifest_path(snapshot_id), json.dumps(manifest).encode('utf-8'))
+        return manifest
+
+    def list(self):
+        """Manifestos dos snapshots, do mais recente ao mais antigo"""
+        if not os.path.isdir(self.snapshots_dir):
+            return []
+        manifests = []
+        for name in sorted(os.listdir(self.snapshots_dir), reverse=True):
+            if name.endswith('.json'):
+                try:
+                    with open(os.path.join(self.snapshots_dir, name), encoding='utf-8') as f:
+                        manifests.append(json.load(f))
+                except FileNotFoundError:
+                    continue  # removido por prune em outro processo
+        return manifests
+
+    def get(self, snapshot_id):
+        """Manifesto de um snapshot ('latest' para o mais recente)"""
+        if snapshot_id == 'latest':
+            manifests = self.list()
+            if not manifests:
+                raise BackupError("Nenhum snapshot encontrado")
+            return manifests[0]
+        path = self._manifest_path(snapshot_id)
+        if not os.path.exists(path):
+            raise BackupError(f"Snapshot não encontrado: {snapshot_id}")
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def _assemble(self, manifest, dest_path):
+        with self._locked(exclusive=False):
+            self._assemble_chunks(manifest, dest_path)
+
+    def _assemble_chunks(self, manifest, dest_path):
+        file_hash = hashlib.sha256()
+        with open(dest_path, 'wb') as out:
+            for digest in manifest['chunks']:
+                path = self._chunk_path(digest)
+                if not os.path.exists(path):
+                    raise BackupError(f"Bloco ausente: {digest}")
+                with open(path, 'rb') as f:
+                    try:
+                        block = zlib.decompress(f.read())
+                    except zlib.error:
+                        block = None
+                if block is None or hashlib.sha256(block).hexdigest() != digest:
+                    raise BackupError(f"Bloco corrompido: {digest}")
+                file_hash.update(block)
+                out.write(block)
+        if file_hash.hexdigest() != manifest['sha256']:
+            raise BackupError("Checksum do snapshot não confere")
+
+    def verify(self, snapshot_id):
+        """Remonta o snapshot num arquivo temporário e roda integrity_check"""
+        manifest = self.get(snapshot_id)
+        fd, path = tempfile.mkstemp(suffix='.db', dir=self.backup_dir)
+        os.close(fd)
+        try:
+            self._assemble(manifest, path)
+            result = integrity_check(path)
+        finally:
+            os.remove(path)
+        if result != 'ok':
+            raise BackupError(f"integrity_check falhou: {result}")
+        return manifest
+
+    def restore(self, snapshot_id, dest_path, overwrite=False):
+        """Restaura o snapshot em dest_path após verificar a integridade"""
+        if os.path.exists(dest_path) and not overwrite:
+            raise BackupError(f"Destino já existe: {dest_path}")
+        manifest = self.get(snapshot_id)
+        os.makedirs(os.path.dirname(os.path.abspath(dest_path)), exist_ok=True)
+        tmp_path = dest_path + '.restore'
+        try:
+            self._assemble(manifest, tmp_path)
+            result = integrity_check(tmp_path)
+            if result != 'ok':
+                raise BackupError(f"integrity_check falhou: {result}")
+            for suffix in ('-wal', '-shm', '-journal'):
+                if os.path.exists(dest_path + suffix):
+                    os.remove(dest_path + suffix)
+            os.replace(tmp_path, dest_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return manifest
+
+    def prune(self, keep=None):
+        """Mantém os `keep` snapshots mais recentes e apaga blocos órfãos"""
+        keep = Config.BACKUP_KEEP if keep is None else keep
+        with self._locked():
+            return self._prune(keep)
+
+    def _prune(self, keep):
+        manifests = self.list()
+        removed = manifests[keep:] if keep else []
+        for manifest in removed:
+            os.remove(self._manifest_path(manifest['id']))
+
+        referenced = set()
+        for manifest in manifests[:keep] if keep else manifests:
+            referenced.update(manifest['chunks'])
+
+        freed = 0
+        if removed and os.path.isdir(self.chunks_dir):
+            for prefix in os.listdir(self.chunks_dir):
+                for name in os.listdir(os.path.join(self.chunks_dir, prefix)):
+                    if name[:-2] not in referenced:
+                        path = os.path.join(self.chunks_dir, prefix, name)
+                        freed += os.path.getsize(path)
+                        os.remove(path)
+        return [manifest['id'] for manifest in removed], freed
+
+def _write_atomic(path, data):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+# Backup disparado pelo painel: uma tarefa 'backup' na fila (services/jobs.py),
+# então qualquer worker do servidor vê o mesmo estado e só um roda por vez
+
+def get_backup_job():
+    """Estado do último backup disparado pelo painel ('ocioso' se nunca houve)"""
+    from models.job import Job
+    job = Job.get_latest('backup')
+    if job is None:
+        return {'estado': 'ocioso'}
+    status = job.to_dict()
+    status.update(job.resultado or {})
+    return status
+
+def start_backup_job(db_url, user_id=None):
+    """Enfileira um snapshot; None se já houver um na fila ou em andamento"""
+    from models.job import Job
+    from services.jobs import enqueue_job
+    database_path(db_url)  # banco remoto: recusa antes de enfileirar
+    if Job.get_active('backup'):
+        return None
+    return enqueue_job('backup', usuario_id=user_id, chave='backup')
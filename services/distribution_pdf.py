@@ -0,0 +1,274 @@
+# Sistema de Registro de Avaliações - Clínica TEA
+# Criado por João Layon
+
+import os
+import tempfile
+import zlib
+from datetime import datetime
+from config import Config
+
+# PDF do relatório de distribuição (A4), gerado fora do navegador. Os
+# procedimentos são lidos em lotes (Procedure.iter_for_distribution) e cada
+# página vai para o arquivo assim que fica cheia, então a memória não cresce
+# com o tamanho do relatório. O arquivo fica em REPORT_CACHE_DIR com nome
+# derivado dos filtros, do autor e da versão dos dados (utils.conditional):
+# enquanto nada muda no banco, o mesmo relatório é servido do disco.
+
+# Muda quando o layout muda, para não servir PDFs antigos do cache
+LAYOUT_VERSION = 1
+
+PAGE_WIDTH, PAGE_HEIGHT = 595.28, 841.89  # A4 em pontos
+MARGIN = 40
+ROW_HEIGHT = 14
+FOOTER_Y = 24
+
+# (título, x, largura) das colunas da tabela
+COLUMNS = (
+    ('#', 40, 32),
+    ('Paciente', 72, 150),
+    ('CPF', 222, 68),
+    ('Especialidade', 290, 92),
+    ('Situação', 382, 128),
+    ('Atualizado', 510, 45),
+)
+
+STATE_LABELS = {
+    'pendente': 'Pendente',
+    'alocado': 'Alocado',
+    'em_atendimento': 'Em Atendimento',
+    'concluido': 'Concluído',
+}
+
+def _pdf_text(text):
+    """Texto como string literal PDF (WinAnsi, que cobre os acentos do português)"""
+    raw = str(text).encode('cp1252', errors='replace')
+    return b'(' + raw.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)') + b')'
+
+def _fit(text, width, size, bold=False):
+    """Corta o texto para caber na largura (estimativa pela largura média da Helvetica)"""
+    text = str(text or '')
+    limit = int(width / (size * (0.56 if bold else 0.52)))
+    return text if len(text) <= limit else text[:max(limit - 3, 0)] + '...'
+
+class PdfWriter:
+    """Gravador mínimo de PDF com as fontes padrão Helvetica, página a página.
+
+    Cada página é escrita (e esquecida) em add_page; o dicionário de páginas,
+    a tabela xref e o trailer vão no final, em close().
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.offsets = {}
+        self.page_ids = []
+        self.next_id = 5  # 1 catálogo, 2 páginas, 3 Helvetica, 4 Helvetica-Bold
+        self.stream.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        for obj_id, font in ((3, b'Helvetica'), (4, b'Helvetica-Bold')):
+            self._object(obj_id, b'<< /Type /Font /Subtype /Type1 /BaseFont /' + font +
+                         b' /Encoding /WinAnsiEncoding >>')
+
+    def _object(self, obj_id, body):
+        self.offsets[obj_id] = self.stream.tell()
+        self.stream.write(b'%d 0 obj\n' % obj_id + body + b'\nendobj\n')
+
+    def add_page(self, content):
+        content = zlib.compress(content)
+        content_id, page_id = self.next_id, self.next_id + 1
+        self.next_id += 2
+        self._object(content_id, b'<< /Length %d /Filter /FlateDecode >>\nstream\n' % len(content) +
+                     content + b'\nendstream')
+        self._object(page_id, b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %.2f %.2f] '
+                     b'/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents %d 0 R >>'
+                     % (PAGE_WIDTH, PAGE_HEIGHT, content_id))
+        self.page_ids.append(page_id)
+
+    def close(self):
+        kids = b' '.join(b'%d 0 R' % page_id for page_id in self.page_ids)
+        self._object(2, b'<< /Type /Pages /Kids [' + kids + b'] /Count %d >>' % len(self.page_ids))
+        self._object(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+        xref = self.stream.tell()
+        self.stream.write(b'xref\n0 %d\n0000000000 65535 f \n' % self.next_id)
+        for obj_id in range(1, self.next_id):
+            self.stream.write(b'%010d 00000 n \n' % self.offsets[obj_id])
+        self.stream.write(b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n'
+                          % (self.next_id, xref))
+
+class _Page:
+    """Comandos de desenho de uma página, com y descendo do topo"""
+
+    def __init__(self):
+        self.ops = []
+        self.y = PAGE_HEIGHT - MARGIN
+
+    def text(self, x, y, text, size=9, bold=False):
+        self.ops.append(b'BT /%s %d Tf %.2f %.2f Td %s Tj ET' % (
+            b'F2' if bold else b'F1', size, x, y, _pdf_text(text)))
+
+    def text_right(self, right, y, text, size=9, bold=False):
+        width = len(str(text)) * size * (0.56 if bold else 0.52)
+        self.text(right - width, y, text, size, bold)
+
+    def rect(self, x, y, width, height, gray):
+        self.ops.append(b'%.2f g %.2f %.2f %.2f %.2f re f 0 g' % (gray, x, y, width, height))
+
+    def line(self, x1, y1, x2, y2):
+        self.ops.append(b'0.6 G 0.5 w %.2f %.2f m %.2f %.2f l S 0 G' % (x1, y1, x2, y2))
+
+    def content(self):
+        return b'\n'.join(self.ops)
+
+def _situacao(procedure):
+    if procedure.estado == 'pendente':
+        return 'Aguardando alocação'
+    if procedure.estado in ('alocado', 'em_atendimento'):
+        medico = f'Dr(a). {procedure.medico_nome}' if procedure.medico_nome else 'médico não identificado'
+        return f'{STATE_LABELS[procedure.estado]}: {medico}'
+    return STATE_LABELS.get(procedure.estado, procedure.estado or '')
+
+def _updated(procedure):
+    value = str(procedure.atualizado_em or '')[:10]
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').strftime('%d/%m/%Y')
+    except ValueError:
+        return value
+
+def write_distribution_report(stream, procedures, counts, specialty_stats, filters, user_name, generated_at):
+    """Escreve o relatório em stream; procedures pode ser um iterador (lido uma vez)"""
+    writer = PdfWriter(stream)
+    page_number = 0
+
+    def finish(page):
+        nonlocal page_number
+        page_number += 1
+        page.line(MARGIN, FOOTER_Y + 10, PAGE_WIDTH - MARGIN, FOOTER_Y + 10)
+        page.text(MARGIN, FOOTER_Y, 'Clínica TEA - Relatório de Distribuição de Pacientes', size=7)
+        page.text_right(PAGE_WIDTH - MARGIN, FOOTER_Y, f'Página {page_number}', size=7)
+        writer.add_page(page.content())
+
+    def table_header(page):
+        page.rect(MARGIN, page.y - 4, PAGE_WIDTH - 2 * MARGIN, ROW_HEIGHT, 0.85)
+        for title, x, _ in COLUMNS:
+            page.text(x + 2, page.y, title, size=8, bold=True)
+        page.y -= ROW_HEIGHT
+
+    # Cabeçalho
+    page = _Page()
+    page.text(MARGIN, page.y, 'CLÍNICA TEA', size=16, bold=True)
+    page.y -= 20
+    page.text(MARGIN, page.y, 'Relatório de Distribuição de Pacientes', size=12, bold=True)
+    page.y -= 16
+    page.text(MARGIN, page.y, f"Gerado em: {generated_at.strftime('%d/%m/%Y às %H:%M')}", size=9)
+    page.y -= 20
+
+    filter_lines = []
+    if filters.get('especialidade'):
+        filter_lines.append(f"Especialidade: {filters['especialidade']}")
+    if filters.get('estado'):
+        filter_lines.append(f"Estado: {filters['estado']}")
+    total = sum(counts.values())
+    page.text(MARGIN, page.y, 'Filtros aplicados: ' + ('; '.join(filter_lines) or 'Todos os procedimentos'))
+    page.y -= 12
+    page.text(MARGIN, page.y, f"Total de registros: {total}    Relatório por: {user_name or 'Sistema'}")
+    page.y -= 22
+
+    # Resumo por estado
+    box_width = (PAGE_WIDTH - 2 * MARGIN - 3 * 8) / 4
+    for i, state in enumerate(('pendente', 'alocado', 'em_atendimento', 'concluido')):
+        x = MARGIN + i * (box_width + 8)
+        page.rect(x, page.y - 24, box_width, 34, 0.93)
+        page.text(x + 8, page.y - 2, counts.get(state, 0), size=13, bold=True)
+        page.text(x + 8, page.y - 17, STATE_LABELS[state], size=8)
+    page.y -= 50
+
+    page.text(MARGIN, page.y, 'Distribuição de Pacientes por Especialidade', size=11, bold=True)
+    page.y -= 18
+    table_header(page)
+
+    # Tabela, uma linha por procedimento
+    index = 0
+    for index, procedure in enumerate(procedures, 1):
+        if page.y < FOOTER_Y + 24:
+            finish(page)
+            page = _Page()
+            table_header(page)
+        if index % 2 == 0:
+            page.rect(MARGIN, page.y - 4, PAGE_WIDTH - 2 * MARGIN, ROW_HEIGHT, 0.96)
+        values = (index, procedure.paciente_nome or 'Paciente não identificado', procedure.paciente_cpf,
+                  procedure.especialidade, _situacao(procedure), _updated(procedure))
+        for (_, x, width), value in zip(COLUMNS, values):
+            page.text(x + 2, page.y, _fit(value, width - 4, 8), size=8)
+        page.y -= ROW_HEIGHT
+
+    if not index:
+        page.text(MARGIN, page.y - 6, 'Nenhum procedimento encontrado.', size=9)
+    finish(page)
+
+    # Estatísticas por especialidade, em página própria como na versão impressa
+    if specialty_stats:
+        page = _Page()
+        page.text(MARGIN, page.y, 'Estatísticas por Especialidade', size=11, bold=True)
+        page.y -= 20
+        for specialty, stats in specialty_stats.items():
+            if page.y < FOOTER_Y + 60:
+                finish(page)
+                page = _Page()
+            page.rect(MARGIN, page.y - 4, PAGE_WIDTH - 2 * MARGIN, ROW_HEIGHT, 0.9)
+            page.text(MARGIN + 4, page.y, f"{specialty} - Total: {stats['total']} procedimentos", size=9, bold=True)
+            page.y -= ROW_HEIGHT + 2
+            parts = [f"{STATE_LABELS[state]}: {stats[state]}"
+                     for state in ('pendente', 'alocado', 'em_atendimento', 'concluido')]
+            if stats['total']:
+                parts.append(f"Conclusão: {stats['concluido'] / stats['total'] * 100:.1f}%")
+            page.text(MARGIN + 4, page.y, '    '.join(parts), size=8)
+            page.y -= ROW_HEIGHT + 8
+        finish(page)
+
+    writer.close()
+
+def _with_progress(procedures, total, progress, every=500):
+    for count, procedure in enumerate(procedures, 1):
+        if count % every == 0:
+            # O total foi contado antes; o banco pode ter mudado desde então
+            progress(count / max(total, count), f'{count} de {total} procedimentos')
+        yield procedure
+
+def render_distribution_pdf(db_url, filters, user_name, dest_path, progress=None):
+    """Gera o PDF em dest_path (roda numa tarefa em segundo plano, services/jobs.py)"""
+    from models.database import get_db_connection
+    from models.procedure import Procedure
+
+    get_db_connection(db_url)
+    counts = {}
+    for states in Procedure.count_for_distribution(filters).values():
+        for state, total in states.items():
+            counts[state] = counts.get(state, 0) + total
+
+    specialty_stats = Procedure.get_statistics_by_specialty()
+    if filters.get('especialidade'):
+        specialty_stats = {
+            filters['especialidade']: specialty_stats.get(filters['especialidade'], {
+                'pendente': 0, 'alocado': 0, 'em_atendimento': 0, 'concluido': 0, 'total': 0
+            })
+        }
+
+    procedures = Procedure.iter_for_distribution(filters, Config.REPORT_BATCH_SIZE)
+    if progress:
+        procedures = _with_progress(procedures, sum(counts.values()), progress)
+
+    os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(dest_path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as stream:
+            write_distribution_report(stream, procedures, counts, specialty_stats,
+                                      filters, user_name, datetime.now())
+        os.replace(tmp_path, dest_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return dest_path
+
+def report_path(filters, user_name, data_version):
+    """Arquivo em cache do relatório para estes filtros, autor e versão dos dados"""
+    from services.jobs import cached_result_path
+    return cached_result_path('distribuicao', 'pdf', LAYOUT_VERSION, data_version, user_name,
+                              filters.get('especialidade'), filters.get('estado'))
@@ -0,0 +1,424 @@
+# Sistema de Registro de Avaliações - Clínica TEA
+# Criado por João Layon
+
+import csv
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Tarefas em segundo plano (tabela tarefas, migração 0011). A requisição só
+# enfileira (enqueue_job) e responde na hora; processos trabalhadores pegam a
+# tarefa mais antiga com um lease (Job.claim), que uma thread renova enquanto
+# ela roda. Se o processo morre, o lease expira e outro trabalhador retoma a
+# tarefa. O progresso fica na própria linha e aparece em /tarefas.
+#
+# Os trabalhadores são filhos de scripts/job_worker.py, que os reinicia se
+# caírem. O servidor (gunicorn.conf.py, main.py) sobe esse script junto com
+# ele quando JOB_WORKERS > 0, desligado do próprio processo (start_job_runner);
+# com JOB_WORKERS=0 ele roda à parte.
+
+HANDLERS = {}
+LABELS = {}
+
+# Intervalo mínimo entre duas gravações de progresso da mesma tarefa
+PROGRESS_INTERVAL = 0.5
+
+def job_handler(tipo, label):
+    """Registra a função que executa as tarefas deste tipo"""
+    def register(func):
+        HANDLERS[tipo] = func
+        LABELS[tipo] = label
+        return func
+    return register
+
+class JobLeaseLost(Exception):
+    """O lease expirou e a tarefa passou para outro trabalhador"""
+
+class JobContext:
+    """O que a tarefa recebe: a linha da fila, o banco e o registro de progresso.
+
+    O progresso fica em memória e é gravado pela thread que renova o lease,
+    com a conexão dela: a tarefa pode estar no meio de uma transação própria.
+    """
+
+    def __init__(self, job, trabalhador, db_url, lease_seconds):
+        self.job = job
+        self.trabalhador = trabalhador
+        self.db_url = db_url
+        self.lease_seconds = lease_seconds
+        self.lost = False
+        self._pending = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._done = threading.Event()
+        self._thread = None
+
+    def progress(self, fraction, mensagem=None):
+        """Registra o andamento (0 a 1); levanta JobLeaseLost se a tarefa já não é deste trabalhador"""
+        if self.lost:
+            raise JobLeaseLost(f'Tarefa {self.job.id} assumida por outro trabalhador')
+        with self._lock:
+            self._pending = (round(min(max(fraction, 0.0), 1.0), 4), mensagem)
+        self._wake.set()
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._keep_lease, name=f'tarefa-{self.job.id}',
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._done.set()
+        self._wake.set()
+        self._thread.join()
+
+    def _keep_lease(self):
+        from models.database import get_db_connection, close_db_connection
+        from models.job import Job
+        get_db_connection(self.db_url)
+        interval = self.lease_seconds / 3
+        renew_at = time.monotonic() + interval
+        while not self._done.is_set():
+            self._wake.wait(max(0.0, renew_at - time.monotonic()))
+            self._wake.clear()
+            if self._done.is_set():
+                break
+            with self._lock:
+                pending, self._pending = self._pending, None
+            if pending is None and time.monotonic() < renew_at:
+                continue
+
+            fraction, mensagem = pending or (None, None)
+            try:
+                if not Job.renew(self.job.id, self.trabalhador, self.lease_seconds, fraction, mensagem):
+                    logger.warning("Tarefa %d: lease perdido, outro trabalhador a assumiu", self.job.id)
+                    self.lost = True
+                    break
+                renew_at = time.monotonic() + interval
+            except Exception as e:
+                # Banco ocupado (por exemplo pela transação da própria tarefa):
+                # tenta de novo no próximo ciclo, com o progresso mais recente
+                get_db_connection().rollback()
+                logger.warning("Tarefa %d: não foi possível renovar o lease (%s)", self.job.id, e)
+                with self._lock:
+                    if self._pending is None:
+                        self._pending = pending
+            self._done.wait(PROGRESS_INTERVAL)
+        close_db_connection()
+
+def enqueue_job(tipo, parametros=None, usuario_id=None, chave=None):
+    """Enfileira uma tarefa (ou devolve a igual, de mesma chave, ainda na fila ou em execução)"""
+    from models.job import Job
+    if tipo not in HANDLERS:
+        raise ValueError(f'Tipo de tarefa desconhecido: {tipo}')
+    return Job.enqueue(tipo, parametros, usuario_id, chave)
+
+def run_next_job(trabalhador, db_url, lease_seconds=None):
+    """Executa a próxima tarefa da fila; False quando a fila está vazia"""
+    from models.database import get_db_connection
+    from models.job import Job
+    lease_seconds = lease_seconds or Config.JOB_LEASE_SECONDS
+    job = Job.claim(trabalhador, lease_seconds)
+    if job is None:
+        return False
+
+    logger.info("Tarefa %d (%s) iniciada, tentativa %d", job.id, job.tipo, job.tentativas)
+    started = time.perf_counter()
+    context = JobContext(job, trabalhador, db_url, lease_seconds)
+    try:
+        handler = HANDLERS.get(job.tipo)
+        if handler is None:
+            raise ValueError(f'Tipo de tarefa desconhecido: {job.tipo}')
+        with context:
+            resultado = handler(context, **job.parametros)
+    except JobLeaseLost:
+        get_db_connection().rollback()
+        return True
+    except Exception as e:
+        get_db_connection().rollback()
+        logger.exception("Falha na tarefa %d (%s)", job.id, job.tipo)
+        Job.fail(job.id, trabalhador, str(e))
+        return True
+
+    if context.lost or not Job.finish(job.id, trabalhador, resultado, (resultado or {}).get('mensagem')):
+        logger.warning("Tarefa %d terminou depois de perder o lease; resultado descartado", job.id)
+        return True
+    logger.info("Tarefa %d (%s) concluída em %.1f s", job.id, job.tipo, time.perf_counter() - started)
+    return True
+
+# Processos trabalhadores
+
+def _worker_main(db_url, stop, poll_interval):
+    # Ctrl+C chega ao grupo todo; quem decide parar é o supervisor
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.basicConfig(level=logging.INFO)
+    from models.database import init_db
+    from utils.metrics import start_flusher
+    init_db(db_url)
+    # Repetições e bloqueios do banco aparecem no /metrics do servidor
+    start_flusher()
+    trabalhador = f'{socket.gethostname()}:{os.getpid()}'
+    supervisor = os.getppid()
+    # Sem o supervisor (morto com SIGKILL) ninguém mais pediria a parada
+    while not stop.is_set() and os.getppid() == supervisor:
+        try:
+            ran = run_next_job(trabalhador, db_url)
+        except Exception:
+            logger.exception("Falha ao buscar tarefas na fila")
+            ran = False
+        if not ran:
+            stop.wait(poll_interval)
+
+def _cleanup():
+    from models.job import Job
+    removed = Job.purge_finished(Config.JOB_RETENTION_DAYS)
+    if removed:
+        logger.info("Tarefas: %d concluídas há mais de %d dias removidas", removed, Config.JOB_RETENTION_DAYS)
+    prune_results(Config.REPORT_CACHE_KEEP)
+
+def run_job_workers(db_url, count, parent_pid=None, stop_timeout=30):
+    """Mantém count processos trabalhadores até SIGTERM/SIGINT ou até parent_pid sair"""
+    from models.database import init_db
+    init_db(db_url)
+
+    # spawn: nada do processo atual (conexões, threads) passa para os filhos
+    context = multiprocessing.get_context('spawn')
+    stop = context.Event()
+    # O sinal só marca a parada: o laço abaixo vê a marca em até um segundo
+    stopping = []
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *args: stopping.append(True))
+
+    workers = [None] * count
+    cleanup_at = 0.0
+    logger.info("Trabalhadores de tarefas: %d processos", count)
+    while not stopping:
+        for slot, process in enumerate(workers):
+            if process is None or not process.is_alive():
+                if process is not None:
+                    logger.warning("Trabalhador %d saiu com código %s; reiniciando", process.pid, process.exitcode)
+                process = context.Process(target=_worker_main, args=(db_url, stop, Config.JOB_POLL_INTERVAL),
+                                          name=f'tarefas-{slot}', daemon=True)
+                process.start()
+                workers[slot] = process
+
+        if time.monotonic() >= cleanup_at:
+            try:
+                _cleanup()
+            except Exception:
+                logger.exception("Falha ao limpar tarefas antigas")
+            cleanup_at = time.monotonic() + 3600
+
+        if parent_pid and not _alive(parent_pid):
+            logger.info("Servidor encerrado; parando os trabalhadores de tarefas")
+            break
+        time.sleep(1)
+
+    # Quem está no meio de uma tarefa tem stop_timeout segundos para terminá-la;
+    # depois disso o lease expira e ela volta para a fila
+    stop.set()
+    deadline = time.monotonic() + stop_timeout
+    for process in workers:
+        if process is not None:
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                process.terminate()
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+_runner_pid = None
+
+def start_job_runner(db_url, count=None):
+    """Sobe scripts/job_worker.py preso a este processo (ele sai quando este sai); retorna o pid.
+
+    O supervisor não fica como filho deste processo: o script se desliga
+    (--detach) e informa o pid. O master do gunicorn recolhe com waitpid
+    qualquer filho que termina, e um filho direto poderia cair sem que
+    ninguém soubesse.
+    """
+    global _runner_pid
+    count = Config.JOB_WORKERS if count is None else count
+    if count <= 0 or (_runner_pid is not None and _alive(_runner_pid)):
+        return _runner_pid
+    script = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                          'scripts', 'job_worker.py')
+    result = subprocess.run([sys.executable, script, '--database', db_url, '--workers', str(count),
+                             '--parent-pid', str(os.getpid()), '--detach'],
+                            stdout=subprocess.PIPE, text=True)
+    if result.returncode != 0 or not result.stdout.strip().isdigit():
+        logger.error("Não foi possível iniciar os trabalhadores de tarefas (código %s)", result.returncode)
+        return None
+    _runner_pid = int(result.stdout)
+    return _runner_pid
+
+def stop_job_runner(timeout=None):
+    """Pede aos trabalhadores que parem e espera até timeout segundos"""
+    global _runner_pid
+    pid, _runner_pid = _runner_pid, None
+    if pid is None or not _alive(pid):
+        return
+    os.kill(pid, signal.SIGTERM)
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while _alive(pid):
+        if deadline is not None and time.monotonic() >= deadline:
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            return
+        time.sleep(0.1)
+
+# Arquivos gerados pelas tarefas (relatórios, exportações)
+
+def cached_result_path(nome, extensao, *partes):
+    """Arquivo em REPORT_CACHE_DIR identificado pelas partes (filtros, versão dos dados...)"""
+    key = json.dumps(partes)
+    digest = hashlib.sha256(key.encode('utf-8')).hexdigest()[:24]
+    return os.path.join(Config.REPORT_CACHE_DIR, f'{nome}-{digest}.{extensao}')
+
+def prune_results(keep):
+    """Mantém só os keep arquivos usados mais recentemente"""
+    folder = Config.REPORT_CACHE_DIR
+    if not os.path.isdir(folder):
+        return
+    files = sorted((os.path.join(folder, name) for name in os.listdir(folder) if not name.endswith('.tmp')),
+                   key=os.path.getmtime, reverse=True)
+    for path in files[keep:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+# Tipos de tarefa
+
+@job_handler('reset_pacientes', 'Remoção dos dados de pacientes')
+def reset_patients(context, ate_id, total, liberar_espaco=False):
+    """Remove os pacientes existentes no pedido (id <= ate_id) com avaliações e procedimentos.
+
+    Em lotes curtos (services/purge.py): o sistema continua gravando durante
+    a remoção, e uma tarefa retomada depois de uma queda continua do ponto
+    em que parou. Os médicos ficam.
+    """
+    from models.audit import log_action
+    from services.purge import PATIENT_PURGE, purge_range, reclaim_space
+
+    def progress(deleted, remaining):
+        done = total - remaining + deleted
+        # O espaço em disco, se pedido, fica com os últimos 10%
+        scale = 0.9 if liberar_espaco else 1.0
+        context.progress(done / max(total, done, 1) * scale, f'{done} de {total} pacientes removidos')
+
+    context.progress(0.0, 'Removendo dados de pacientes')
+    purge_range('pacientes', PATIENT_PURGE, ate_id, progress=progress)
+
+    mensagem = 'Todos os dados de pacientes foram removidos. Os médicos foram mantidos.'
+    if liberar_espaco:
+        context.progress(0.9, 'Liberando espaço em disco')
+        freed = reclaim_space(full=True)
+        if freed:
+            mensagem += f' {freed / 1e6:.1f} MB liberados em disco.'
+
+    log_action(
+        user_id=context.job.usuario_id,
+        acao='RESET_PACIENTES',
+        detalhe=f'Administrador resetou todos os dados de pacientes ({total} pacientes)'
+    )
+    return {'mensagem': mensagem}
+
+PROCEDURES_CSV_HEADER = [
+    'Paciente', 'CPF', 'Especialidade', 'Estado',
+    'Médico Responsável', 'Criado em', 'Atualizado em', 'Motivo Devolução'
+]
+
+@job_handler('exportar_procedimentos', 'Exportação de procedimentos (CSV)')
+def export_procedures(context, arquivo):
+    """Todos os procedimentos em CSV, lidos em lotes"""
+    from models.procedure import Procedure
+
+    total = sum(count for states in Procedure.count_for_distribution({}).values()
+                for count in states.values())
+    os.makedirs(os.path.dirname(arquivo), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(arquivo), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', newline='', encoding='utf-8') as output:
+            writer = csv.writer(output)
+            writer.writerow(PROCEDURES_CSV_HEADER)
+            for count, procedure in enumerate(Procedure.iter_for_distribution({}, Config.REPORT_BATCH_SIZE), 1):
+                writer.writerow([
+                    procedure.paciente_nome,
+                    procedure.paciente_cpf,
+                    procedure.especialidade,
+                    procedure.get_state_display(),
+                    procedure.medico_nome or '',
+                    procedure.criado_em,
+                    procedure.atualizado_em,
+                    procedure.motivo_devolucao or ''
+                ])
+                if count % Config.REPORT_BATCH_SIZE == 0:
+                    context.progress(count / max(total, count), f'{count} de {total} procedimentos')
+        os.replace(tmp_path, arquivo)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+    prune_results(Config.REPORT_CACHE_KEEP)
+    return {'arquivo': arquivo, 'nome': 'relatorio_procedimentos.csv',
+            'mimetype': 'text/csv', 'mensagem': f'{total} procedimentos exportados'}
+
+@job_handler('relatorio_distribuicao', 'Relatório de distribuição (PDF)')
+def distribution_report(context, arquivo, filtros, autor):
+    """PDF A4 do relatório de distribuição (services/distribution_pdf.py)"""
+    from services.distribution_pdf import render_distribution_pdf
+
+    render_distribution_pdf(context.db_url, filtros, autor, arquivo, progress=context.progress)
+    prune_results(Config.REPORT_CACHE_KEEP)
+    return {'arquivo': arquivo, 'nome': f"distribuicao_{datetime.now().strftime('%Y%m%d')}.pdf",
+            'mimetype': 'application/pdf'}
+
+@job_handler('backup', 'Backup do banco (snapshot)')
+def create_backup(context):
+    """Snapshot online do banco e limpeza dos antigos (services/backup.py)"""
+    from models.audit import log_action
+    from services.backup import SnapshotStore, database_path
+
+    def progress(done, total):
+        # A limpeza dos snapshots antigos fica com os últimos 5%
+        context.progress(done / total * 0.95 if total else 0.95, 'Copiando o banco')
+
+    store = SnapshotStore()
+    manifest = store.create(database_path(context.db_url), progress=progress)
+    context.progress(0.95, 'Removendo snapshots antigos')
+    store.prune()
+
+    log_action(context.job.usuario_id, 'backup_created',
+               f"Snapshot {manifest['id']} criado ({manifest['tamanho'] / 1e6:.1f} MB, "
+               f"{manifest['novos_chunks']} blocos novos)")
+    return {'snapshot': manifest['id'], 'mb_s': manifest['mb_s'], 'maior_passo': manifest['maior_passo'],
+            'mensagem': f"Snapshot {manifest['id']} criado"}
+
+@job_handler('miniaturas_foto', 'Miniaturas da foto de perfil')
+def profile_photo_thumbnails(context, original, static_folder):
+    """Miniaturas WebP/JPEG de uma foto de perfil enviada (services/profile_photos.py)"""
+    from services.profile_photos import process_upload
+
+    process_upload(original, static_folder)
@@ -0,0 +1,212 @@
+# Sistema de Registro de Avaliações - Clínica TEA
+# Criado por João Layon
+
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import time
+from flask import current_app, url_for
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Fotos novas ficam em users.foto_perfil como 'uploads/profile/<hash>', onde
+# <hash> são os 16 primeiros dígitos do SHA-256 do arquivo enviado. Os
+# arquivos derivados têm o conteúdo no nome e podem ser cacheados para sempre:
+#   <hash>-orig.<ext>    upload original, apagado depois de processado
+#   <hash>-<lado>.webp   miniatura quadrada para cada lado em PROFILE_PHOTO_SIZES
+#   <hash>-<lado>.jpg    o mesmo em JPEG, para navegadores sem WebP
+# As miniaturas são feitas por uma tarefa em segundo plano (services/jobs.py),
+# que fica na fila do banco: se o processo cair no meio, outro trabalhador
+# refaz. Enquanto isso o original é servido no lugar delas.
+# Valores antigos (com extensão, ex. 'uploads/profile/user_1_foto.png')
+# continuam sendo servidos como estão.
+
+UPLOAD_SUBDIR = 'uploads/profile'
+CHUNK_SIZE = 64 * 1024
+FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp'}
+ORPHAN_GRACE_SECONDS = 3600
+
+_KEY_PATTERN = re.compile(r'^uploads/profile/([0-9a-f]{16})$')
+_FILE_PATTERN = re.compile(r'^([0-9a-f]{16})-(?:orig\.\w+|\d+\.(?:webp|jpg))$')
+
+class PhotoError(Exception):
+    """Upload recusado (tamanho, formato ou imagem inválida)"""
+
+def upload_dir(static_folder):
+    return os.path.join(static_folder, *UPLOAD_SUBDIR.split('/'))
+
+def save_upload(stream, static_folder, max_bytes=None):
+    """Grava o upload em disco em blocos, calculando o hash no caminho.
+
+    Retorna (chave, caminho do original). Recusa arquivos acima de max_bytes
+    sem ler o resto e confere o formato pelo conteúdo, não pela extensão.
+    """
+    from PIL import Image, UnidentifiedImageError
+
+    max_bytes = max_bytes or Config.PROFILE_PHOTO_MAX_BYTES
+    folder = upload_dir(static_folder)
+    os.makedirs(folder, exist_ok=True)
+
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=folder, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise PhotoError(f'A foto deve ter no máximo {max_bytes // (1024 * 1024)} MB')
+                digest.update(chunk)
+                f.write(chunk)
+        if not size:
+            raise PhotoError('Arquivo vazio')
+
+        try:
+            with Image.open(tmp_path) as image:
+                image_format = image.format
+                image.verify()
+        except (UnidentifiedImageError, OSError, SyntaxError, Image.DecompressionBombError):
+            raise PhotoError('Arquivo de imagem inválido')
+        if image_format not in FORMATS:
+            raise PhotoError('Formato de arquivo não permitido. Use PNG, JPG, GIF ou WebP')
+
+        key = digest.hexdigest()[:16]
+        original = os.path.join(folder, f'{key}-orig.{FORMATS[image_format]}')
+        os.replace(tmp_path, original)
+        return f'{UPLOAD_SUBDIR}/{key}', original
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def generate_thumbnails(original, sizes=None):
+    """Gera as miniaturas quadradas WebP e JPEG de um original; retorna os arquivos criados"""
+    from PIL import Image, ImageOps
+
+    sizes = sizes or Config.PROFILE_PHOTO_SIZES
+    folder = os.path.dirname(original)
+    key = os.path.basename(original).split('-', 1)[0]
+    written = []
+
+    with Image.open(original) as image:
+        image.seek(0)  # primeiro quadro de GIFs animados
+        image = ImageOps.exif_transpose(image)
+        has_alpha = image.mode in ('RGBA', 'LA') or 'transparency' in image.info
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+
+        for side in sorted(sizes, reverse=True):
+            thumb = ImageOps.fit(image, (side, side), Image.LANCZOS)
+            webp_path = os.path.join(folder, f'{key}-{side}.webp')
+            jpg_path = os.path.join(folder, f'{key}-{side}.jpg')
+
+            _save_atomic(thumb, webp_path, 'WEBP', quality=Config.PROFILE_PHOTO_QUALITY, method=6)
+            if has_alpha:
+                background = Image.new('RGB', thumb.size, (255, 255, 255))
+                background.paste(thumb, mask=thumb.getchannel('A'))
+                thumb = background
+            _save_atomic(thumb, jpg_path, 'JPEG', quality=Config.PROFILE_PHOTO_QUALITY,
+                         optimize=True, progressive=True)
+            written += [webp_path, jpg_path]
+
+    return written
+
+def _save_atomic(image, path, image_format, **options):
+    tmp_path = path + '.part'
+    image.save(tmp_path, image_format, **options)
+    os.replace(tmp_path, path)
+
+def cleanup_orphans(static_folder, grace_seconds=ORPHAN_GRACE_SECONDS):
+    """Apaga arquivos de fotos que nenhum usuário referencia mais.
+
+    Arquivos recentes (uploads em andamento) são mantidos por grace_seconds.
+    Retorna quantos arquivos foram removidos.
+    """
+    from models.database import get_db_connection
+
+    folder = upload_dir(static_folder)
+    if not os.path.isdir(folder):
+        return 0
+
+    conn = get_db_connection()
+    referenced = set()
+    for row in conn.execute("SELECT foto_perfil FROM users WHERE foto_perfil IS NOT NULL").fetchall():
+        match = _KEY_PATTERN.match(row['foto_perfil'])
+        referenced.add(match.group(1) if match else os.path.basename(row['foto_perfil']))
+
+    removed = 0
+    cutoff = time.time() - grace_seconds
+    for entry in os.scandir(folder):
+        if not entry.is_file() or entry.stat().st_mtime > cutoff:
+            continue
+        match = _FILE_PATTERN.match(entry.name)
+        # Fotos antigas (user_<id>_<nome>) e restos de uploads interrompidos também
+        legacy = entry.name.startswith('user_') or entry.name.endswith('.part')
+        if (match and match.group(1) not in referenced) or (legacy and entry.name not in referenced):
+            os.remove(entry.path)
+            removed += 1
+    return removed
+
+def process_upload(original, static_folder):
+    """Gera as miniaturas de um original enviado, apaga o original e limpa os órfãos.
+
+    Pode rodar de novo sobre o mesmo upload (tarefa retomada): sem o
+    original, as miniaturas já foram feitas.
+    """
+    if os.path.exists(original):
+        generate_thumbnails(original)
+        os.remove(original)
+    removed = cleanup_orphans(static_folder)
+    if removed:
+        logger.info("Fotos de perfil: %d arquivos órfãos removidos", removed)
+
+def queue_thumbnails(original, static_folder, usuario_id=None):
+    """Enfileira a geração das miniaturas de um upload"""
+    from services.jobs import enqueue_job
+    return enqueue_job('miniaturas_foto', {'original': original, 'static_folder': static_folder},
+                       usuario_id=usuario_id, chave=os.path.basename(original))
+
+def _pending_original(folder, key):
+    """Nome do original ainda não processado de key, se existir"""
+    for ext in dict.fromkeys(FORMATS.values()):
+        name = f'{key}-orig.{ext}'
+        if os.path.exists(os.path.join(folder, name)):
+            return name
+    return None
+
+def photo_sources(foto_perfil):
+    """URLs de uma foto de perfil para <picture>, ou None sem foto.
+
+    Retorna {'src', 'srcset', 'webp_srcset'}; enquanto as miniaturas não
+    ficam prontas, src aponta para o original e os srcsets vêm vazios.
+    """
+    if not foto_perfil:
+        return None
+    match = _KEY_PATTERN.match(foto_perfil)
+    if not match:
+        return {'src': url_for('static', filename=foto_perfil), 'srcset': '', 'webp_srcset': ''}
+
+    key = match.group(1)
+    folder = upload_dir(current_app.static_folder)
+    sizes = sorted(Config.PROFILE_PHOTO_SIZES)
+    if not os.path.exists(os.path.join(folder, f'{key}-{sizes[-1]}.jpg')):
+        name = _pending_original(folder, key)
+        if name:
+            return {'src': url_for('static', filename=f'{UPLOAD_SUBDIR}/{name}'),
+                    'srcset': '', 'webp_srcset': ''}
+        return None
+
+    def srcset(ext):
+        return ', '.join(f"{url_for('static', filename=f'{UPLOAD_SUBDIR}/{key}-{side}.{ext}')} {density}x"
+                         for density, side in enumerate(sizes[:2], start=1))
+
+    return {
+        'src': url_for('static', filename=f'{UPLOAD_SUBDIR}/{key}-{sizes[0]}.jpg'),
+        'srcset': srcset('jpg'),
+        'webp_srcset': srcset('webp'),
+    }
@@ -0,0 +1,103 @@
+# Sistema de Registro de Avaliações - Clínica TEA
+# Criado por João Layon
+
+import logging
+import time
+from config import Config
+from models.database import get_db_connection, get_db_transaction
+
+logger = logging.getLogger(__name__)
+
+# Remoção em massa sem travar o banco. Um único DELETE de tudo segura o lock
+# de escrita do SQLite até o fim, e nesse tempo ninguém mais grava (puxar um
+# paciente, registrar uma avaliação). Aqui as linhas saem em lotes por faixa
+# de id, cada lote numa transação curta, com uma pausa entre eles para as
+# outras escritas passarem. Cada lote recomeça do menor id que ainda existe
+# até o limite, então rodar de novo depois de uma queda continua de onde
+# parou sem precisar guardar checkpoint.
+
+# Remoção dos pacientes com tudo o que depende deles, na ordem das chaves
+# estrangeiras; cada comando recebe o primeiro e o último id de paciente do lote
+PATIENT_PURGE = (
+    "DELETE FROM procedimentos WHERE paciente_id BETWEEN ? AND ?",
+    """DELETE FROM avaliacao_terapias WHERE avaliacao_id IN (
+           SELECT id FROM avaliacoes WHERE paciente_id BETWEEN ? AND ?)""",
+    "DELETE FROM avaliacoes WHERE paciente_id BETWEEN ? AND ?",
+    "DELETE FROM pacientes WHERE id BETWEEN ? AND ?",
+)
+
+def purge_bounds(table):
+    """(maior id, total de linhas) de table: o limite de uma remoção pedida agora"""
+    conn = get_db_connection()
+    row = conn.execute(f"SELECT MAX(id), COUNT(*) FROM {table}").fetchone()
+    return row[0] or 0, row[1]
+
+def purge_range(table, statements, until_id, chunk_size=None, pause=None, progress=None):
+    """Apaga as linhas de table com id <= until_id, em lotes de chunk_size linhas.
+
+    statements são os DELETEs de cada lote (o último apaga de table) com dois
+    parâmetros: o primeiro e o último id do lote. Linhas criadas depois do
+    pedido (id > until_id) ficam. progress(apagadas, restantes_no_inicio) é
+    chamado a cada lote. Retorna quantas linhas de table foram apagadas.
+    """
+    chunk_size = chunk_size or Config.PURGE_CHUNK_SIZE
+    pause = Config.PURGE_PAUSE if pause is None else pause
+    conn = get_db_connection()
+    remaining = conn.execute(f"SELECT COUNT(*) FROM {table} WHERE id <= ?", (until_id,)).fetchone()[0]
+
+    deleted = 0
+    while True:
+        first, last = conn.execute(f"""
+            SELECT MIN(id), MAX(id) FROM (
+                SELECT id FROM {table} WHERE id <= ? ORDER BY id LIMIT ?
+            )
+        """, (until_id, chunk_size)).fetchone()
+        if first is None:
+            break
+
+        with get_db_transaction() as tx:
+            for sql in statements:
+                cursor = tx.execute(sql, (first, last))
+        deleted += cursor.rowcount
+        if progress:
+            progress(deleted, remaining)
+        # Libera o banco para as outras escritas antes do próximo lote
+        time.sleep(pause)
+
+    return deleted
+
+def reclaim_space(full=False, pages=None, pause=None):
+    """Devolve ao disco as páginas que ficaram livres; retorna quantos bytes.
+
+    Com auto_vacuum=INCREMENTAL, libera pages páginas por vez, cada passo uma
+    escrita curta. Senão só com full=True: um VACUUM completo, que reescreve o
+    banco (e bloqueia as escritas enquanto isso) já em modo INCREMENTAL, para
+    que as próximas vezes sejam incrementais.
+    """
+    pages = pages or Config.PURGE_VACUUM_PAGES
+    pause = Config.PURGE_PAUSE if pause is None else pause
+    conn = get_db_connection()
+    page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+    free_before = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    if not free_before:
+        return 0
+
+    mode = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+    if mode == 2:
+        free = free_before
+        while free:
+            conn.execute(f'PRAGMA incremental_vacuum({int(pages)})').fetchall()
+            previous, free = free, conn.execute('PRAGMA freelist_count').fetchone()[0]
+            if free >= previous:
+                break
+            time.sleep(pause)
+    elif full:
+        conn.commit()
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('VACUUM')
+    else:
+        return 0
+
+    freed = (free_before - conn.execute('PRAGMA freelist_count').fetchone()[0]) * page_size
+    logger.info("Espaço liberado: %.1f MB", freed / 1e6)
+    return freed
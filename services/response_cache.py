@@ -0,0 +1,173 @@
+# Sistema de Registro de Avaliações - Clínica TEA
+# Criado por João Layon
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+import unicodedata
+from collections import OrderedDict
+from threading import Lock
+from utils.metrics import Counter
+
+# Consultas ao cache por resultado: memory, disk (SQLite) ou miss
+LOOKUPS = Counter('tea_assistant_cache_lookups_total',
+                  'Consultas ao cache de respostas do assistente por resultado', ('result',))
+
+def normalize_question(question):
+    """Normaliza a pergunta: minúsculas, sem acentos, espaços e pontuação final"""
+    text = unicodedata.normalize('NFKD', question or '')
+    text = ''.join(c for c in text if not unicodedata.combining(c)).lower()
+    text = re.sub(r'\s+', ' ', text).strip()
+    return text.rstrip('?!. ')
+
+def context_fingerprint(context_data):
+    """Impressão digital das linhas de contexto usadas na resposta.
+
+    Qualquer mudança nos procedimentos (atualizado_em/estado), em novas
+    avaliações ou nos pacientes/médicos encontrados gera uma chave nova.
+    """
+    parts = {
+        'patients': sorted((p.id, p.nome) for p in context_data.get('patients', [])),
+        'assignments': sorted(
+            (a['id'], a['estado'], str(a['atualizado_em']), a.get('medico_responsavel_id'))
+            for a in context_data.get('current_assignments', [])
+        ),
+        'evaluations': sorted(e.id for e in context_data.get('evaluations', [])),
+        'doctors': sorted((d['id'], d['especialidade'] or '') for d in context_data.get('doctors', [])),
+    }
+    return hashlib.sha256(json.dumps(parts, default=str).encode('utf-8')).hexdigest()
+
+class ResponseCache:
+    """LRU com TTL para respostas do assistente, persistido em SQLite local.
+
+    A camada em memória evita ida ao disco nos acertos quentes; a tabela
+    SQLite é compartilhada entre workers e sobrevive a reinícios.
+    """
+
+    def __init__(self, path, ttl=3600, max_entries=1000, memory_entries=256):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self._memory = OrderedDict()
+        self._lock = Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'saved_seconds': 0.0}
+
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS assistant_cache (
+                chave TEXT PRIMARY KEY,
+                resposta TEXT NOT NULL,
+                latencia REAL NOT NULL,
+                criado_em REAL NOT NULL,
+                acessado_em REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_assistant_cache_acessado
+                ON assistant_cache (acessado_em);
+        """)
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(question, context_data):
+        """Chave = pergunta normalizada + impressão digital do contexto"""
+        raw = normalize_question(question) + '|' + context_fingerprint(context_data)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Retorna a resposta em cache ou None"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and now - entry[2] <= self.ttl:
+                self._memory.move_to_end(key)
+                LOOKUPS.inc('memory')
+                return self._hit(entry)
+
+            row = self._conn.execute("""
+                SELECT resposta, latencia, criado_em FROM assistant_cache WHERE chave = ?
+            """, (key,)).fetchone()
+
+            if row and now - row[2] <= self.ttl:
+                self._conn.execute("""
+                    UPDATE assistant_cache SET acessado_em = ? WHERE chave = ?
+                """, (now, key))
+                self._conn.commit()
+                self._remember(key, row)
+                LOOKUPS.inc('disk')
+                return self._hit(row)
+
+            self._memory.pop(key, None)
+            self._stats['misses'] += 1
+            LOOKUPS.inc('miss')
+            return None
+
+    def set(self, key, answer, latency):
+        """Armazena a resposta e a latência do modelo que ela economiza"""
+        now = time.time()
+        entry = (answer, latency, now)
+        with self._lock:
+            self._remember(key, entry)
+            self._conn.execute("""
+                INSERT OR REPLACE INTO assistant_cache (chave, resposta, latencia, criado_em, acessado_em)
+                VALUES (?, ?, ?, ?, ?)
+            """, (key, answer, latency, now, now))
+            self._conn.execute("""
+                DELETE FROM assistant_cache WHERE criado_em < ?
+            """, (now - self.ttl,))
+            self._conn.execute("""
+                DELETE FROM assistant_cache WHERE chave IN (
+                    SELECT chave FROM assistant_cache
+                    ORDER BY acessado_em DESC
+                    LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,))
+            self._conn.commit()
+
+    def clear(self):
+        """Remove todas as entradas"""
+        with self._lock:
+            self._memory.clear()
+            self._conn.execute('DELETE FROM assistant_cache')
+            self._conn.commit()
+
+    def get_stats(self):
+        """Taxa de acerto e latência economizada"""
+        with self._lock:
+            stats = dict(self._stats)
+        total = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / total if total else 0.0
+        return stats
+
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _hit(self, entry):
+        self._stats['hits'] += 1
+        self._stats['saved_seconds'] += entry[1]
+        return entry[0]
+
+_cache = None
+_cache_lock = Lock()
+
+def get_response_cache():
+    """Cache compartilhado do processo, configurado a partir de Config"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                from config import Config
+                _cache = ResponseCache(
+                    Config.ASSISTANT_CACHE_PATH,
+                    ttl=Config.ASSISTANT_CACHE_TTL,
+                    max_entries=Config.ASSISTANT_CACHE_MAX_ENTRIES
+                )
+    return _cache
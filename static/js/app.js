@@ -13,7 +13,9 @@ document.addEventListener('DOMContentLoaded', function() {
     initializeModals();
     initializeTableSorting();
     initializeSearchDebounce();
+    initializeTypeahead();
     initializeProgressBars();
+    initializeKanban();
     
     console.log('Sistema TEA - Aplicação inicializada');
 });
@@ -342,6 +344,18 @@ function sortTable(header) {
     rows.forEach(row => tbody.appendChild(row));
 }
 
+/**
+ * Delay calls to fn until `wait` ms have passed without a new call
+ */
+function debounce(fn, wait) {
+    let debounceTimer;
+    
+    return function(...args) {
+        clearTimeout(debounceTimer);
+        debounceTimer = setTimeout(() => fn.apply(this, args), wait);
+    };
+}
+
 /**
  * Initialize search with debounce
  */
@@ -349,13 +363,124 @@ function initializeSearchDebounce() {
     const searchInputs = document.querySelectorAll('input[data-search]');
     
     searchInputs.forEach(input => {
-        let debounceTimer;
+        input.addEventListener('input', debounce(function() {
+            performSearch(this);
+        }, 300));
+    });
+}
+
+/**
+ * Remote typeahead (e.g. patient picker)
+ *
+ * <input data-typeahead="/url" data-typeahead-target="hidden-input-id">
+ * followed by <ul data-typeahead-results>. The endpoint returns
+ * {"results": [[id, label, detail], ...]}.
+ */
+function initializeTypeahead() {
+    const inputs = document.querySelectorAll('input[data-typeahead]');
+    
+    inputs.forEach(input => {
+        const url = input.getAttribute('data-typeahead');
+        const target = document.getElementById(input.getAttribute('data-typeahead-target'));
+        const list = input.parentElement.querySelector('[data-typeahead-results]');
+        const cache = new Map();
+        let controller = null;
+        let activeIndex = -1;
+        
+        function render(results) {
+            list.innerHTML = '';
+            activeIndex = -1;
+            
+            if (!results.length) {
+                const empty = document.createElement('li');
+                empty.className = 'px-3 py-2 text-gray-500';
+                empty.textContent = 'Nenhum paciente encontrado';
+                list.appendChild(empty);
+            }
+            
+            results.forEach(([id, label, detail]) => {
+                const item = document.createElement('li');
+                item.className = 'px-3 py-2 cursor-pointer hover:bg-blue-50';
+                item.dataset.id = id;
+                item.textContent = `${label} - ${detail}`;
+                item.addEventListener('mousedown', function(e) {
+                    e.preventDefault();
+                    select(item);
+                });
+                list.appendChild(item);
+            });
+            
+            list.classList.remove('hidden');
+        }
+        
+        function select(item) {
+            target.value = item.dataset.id;
+            input.value = item.textContent;
+            list.classList.add('hidden');
+        }
+        
+        function highlight(index) {
+            const items = list.querySelectorAll('li[data-id]');
+            if (!items.length) return;
+            
+            activeIndex = (index + items.length) % items.length;
+            items.forEach((item, i) => item.classList.toggle('bg-blue-100', i === activeIndex));
+        }
+        
+        const search = debounce(async function() {
+            const query = input.value.trim();
+            if (query.length < 2) {
+                list.classList.add('hidden');
+                return;
+            }
+            
+            if (cache.has(query)) {
+                render(cache.get(query));
+                return;
+            }
+            
+            // Only the latest request matters
+            if (controller) controller.abort();
+            controller = new AbortController();
+            
+            try {
+                const response = await fetch(`${url}?q=${encodeURIComponent(query)}`, {
+                    signal: controller.signal,
+                    headers: { 'Accept': 'application/json' }
+                });
+                const data = await response.json();
+                cache.set(query, data.results);
+                if (input.value.trim() === query) {
+                    render(data.results);
+                }
+            } catch (error) {
+                if (error.name !== 'AbortError') {
+                    console.error('Erro na busca:', error);
+                }
+            }
+        }, 250);
         
         input.addEventListener('input', function() {
-            clearTimeout(debounceTimer);
-            debounceTimer = setTimeout(() => {
-                performSearch(this);
-            }, 300);
+            target.value = '';
+            search();
+        });
+        
+        input.addEventListener('keydown', function(e) {
+            if (list.classList.contains('hidden')) return;
+            
+            if (e.key === 'ArrowDown' || e.key === 'ArrowUp') {
+                e.preventDefault();
+                highlight(activeIndex + (e.key === 'ArrowDown' ? 1 : -1));
+            } else if (e.key === 'Enter' && activeIndex >= 0) {
+                e.preventDefault();
+                select(list.querySelectorAll('li[data-id]')[activeIndex]);
+            } else if (e.key === 'Escape') {
+                list.classList.add('hidden');
+            }
+        });
+        
+        input.addEventListener('blur', function() {
+            list.classList.add('hidden');
         });
     });
 }
@@ -392,6 +517,103 @@ function initializeProgressBars() {
     });
 }
 
+/**
+ * Distribution kanban: each specialty group renders its first cards and
+ * fetches the next page from data-url when its last card scrolls into view.
+ * Only pages near the visible part of a group keep their cards in the DOM;
+ * the others are emptied to a spacer of the same height and rebuilt from
+ * their HTML when they scroll back into range.
+ */
+function initializeKanban() {
+    const groups = document.querySelectorAll('[data-kanban-group]');
+    if (!groups.length || typeof IntersectionObserver === 'undefined') return;
+    
+    groups.forEach(group => {
+        const container = group.querySelector('[data-kanban-cards]');
+        const sentinel = group.querySelector('[data-kanban-sentinel]');
+        const parked = new Map();  // emptied page -> its cards' HTML
+        let loading = false;
+        
+        if (!group.dataset.depoisId) {
+            sentinel.remove();
+            return;
+        }
+        
+        function parkPage(page) {
+            if (parked.has(page)) return;
+            page.style.height = page.offsetHeight + 'px';
+            parked.set(page, page.innerHTML);
+            page.replaceChildren();
+        }
+        
+        function mountPage(page) {
+            const html = parked.get(page);
+            if (html === undefined) return;
+            parked.delete(page);
+            page.innerHTML = html;
+            page.style.height = '';
+        }
+        
+        // A page stays mounted while it is within one group height of the visible part
+        const pageObserver = new IntersectionObserver(entries => {
+            entries.forEach(entry => {
+                if (entry.isIntersecting) {
+                    mountPage(entry.target);
+                } else {
+                    parkPage(entry.target);
+                }
+            });
+        }, { root: container, rootMargin: '100% 0px' });
+        container.querySelectorAll('[data-kanban-page]').forEach(page => pageObserver.observe(page));
+        
+        async function loadMore() {
+            if (loading || !group.dataset.depoisId) return;
+            loading = true;
+            
+            const url = new URL(group.dataset.url, window.location.origin);
+            url.searchParams.set('depois_em', group.dataset.depoisEm);
+            url.searchParams.set('depois_id', group.dataset.depoisId);
+            
+            try {
+                const response = await fetch(url, { headers: { 'Accept': 'application/json' } });
+                const data = await response.json();
+                const page = document.createElement('div');
+                page.className = 'space-y-4';
+                page.dataset.kanbanPage = '';
+                page.innerHTML = data.html;
+                sentinel.before(page);
+                if (typeof feather !== 'undefined') {
+                    feather.replace();
+                }
+                pageObserver.observe(page);
+                
+                if (data.next) {
+                    group.dataset.depoisEm = data.next.depois_em;
+                    group.dataset.depoisId = data.next.depois_id;
+                    // Observing again reports the sentinel at once if it is still visible
+                    observer.unobserve(sentinel);
+                    observer.observe(sentinel);
+                } else {
+                    delete group.dataset.depoisId;
+                    observer.disconnect();
+                    sentinel.remove();
+                }
+            } catch (error) {
+                console.error('Erro ao carregar procedimentos:', error);
+            } finally {
+                loading = false;
+            }
+        }
+        
+        const observer = new IntersectionObserver(entries => {
+            if (entries.some(entry => entry.isIntersecting)) {
+                loadMore();
+            }
+        }, { root: container, rootMargin: '200px' });
+        observer.observe(sentinel);
+    });
+}
+
 /**
  * Show loading state
  */
@@ -526,6 +748,7 @@ function formatDateTime(dateString) {
 
 // Global functions for easy access
 window.TEASystem = {
+    debounce,
     showNotification,
     showLoading,
     hideLoading,
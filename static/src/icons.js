@@ -0,0 +1,54 @@
+// Sistema de Registro de Avaliações - Clínica TEA
+// Criado por João Layon
+
+/**
+ * Drop-in replacement for feather.replace() backed by the icon sprite built
+ * by scripts/build_assets.py, so pages don't download the whole icon set.
+ * The sprite URL comes from <html data-icon-sprite>, set by base.html.
+ */
+(function() {
+    const SVG_NS = 'http://www.w3.org/2000/svg';
+    const SVG_ATTRS = {
+        width: '24',
+        height: '24',
+        viewBox: '0 0 24 24',
+        fill: 'none',
+        stroke: 'currentColor',
+        'stroke-width': '2',
+        'stroke-linecap': 'round',
+        'stroke-linejoin': 'round'
+    };
+
+    function replace(attrs) {
+        const sprite = document.documentElement.getAttribute('data-icon-sprite');
+        if (!sprite) {
+            return;
+        }
+
+        document.querySelectorAll('[data-feather]').forEach(element => {
+            const name = element.getAttribute('data-feather');
+            const svg = document.createElementNS(SVG_NS, 'svg');
+            const options = Object.assign({}, SVG_ATTRS, attrs || {});
+
+            Object.keys(options).forEach(key => {
+                if (key !== 'class') {
+                    svg.setAttribute(key, options[key]);
+                }
+            });
+            Array.prototype.forEach.call(element.attributes, attr => {
+                if (attr.name !== 'data-feather' && attr.name !== 'class') {
+                    svg.setAttribute(attr.name, attr.value);
+                }
+            });
+            svg.setAttribute('class', ['feather', 'feather-' + name, options.class, element.getAttribute('class')]
+                .filter(Boolean).join(' '));
+
+            const use = document.createElementNS(SVG_NS, 'use');
+            use.setAttribute('href', sprite + '#' + name);
+            svg.appendChild(use);
+            element.parentNode.replaceChild(svg, element);
+        });
+    }
+
+    window.feather = { replace: replace };
+})();
@@ -0,0 +1,16 @@
+// Sistema de Registro de Avaliações - Clínica TEA
+// Criado por João Layon
+
+/** @type {import('tailwindcss').Config} */
+module.exports = {
+    // Only classes found in these files end up in static/dist/app.<hash>.css
+    content: [
+        './templates/**/*.html',
+        './static/js/**/*.js',
+        './static/src/**/*.js',
+    ],
+    theme: {
+        extend: {},
+    },
+    plugins: [],
+};
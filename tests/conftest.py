@@ -0,0 +1,34 @@
+# Sistema de Registro de Avaliações - Clínica TEA
+# Criado por João Layon
+
+import sys
+from pathlib import Path
+import pytest
+
+# Run from the repository root without installing the app
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+@pytest.fixture
+def clinic(tmp_path, monkeypatch):
+    """Fresh local database with one doctor and one patient.
+
+    Statements are counted by SimulatedLatencyConnection (with a negligible
+    latency), the same counter scripts/benchmark.py reports.
+    """
+    from config import Config
+    from models.database import close_db_connection, get_db_connection, init_db
+    from models.user import User
+
+    monkeypatch.setattr(Config, 'DATABASE_SIMULATED_LATENCY_MS', 0.001)
+    close_db_connection()
+    init_db(str(tmp_path / 'app.db'))
+    doctor = User.create('Dra. Fernanda Lima', 'fernanda@teste.local', 'teste123', 'medico', 'Fonoaudiologia')
+    conn = get_db_connection()
+    patient_id = conn.execute("""
+        INSERT INTO pacientes (nome, cpf, data_nascimento, local_referencia)
+        VALUES ('Ana Silva', '00000000000', '2015-01-01', 'Clínica Principal')
+        RETURNING id
+    """).fetchone()[0]
+    conn.commit()
+    yield {'doctor': doctor, 'patient_id': patient_id}
+    close_db_connection()
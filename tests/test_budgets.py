@@ -0,0 +1,89 @@
+# Sistema de Registro de Avaliações - Clínica TEA
+# Criado por João Layon
+
+"""
+Performance budgets: limits that must not regress
+scripts/benchmark.py measures the same paths in detail; these checks fail
+the test run when a change goes over a budget.
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = str(Path(__file__).parent.parent)
+
+# Cold start of the app (median of IMPORT_ROUNDS fresh interpreters)
+IMPORT_BUDGET_MS = 400
+IMPORT_ROUNDS = 5
+
+# Heavy optional dependencies, loaded on first use
+LAZY_MODULES = ('google.genai', 'PIL')
+
+# What the scripts in scripts/ import: must not pull in Flask
+SCRIPT_MODULES = ('services.backup', 'services.audit_archiver', 'models.change_log',
+                  'models.evaluation', 'utils.assets')
+
+def import_times(module, env):
+    """{module: cumulative µs} for a fresh interpreter importing module (python -X importtime)"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=ROOT, env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr[-2000:]
+    times = {}
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:') and 'cumulative' not in line:
+            _, cumulative, name = line.split('|')
+            times[name.strip()] = int(cumulative)
+    return times
+
+def test_app_import_time(tmp_path):
+    env = dict(os.environ, DATABASE_URL=str(tmp_path / 'app.db'), AUDIT_ARCHIVE_INTERVAL='0')
+    import_times('app', env)  # the first start applies the migrations to the empty database
+
+    samples = []
+    for _ in range(IMPORT_ROUNDS):
+        times = import_times('app', env)
+        samples.append(times['app'] / 1000)
+    assert statistics.median(samples) <= IMPORT_BUDGET_MS, samples
+    assert not [module for module in LAZY_MODULES if module in times]
+
+def test_script_modules_skip_flask(tmp_path):
+    env = dict(os.environ, DATABASE_URL=str(tmp_path / 'app.db'), AUDIT_ARCHIVE_INTERVAL='0')
+    for script_module in SCRIPT_MODULES:
+        times = import_times(script_module, env)
+        assert not [module for module in ('flask',) + LAZY_MODULES if module in times], script_module
+
+def test_evaluation_create_statements(clinic):
+    """Evaluation.create is set-based: its statement count does not grow with the therapies"""
+    from config import Config
+    from models.database import SimulatedLatencyConnection
+    from models.evaluation import Evaluation
+
+    doctor = clinic['doctor']
+    statements = {}
+    for count in (1, len(Config.DEFAULT_SPECIALTIES)):
+        before = SimulatedLatencyConnection.statements
+        Evaluation.create(clinic['patient_id'], doctor.id, doctor.especialidade, 'Clínica Principal',
+                          'Avaliação', Config.DEFAULT_SPECIALTIES[:count], user_id=doctor.id)
+        statements[count] = SimulatedLatencyConnection.statements - before
+    assert len(set(statements.values())) == 1, statements
+
+def test_patient_record_statements(clinic):
+    """PatientRecord.load reads the whole history in one statement, newest evaluation first"""
+    from config import Config
+    from models.database import SimulatedLatencyConnection
+    from models.evaluation import Evaluation
+    from models.patient_record import PatientRecord
+
+    doctor = clinic['doctor']
+    for i in range(10):
+        Evaluation.create(clinic['patient_id'], doctor.id, doctor.especialidade, 'Clínica Principal',
+                          f'Retorno {i}', Config.DEFAULT_SPECIALTIES[:i % 3 + 1], user_id=doctor.id)
+
+    before = SimulatedLatencyConnection.statements
+    record = PatientRecord.load(clinic['patient_id'])
+    assert SimulatedLatencyConnection.statements - before == 1
+    assert len(record.evaluations) == 10
+    assert [e.id for e in record.evaluations] == sorted((e.id for e in record.evaluations), reverse=True)
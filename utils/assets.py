@@ -0,0 +1,82 @@
+# Sistema de Registro de Avaliações - Clínica TEA
+# Criado por João Layon
+
+import json
+import mimetypes
+import os
+import re
+
+# scripts/build_assets.py writes fingerprinted bundles to static/dist and a
+# manifest mapping logical names ('app.css') to them ('dist/app.3f9c2a1b.css').
+# url_for('static', filename='app.css') resolves through the manifest, so
+# templates never hard-code hashes. Without a build the manifest is empty and
+# base.html keeps loading the CDN scripts.
+
+DIST_DIR = 'dist'
+MANIFEST_FILE = 'manifest.json'
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# Content-Encoding -> file suffix, in order of preference
+PRECOMPRESSED = (('br', '.br'), ('gzip', '.gz'))
+
+# Other static files named after a hash of their content (profile photos)
+IMMUTABLE_PATTERNS = (re.compile(r'^uploads/profile/[0-9a-f]{16}-'),)
+
+def load_manifest(static_folder):
+    """Logical name -> fingerprinted path under static/ ({} when assets weren't built)"""
+    path = os.path.join(static_folder, DIST_DIR, MANIFEST_FILE)
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def init_assets(app):
+    """Hook the asset manifest into url_for('static') and serve dist/ precompressed"""
+    manifest = load_manifest(app.static_folder)
+    app.extensions['asset_manifest'] = manifest
+
+    @app.url_defaults
+    def fingerprint_static(endpoint, values):
+        if endpoint == 'static' and values.get('filename') in manifest:
+            values['filename'] = manifest[values['filename']]
+
+    send_static_file = app.view_functions['static']
+
+    def static(filename):
+        if filename.startswith(DIST_DIR + '/'):
+            return send_fingerprinted(app.static_folder, filename)
+        if any(pattern.match(filename) for pattern in IMMUTABLE_PATTERNS):
+            return send_fingerprinted(app.static_folder, filename, precompressed=False)
+        return send_static_file(filename=filename)
+
+    app.view_functions['static'] = static
+
+    @app.context_processor
+    def inject_assets():
+        return {'asset_manifest': manifest}
+
+def send_fingerprinted(static_folder, filename, precompressed=True):
+    """Serve a content-hashed file, preferring a .br/.gz sibling the client accepts.
+
+    The name changes whenever the content does, so it can be cached forever.
+    """
+    # Imported here so scripts/build_assets.py can use this module without Flask
+    from flask import request, send_from_directory
+
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    encoding = None
+    for name, suffix in PRECOMPRESSED if precompressed else ():
+        if request.accept_encodings[name] and os.path.isfile(os.path.join(static_folder, filename + suffix)):
+            encoding, filename = name, filename + suffix
+            break
+
+    response = send_from_directory(static_folder, filename, mimetype=mimetype,
+                                   max_age=IMMUTABLE_MAX_AGE)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    if precompressed:
+        response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
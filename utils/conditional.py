@@ -0,0 +1,87 @@
+# Sistema de Registro de Avaliações - Clínica TEA
+# Criado por João Layon
+
+import hashlib
+import os
+from datetime import date
+from functools import wraps
+from flask import current_app, request, session, make_response
+from models.database import get_db_connection
+
+# Pages validated here only depend on the logged-in user, the query string
+# and the data covered by data_version(), so a matching ETag means the page
+# would render byte for byte the same and can be answered with 304.
+
+_deploy_stamps = {}
+
+def data_version():
+    """Cheap version of patients, evaluations, procedures, users and lookup tables.
+
+    The change log sequence moves on every write to the clinical tables and
+    versoes_dados on every visible change to users/specialties/locations, so
+    this is two primary key lookups instead of the page's queries.
+    """
+    conn = get_db_connection()
+    if hasattr(conn, 'position'):
+        # Read replica: version the copy the page will be rendered from
+        return '%d.%d' % conn.position()
+    row = conn.execute("""
+        SELECT (SELECT seq FROM sqlite_sequence WHERE name = 'alteracoes') AS alteracoes,
+               (SELECT valor FROM versoes_dados WHERE chave = 'cadastros') AS cadastros
+    """).fetchone()
+    return f"{row['alteracoes'] or 0}.{row['cadastros'] or 0}"
+
+def _deploy_stamp(app):
+    """Newest template mtime, so a deploy that changes markup invalidates old ETags"""
+    folder = os.path.join(app.root_path, app.template_folder)
+    if folder not in _deploy_stamps:
+        newest = 0
+        for root, _, files in os.walk(folder):
+            for name in files:
+                newest = max(newest, os.path.getmtime(os.path.join(root, name)))
+        _deploy_stamps[folder] = int(newest)
+    return _deploy_stamps[folder]
+
+def page_etag(*extra):
+    """ETag for the current request: data version + user variant + URL"""
+    parts = [
+        _deploy_stamp(current_app),
+        sorted(current_app.extensions.get('asset_manifest', {}).values()),
+        data_version(),
+        session.get('user_id'),
+        session.get('user_perfil'),
+        session.get('user_especialidade'),
+        session.get('user_nome'),
+        request.full_path,
+    ] + [str(value) for value in extra]
+    return hashlib.sha1('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()[:24]
+
+def conditional_get(daily=False):
+    """Answer GETs with 304 Not Modified when the client's If-None-Match is still current.
+
+    Goes below @require_login so unauthenticated requests never get an ETag.
+    daily=True adds today's date to the version for pages with relative
+    date windows (e.g. "last 7 days").
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            # A pending flash message is rendered (and consumed) by the page itself
+            if request.method not in ('GET', 'HEAD') or '_flashes' in session:
+                return f(*args, **kwargs)
+
+            etag = page_etag(date.today().isoformat() if daily else '')
+            if request.if_none_match.contains(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            response.vary.add('Cookie')
+            return response
+        return decorated_function
+    return decorator
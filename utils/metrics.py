@@ -0,0 +1,360 @@
+# Sistema de Registro de Avaliações - Clínica TEA
+# Criado por João Layon
+
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from threading import RLock, local
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Counters and histograms in the Prometheus text format. Recording only
+# touches a dict owned by the calling thread, with no lock; a scrape adds up
+# the dicts of every thread. Each process also writes its totals to
+# METRICS_DIR every METRICS_FLUSH_INTERVAL seconds, and a scrape merges the
+# files of the other processes (gunicorn workers, job workers), so whichever
+# worker answers reports the whole server. Files of processes that ended are
+# folded into one, so counters never go backwards while workers recycle.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+_metrics = {}        # name -> Counter/Histogram, in registration order
+_collectors = []     # callables returning gauges read at scrape time
+
+_lock = RLock()
+_shards = []         # the values dict of every live thread
+_retired = {}        # totals of threads that already ended
+_local = local()
+_process = f'{os.getpid()}-{time.time_ns()}'
+_flusher = None
+
+# File with the totals of processes that already ended
+ENDED = 'encerrados.json'
+
+class _Owner:
+    """Lives in the thread-local storage; when the thread ends it goes with it"""
+
+def _new_shard():
+    values = {}
+    owner = _Owner()
+    _local.values = values
+    _local.owner = owner
+    with _lock:
+        _shards.append(values)
+    weakref.finalize(owner, _retire, values)
+    return values
+
+def _shard():
+    try:
+        return _local.values
+    except AttributeError:
+        return _new_shard()
+
+def _retire(values):
+    with _lock:
+        for i, shard in enumerate(_shards):
+            if shard is values:
+                del _shards[i]
+                _merge(_retired, list(values.items()))
+                break
+
+def _merge(totals, items):
+    for key, value in items:
+        if isinstance(value, list):
+            cells = totals.get(key)
+            if cells is None:
+                totals[key] = list(value)
+            else:
+                for i, v in enumerate(value):
+                    cells[i] += v
+        else:
+            totals[key] = totals.get(key, 0) + value
+
+class Counter:
+    """Monotonic count, optionally split by labels (values passed positionally)"""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        _metrics[name] = self
+
+    def inc(self, *labels, amount=1):
+        values = _shard()
+        key = (self.name, labels)
+        values[key] = values.get(key, 0) + amount
+
+    def _samples(self, labels, value):
+        yield self.name, labels, value
+
+class Histogram:
+    """Distribution of observed values in cumulative buckets, with sum and count"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        _metrics[name] = self
+
+    def observe(self, value, *labels):
+        values = _shard()
+        key = (self.name, labels)
+        cells = values.get(key)
+        if cells is None:
+            # One cell per bucket (not cumulative), then sum and count
+            cells = values[key] = [0] * (len(self.buckets) + 2)
+        i = bisect_left(self.buckets, value)
+        if i < len(self.buckets):
+            cells[i] += 1
+        cells[-2] += value
+        cells[-1] += 1
+
+    def _samples(self, labels, cells):
+        cumulative = 0
+        for bound, count in zip(self.buckets, cells):
+            cumulative += count
+            yield f'{self.name}_bucket', labels + (('le', _number(bound)),), cumulative
+        yield f'{self.name}_bucket', labels + (('le', '+Inf'),), cells[-1]
+        yield f'{self.name}_sum', labels, cells[-2]
+        yield f'{self.name}_count', labels, cells[-1]
+
+def register_collector(collector):
+    """Add a function returning [(name, documentation, label_names, [(label_values, value)])],
+    gauges read when /metrics is scraped"""
+    _collectors.append(collector)
+    return collector
+
+# SQL of the current request, added up by the database connection
+
+def record_sql(statements, elapsed):
+    """Count statements sent to the database by this thread and the time they took"""
+    try:
+        totals = _local.sql
+    except AttributeError:
+        totals = _local.sql = [0, 0.0]
+    totals[0] += statements
+    totals[1] += elapsed
+
+def take_sql():
+    """(statements, seconds) recorded by this thread since the last call"""
+    totals = getattr(_local, 'sql', None)
+    _local.sql = [0, 0.0]
+    return (totals[0], totals[1]) if totals else (0, 0.0)
+
+# Aggregation and exposition
+
+def _collect_process():
+    with _lock:
+        shards = list(_shards)
+        totals = {}
+        _merge(totals, _retired.items())
+    for values in shards:
+        # list() copies the items in one step, even while the owner adds keys
+        _merge(totals, list(values.items()))
+    return totals
+
+def _own_file():
+    return os.path.join(Config.METRICS_DIR, f'{_process}.json')
+
+def _write(path, totals):
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump([[name, list(labels), value] for (name, labels), value in totals.items()], f)
+    os.replace(tmp, path)
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return [((name, tuple(labels)), value) for name, labels, value in json.load(f)]
+    except (OSError, ValueError):
+        return []
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def flush():
+    """Write this process's totals to METRICS_DIR"""
+    if not Config.METRICS_DIR:
+        return
+    os.makedirs(Config.METRICS_DIR, exist_ok=True)
+    _write(_own_file(), _collect_process())
+
+def _fold_ended(folder, names):
+    """Move the totals of processes that ended into ENDED; returns the live files"""
+    import fcntl
+    ended = [n for n in names if not _alive(int(n.split('-', 1)[0]))]
+    if not ended:
+        return names
+    with open(os.path.join(folder, '.lock'), 'w') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return names  # another worker is folding them right now
+        totals = dict(_read(os.path.join(folder, ENDED)))
+        ended = [n for n in ended if os.path.exists(os.path.join(folder, n))]
+        for name in ended:
+            _merge(totals, _read(os.path.join(folder, name)))
+        _write(os.path.join(folder, ENDED), totals)
+        for name in ended:
+            os.remove(os.path.join(folder, name))
+    return [n for n in names if n not in ended]
+
+def collect():
+    """Totals of every process: {(name, label_values): value or histogram cells}"""
+    totals = _collect_process()
+    folder = Config.METRICS_DIR
+    if not folder or not os.path.isdir(folder):
+        return totals
+    own = os.path.basename(_own_file())
+    names = [n for n in os.listdir(folder)
+             if n.endswith('.json') and n not in (own, ENDED) and n.split('-', 1)[0].isdigit()]
+    try:
+        names = _fold_ended(folder, names)
+    except OSError:
+        logger.warning("Não foi possível consolidar as métricas de processos encerrados", exc_info=True)
+    for name in names + [ENDED]:
+        _merge(totals, _read(os.path.join(folder, name)))
+    return totals
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _number(value):
+    return repr(value) if isinstance(value, float) else str(value)
+
+def _line(name, labels, value):
+    if labels:
+        pairs = ','.join(f'{k}="{_escape(v)}"' for k, v in labels)
+        return f'{name}{{{pairs}}} {_number(value)}'
+    return f'{name} {_number(value)}'
+
+def render():
+    """Every metric in the Prometheus text exposition format (version 0.0.4)"""
+    by_name = {}
+    for (name, labels), value in collect().items():
+        by_name.setdefault(name, []).append((labels, value))
+
+    lines = []
+    for name, metric in _metrics.items():
+        lines.append(f'# HELP {name} {metric.documentation}')
+        lines.append(f'# TYPE {name} {metric.kind}')
+        for labels, value in sorted(by_name.get(name, ()), key=lambda item: [str(v) for v in item[0]]):
+            for sample, sample_labels, sample_value in metric._samples(tuple(zip(metric.labels, labels)), value):
+                lines.append(_line(sample, sample_labels, sample_value))
+
+    for collector in _collectors:
+        try:
+            gauges = collector()
+        except Exception:
+            logger.exception("Falha ao coletar métricas de %s", collector.__name__)
+            continue
+        for name, documentation, label_names, samples in gauges:
+            lines.append(f'# HELP {name} {documentation}')
+            lines.append(f'# TYPE {name} gauge')
+            for label_values, value in samples:
+                lines.append(_line(name, tuple(zip(label_names, label_values)), value))
+    return '\n'.join(lines) + '\n'
+
+# Per-process lifecycle
+
+def _flush_loop(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            flush()
+        except OSError:
+            logger.warning("Não foi possível gravar as métricas em %s", Config.METRICS_DIR, exc_info=True)
+
+def start_flusher(interval=None):
+    """Write this process's totals to METRICS_DIR periodically and at exit"""
+    global _flusher
+    interval = Config.METRICS_FLUSH_INTERVAL if interval is None else interval
+    if not Config.METRICS_DIR or interval <= 0 or (_flusher and _flusher.is_alive()):
+        return
+    _flusher = threading.Thread(target=_flush_loop, args=(interval,), name='metrics-flush', daemon=True)
+    _flusher.start()
+
+def reset_after_fork():
+    """Start from zero in a forked child (the parent keeps reporting its own totals)"""
+    global _local, _process, _flusher, _retired
+    with _lock:
+        _shards.clear()
+        _retired = {}
+    _local = local()
+    _process = f'{os.getpid()}-{time.time_ns()}'
+    _flusher = None
+    start_flusher()
+
+def clear_dir():
+    """Drop the files of a previous run (server start, before any worker exists)"""
+    folder = Config.METRICS_DIR
+    if folder and os.path.isdir(folder):
+        for name in os.listdir(folder):
+            if name.endswith('.json'):
+                os.remove(os.path.join(folder, name))
+
+def _flush_at_exit():
+    if _flusher is not None:
+        try:
+            flush()
+        except OSError:
+            pass
+
+atexit.register(_flush_at_exit)
+
+# Requests
+
+REQUEST_SECONDS = Histogram('tea_http_request_duration_seconds',
+                            'Tempo de resposta por endpoint', ('endpoint', 'method'))
+REQUESTS = Counter('tea_http_requests_total',
+                   'Respostas por endpoint e status', ('endpoint', 'method', 'status'))
+SQL_STATEMENTS = Histogram('tea_db_statements_per_request',
+                           'Comandos SQL enviados ao banco por requisição', ('endpoint',),
+                           buckets=COUNT_BUCKETS)
+SQL_SECONDS = Histogram('tea_db_seconds_per_request',
+                        'Tempo no banco por requisição', ('endpoint',))
+
+_METHODS = frozenset(('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'))
+
+def init_metrics(app):
+    """Time every request and the SQL it runs, and start flushing to METRICS_DIR"""
+    # Flask only here: models and scripts import this module without it
+    from flask import g, request
+    start_flusher()
+
+    @app.before_request
+    def start_request_metrics():
+        g.metrics_started = time.perf_counter()
+        take_sql()
+
+    @app.after_request
+    def record_request_metrics(response):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return response
+        endpoint = request.endpoint or 'sem_rota'
+        method = request.method if request.method in _METHODS else 'outro'
+        REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint, method)
+        REQUESTS.inc(endpoint, method, response.status_code)
+        statements, seconds = take_sql()
+        SQL_STATEMENTS.observe(statements, endpoint)
+        SQL_SECONDS.observe(seconds, endpoint)
+        return response
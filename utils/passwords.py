@@ -0,0 +1,41 @@
+# Sistema de Registro de Avaliações - Clínica TEA
+# Criado por João Layon
+
+from threading import BoundedSemaphore
+from werkzeug.security import generate_password_hash, check_password_hash
+from config import Config
+
+# Hashing runs on the request thread (hashlib releases the GIL, so other
+# threads keep serving meanwhile). The semaphore only caps how many hashes
+# run at once in this process: each scrypt call holds 128 * N * r bytes
+# (16 MiB at N=16384, r=8).
+_slots = BoundedSemaphore(Config.PASSWORD_HASH_CONCURRENCY)
+_dummy_hash = None
+
+def hash_password(password):
+    """Hash a password with the configured policy"""
+    with _slots:
+        return generate_password_hash(password, method=Config.PASSWORD_HASH_METHOD)
+
+def verify_password(password_hash, password):
+    """Check a password against a stored hash"""
+    with _slots:
+        return check_password_hash(password_hash, password)
+
+def _reference_hash():
+    """A hash made with the configured policy, once per process"""
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = hash_password('dummy-password-for-timing')
+    return _dummy_hash
+
+def needs_rehash(password_hash):
+    """True if the stored hash was made with a different method or cost"""
+    # Compared with a hash made now: werkzeug writes the method with its
+    # defaults filled in ('pbkdf2:sha256' becomes 'pbkdf2:sha256:<iterations>')
+    return password_hash.split('$', 1)[0] != _reference_hash().split('$', 1)[0]
+
+def dummy_verify(password):
+    """Spend the same time as a real verification, for accounts that don't exist"""
+    verify_password(_reference_hash(), password)
+    return False
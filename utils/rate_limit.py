@@ -0,0 +1,185 @@
+# Sistema de Registro de Avaliações - Clínica TEA
+# Criado por João Layon
+
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from threading import Lock
+
+def _refill(tokens, updated_at, capacity, rate, now):
+    """Tokens available at `now` for a bucket last written at `updated_at`"""
+    return min(capacity, tokens + max(0.0, now - updated_at) * rate)
+
+class MemoryBackend:
+    """Per-process token buckets, bounded by max_keys (LRU eviction).
+
+    Each key holds one (tokens, updated_at, expires_at) tuple. A bucket that
+    has refilled completely carries no information, so it is dropped once
+    expires_at passes.
+    """
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = Lock()
+
+    def peek(self, key, capacity, rate, now):
+        with self._lock:
+            bucket = self._buckets.get(key)
+        if not bucket:
+            return capacity
+        return _refill(bucket[0], bucket[1], capacity, rate, now)
+
+    def consume(self, key, capacity, rate, cost, now):
+        """Take cost tokens if available (a negative cost gives them back); returns (taken, tokens)"""
+        with self._lock:
+            bucket = self._buckets.get(key)
+            tokens = _refill(bucket[0], bucket[1], capacity, rate, now) if bucket else capacity
+            if tokens < cost:
+                return False, tokens
+            tokens = min(capacity, tokens - cost)
+            self._buckets.pop(key, None)
+            self._buckets[key] = (tokens, now, now + (capacity - tokens) / rate)
+            self._evict(now)
+            return True, tokens
+
+    def reset(self, key):
+        with self._lock:
+            self._buckets.pop(key, None)
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def _evict(self, now):
+        # Least recently written buckets sit at the front: drop expired ones
+        # first, then enforce the size bound.
+        while self._buckets:
+            oldest_key = next(iter(self._buckets))
+            if self._buckets[oldest_key][2] > now and len(self._buckets) <= self.max_keys:
+                break
+            self._buckets.popitem(last=False)
+
+class SQLiteBackend:
+    """Token buckets in a local SQLite file shared by every worker process"""
+
+    PURGE_EVERY = 1000
+
+    def __init__(self, path):
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5,
+                                     isolation_level=None)
+        self._lock = Lock()
+        self._writes = 0
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS rate_limits (
+                chave TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                atualizado_em REAL NOT NULL,
+                expira_em REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_rate_limits_expira ON rate_limits (expira_em);
+        """)
+
+    def peek(self, key, capacity, rate, now):
+        with self._lock:
+            row = self._conn.execute("""
+                SELECT tokens, atualizado_em FROM rate_limits WHERE chave = ?
+            """, (key,)).fetchone()
+        if not row:
+            return capacity
+        return _refill(row[0], row[1], capacity, rate, now)
+
+    def consume(self, key, capacity, rate, cost, now):
+        """Same as MemoryBackend.consume, in one BEGIN IMMEDIATE transaction"""
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = self._conn.execute("""
+                    SELECT tokens, atualizado_em FROM rate_limits WHERE chave = ?
+                """, (key,)).fetchone()
+                tokens = _refill(row[0], row[1], capacity, rate, now) if row else capacity
+                if tokens < cost:
+                    self._conn.execute('COMMIT')
+                    return False, tokens
+                tokens = min(capacity, tokens - cost)
+                self._conn.execute("""
+                    INSERT OR REPLACE INTO rate_limits (chave, tokens, atualizado_em, expira_em)
+                    VALUES (?, ?, ?, ?)
+                """, (key, tokens, now, now + (capacity - tokens) / rate))
+
+                self._writes += 1
+                if self._writes % self.PURGE_EVERY == 0:
+                    self._conn.execute("DELETE FROM rate_limits WHERE expira_em < ?", (now,))
+
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+            return True, tokens
+
+    def reset(self, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM rate_limits WHERE chave = ?", (key,))
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM rate_limits").fetchone()[0]
+
+def create_backend(url):
+    """Build a backend from a storage URL: memory:// or sqlite:///path"""
+    if url.startswith('memory://'):
+        return MemoryBackend()
+    if url.startswith('sqlite:///'):
+        return SQLiteBackend(url[10:])
+    raise ValueError(f"Backend de rate limiting não suportado: {url}")
+
+class RateLimiter:
+    """Token bucket: `attempts` tokens per `period` seconds, refilled continuously"""
+
+    def __init__(self, backend, attempts, period, prefix='', clock=time.time):
+        self.backend = backend
+        self.capacity = float(attempts)
+        self.rate = attempts / float(period)
+        self.prefix = prefix
+        self.clock = clock
+
+    def acquire(self, key):
+        """Take one attempt for key; False (and nothing taken) when none is left.
+
+        Checking and taking are one step in the backend, so concurrent
+        requests (in any worker) can never spend more than the budget.
+        """
+        granted, _ = self.backend.consume(self.prefix + key, self.capacity, self.rate, 1, self.clock())
+        return granted
+
+    def refund(self, key):
+        """Give back an attempt taken by acquire() that turned out not to count"""
+        self.backend.consume(self.prefix + key, self.capacity, self.rate, -1, self.clock())
+
+    def retry_after(self, key):
+        """Seconds until the next attempt is available"""
+        tokens = self.backend.peek(self.prefix + key, self.capacity, self.rate, self.clock())
+        return max(0.0, (1 - tokens) / self.rate)
+
+    def reset(self, key):
+        self.backend.reset(self.prefix + key)
+
+_login_limiters = None
+_login_limiters_lock = Lock()
+
+def get_login_limiters():
+    """Per-IP and per-account login limiters sharing the configured backend"""
+    global _login_limiters
+    if _login_limiters is None:
+        with _login_limiters_lock:
+            if _login_limiters is None:
+                from config import Config
+                backend = create_backend(Config.RATELIMIT_STORAGE_URL)
+                _login_limiters = (
+                    RateLimiter(backend, *Config.RATELIMIT_LOGIN_IP, prefix='login:ip:'),
+                    RateLimiter(backend, *Config.RATELIMIT_LOGIN_ACCOUNT, prefix='login:conta:')
+                )
+    return _login_limiters
@@ -0,0 +1,28 @@
+# Sistema de Registro de Avaliações - Clínica TEA
+# Criado por João Layon
+
+from flask import session
+from models.database import get_db_connection, get_replica
+from models.replica import covers, merge
+
+# The primary position a session's last write reached, so the request after
+# a POST/redirect (possibly in another thread or worker) reads a copy that
+# already has it.
+SESSION_KEY = 'replica_posicao'
+
+def init_replica(app):
+    """Carry read-your-writes positions in the session and start the background sync"""
+    get_replica().start()
+
+    @app.before_request
+    def require_session_position():
+        conn = get_db_connection()
+        conn.required = tuple(session.get(SESSION_KEY, (0, 0)))
+
+    @app.after_request
+    def remember_session_position(response):
+        conn = get_db_connection()
+        stored = tuple(session.get(SESSION_KEY, (0, 0)))
+        if not covers(stored, conn.required):
+            session[SESSION_KEY] = list(merge(stored, conn.required))
+        return response